@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Compare flash programming throughput with and without the read-ahead in
+RAMKernelProtocol.program_stream.
+
+The RAM kernel is simulated in-process, taking --program-ms to program
+each 128 kB block, and the image is read from a stream that takes
+--read-ms per 128 kB (standing in for a slow disk or network share).
+"sequential" reads a 128 kB chunk, programs it and waits for the result
+before reading the next, as the 'flash program' command used to;
+"program_stream" reads the next chunk, up to 2 MB, while the current one
+programs.
+
+  $ PYTHONPATH=. python benchmarks/bench_program_stream.py
+  $ PYTHONPATH=. python benchmarks/bench_program_stream.py -s 32 --read-ms 5 --program-ms 20
+"""
+import io
+import os
+import sys
+import time
+from optparse import OptionParser
+
+from pyatk.tests.mockboard import SimulatedBoard, BoardChannel
+from pyatk import ramkernel
+
+BLOCK_SIZE = 128 * 1024
+
+class SlowStream(object):
+    """ A file-like object taking ``delay`` seconds per ``BLOCK_SIZE`` read. """
+    def __init__(self, data, delay):
+        self.stream = io.BytesIO(data)
+        self.delay = delay
+
+    def read(self, size):
+        time.sleep(self.delay * size / BLOCK_SIZE)
+        return self.stream.read(size)
+
+class SlowBoardChannel(BoardChannel):
+    """ A simulated board taking ``delay`` seconds per programmed block. """
+    def __init__(self, board, delay):
+        super(SlowBoardChannel, self).__init__(board)
+        self.delay = delay
+
+    def write(self, data):
+        if len(data) > 16:
+            time.sleep(self.delay * len(data) / BLOCK_SIZE)
+        super(SlowBoardChannel, self).write(data)
+
+def kernel(program_delay):
+    rkl = ramkernel.RAMKernelProtocol(SlowBoardChannel(SimulatedBoard(), program_delay))
+    rkl._kernel_init = True
+    rkl._flash_init = True
+    return rkl
+
+def sequential(rkl, stream):
+    address = 0
+    chunk = stream.read(BLOCK_SIZE)
+    while chunk:
+        rkl.flash_program(address, chunk, read_back_verify = True)
+        address += len(chunk)
+        chunk = stream.read(BLOCK_SIZE)
+
+def main():
+    parser = OptionParser(usage = "%prog [options]")
+    parser.add_option("--size", "-s", dest = "size", type = "int", default = 16,
+                      help = "Image size in MB (default 16).")
+    parser.add_option("--read-ms", dest = "read_ms", type = "float", default = 10,
+                      help = "Milliseconds to read each 128 kB of the image (default 10).")
+    parser.add_option("--program-ms", dest = "program_ms", type = "float", default = 10,
+                      help = "Milliseconds to program each 128 kB block (default 10).")
+    options, _ = parser.parse_args()
+
+    image = os.urandom(options.size * 1024 * 1024)
+    read_delay = options.read_ms / 1000.0
+    program_delay = options.program_ms / 1000.0
+
+    sys.stdout.write("%-16s %10s %10s\n" % ("method", "seconds", "MB/s"))
+    for name in ("sequential", "program_stream"):
+        rkl = kernel(program_delay)
+        stream = SlowStream(image, read_delay)
+        start = time.perf_counter()
+        if "sequential" == name:
+            sequential(rkl, stream)
+        else:
+            rkl.program_stream(0, stream, block_size = BLOCK_SIZE, read_back_verify = True)
+        elapsed = time.perf_counter() - start
+        sys.stdout.write("%-16s %10.2f %10.2f\n" % (name, elapsed, options.size / elapsed))
+
+if __name__ == "__main__":
+    main()
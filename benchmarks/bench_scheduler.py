@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Measure host CPU time per board when SessionScheduler drives many serial
+boards from one event loop, using pseudo-terminal pairs as stand-ins for
+the boards (POSIX only; no hardware required).
+
+Each board loads a RAM kernel with write_file, then programs flash with
+read-back verify.  The simulated boards run in a separate process, so the
+CPU time reported is the scheduler's alone.  CPU per board should stay
+roughly flat as boards are added.  A pty does not pace data at the baud
+rate, so wall times are far shorter than on real hardware.
+
+  $ PYTHONPATH=. python benchmarks/bench_scheduler.py
+  $ PYTHONPATH=. python benchmarks/bench_scheduler.py -n 1,4,16,32 -s 1024
+"""
+import io
+import os
+import sys
+import time
+import collections
+import multiprocessing
+from optparse import OptionParser
+
+from pyatk.channel.uart import UARTChannel
+from pyatk.scheduler import SessionScheduler
+from pyatk.tests.mockboard import SimulatedBoard, serve
+
+FakeBSP = collections.namedtuple("FakeBSP", ("base_memory_address", "ram_kernel_origin"))
+BSP = FakeBSP(0x80000000, 0x80004000)
+
+def simulator(masters, slaves):
+    for fd in slaves:
+        os.close(fd)
+    serve(dict((fd, SimulatedBoard(report_size = 2048)) for fd in masters))
+
+def run(boards, kernel_image, flash_image):
+    ptys = [os.openpty() for _ in range(boards)]
+    masters = [master for master, _ in ptys]
+    slaves = [slave for _, slave in ptys]
+
+    process = multiprocessing.get_context("fork").Process(target = simulator,
+                                                          args = (masters, slaves))
+    process.start()
+    for fd in masters:
+        os.close(fd)
+
+    async def job(session):
+        await session.kernel.run_image(io.BytesIO(kernel_image), len(kernel_image), BSP)
+        await session.kernel.flash_initial()
+        # Program in 128 kB blocks, as mx-toolkit does.
+        for offset in range(0, len(flash_image), 0x20000):
+            await session.kernel.flash_program(offset, flash_image[offset:offset + 0x20000],
+                                               read_back_verify = True)
+
+    scheduler = SessionScheduler(timeout = 120)
+    for index, slave in enumerate(slaves):
+        scheduler.add(index, UARTChannel(os.ttyname(slave)), job)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    results = scheduler.run()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    for fd in slaves:
+        os.close(fd)
+    process.join()
+
+    failures = [result for result in results if not result.ok]
+    if failures:
+        raise RuntimeError("board %r failed: %s" % (failures[0].target, failures[0].error))
+
+    return cpu, wall
+
+def main():
+    parser = OptionParser(usage = "%prog [options]")
+    parser.add_option("--boards", "-n", dest = "boards", default = "1,2,4,8,16",
+                      help = "Comma-separated board counts to try.")
+    parser.add_option("--size", "-s", dest = "size", type = "int", default = 512,
+                      help = "Flash image size in kB (default 512).")
+    options, _ = parser.parse_args()
+
+    kernel_image = b"\xa5" * (64 * 1024)
+    flash_image = b"\x5a" * (options.size * 1024)
+
+    sys.stdout.write("%8s %12s %12s %16s\n" % ("boards", "wall s", "CPU s", "CPU ms/board"))
+    for boards in [int(n) for n in options.boards.split(",")]:
+        cpu, wall = run(boards, kernel_image, flash_image)
+        sys.stdout.write("%8u %12.3f %12.3f %16.2f\n" % (boards, wall, cpu, cpu * 1000 / boards))
+
+if __name__ == "__main__":
+    main()
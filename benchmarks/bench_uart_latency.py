@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Measure round-trip latency of SerialBootProtocol.get_status() and the RAM
+kernel getver command under each UART setting: baud rate, low-latency mode
+and read-ahead.
+
+By default the board is simulated over a pseudo-terminal pair (POSIX only).
+A pty neither paces data at the baud rate nor supports low-latency mode,
+so that mode measures host-side overhead only.  For real figures, point the
+benchmark at a board's serial port (bootstrap mode for get_status; add
+--getver once a RAM kernel is running):
+
+  $ PYTHONPATH=. python benchmarks/bench_uart_latency.py
+  $ PYTHONPATH=. python benchmarks/bench_uart_latency.py -p /dev/ttyUSB0 -b 115200,921600
+"""
+import os
+import sys
+import time
+import struct
+import threading
+from optparse import OptionParser
+
+from pyatk.channel.uart import UARTChannel
+from pyatk import boot
+from pyatk import ramkernel
+
+GETVER_PAYLOAD = b"Simulated NAND flash"
+
+def simulated_board(fd):
+    """ Answer 16-byte commands: RKL packets get a getver response, SBP a status word. """
+    while True:
+        command = b""
+        while len(command) < 16:
+            try:
+                data = os.read(fd, 16 - len(command))
+            except OSError:
+                return
+            if not data:
+                return
+            command += data
+
+        if struct.unpack(">H", command[:2])[0] == ramkernel.HEADER_MAGIC:
+            response = struct.pack(">hHI", ramkernel.ACK_SUCCESS, 0x0025,
+                                   len(GETVER_PAYLOAD)) + GETVER_PAYLOAD
+        else:
+            response = struct.pack("<I", boot.HAB_PASSED)
+        os.write(fd, response)
+
+def measure(channel, getver, iterations):
+    sbp = boot.SerialBootProtocol(channel)
+    rkl = ramkernel.RAMKernelProtocol(channel)
+    rkl._kernel_init = True
+    rkl._flash_init = True
+
+    if getver:
+        operation = rkl.getver
+    else:
+        operation = sbp.get_status
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - start)
+
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+def main():
+    parser = OptionParser(usage = "%prog [options]")
+    parser.add_option("--port", "-p", dest = "port", metavar = "DEVICE",
+                      help = "Serial port of a real board (default: simulate over a pty).")
+    parser.add_option("--bauds", "-b", dest = "bauds", default = "115200,921600",
+                      help = "Comma-separated baud rates to try.")
+    parser.add_option("--getver", action = "store_true", default = False,
+                      help = "With --port, also measure RAM kernel getver.")
+    parser.add_option("--iterations", "-n", dest = "iterations", type = "int", default = 500)
+    options, _ = parser.parse_args()
+
+    simulated = options.port is None
+    operations = ["get_status"]
+    if simulated or options.getver:
+        operations.append("getver")
+
+    sys.stdout.write("%-10s %8s %11s %11s %12s %12s\n" %
+                     ("command", "baud", "low-latency", "read-ahead", "median ms", "p99 ms"))
+    for operation in operations:
+        for baud in [int(b) for b in options.bauds.split(",")]:
+            for low_latency in (False, True):
+                for read_ahead in (False, True):
+                    if simulated:
+                        master, slave = os.openpty()
+                        port = os.ttyname(slave)
+                        board = threading.Thread(target = simulated_board, args = (master,))
+                        board.daemon = True
+                        board.start()
+                    else:
+                        port = options.port
+
+                    channel = UARTChannel(port, baudrate = baud, read_timeout = 2,
+                                          low_latency = low_latency, read_ahead = read_ahead)
+                    try:
+                        channel.open()
+                    except IOError:
+                        result = "%12s %12s" % ("unsupported", "")
+                    else:
+                        median, p99 = measure(channel, operation == "getver", options.iterations)
+                        result = "%12.3f %12.3f" % (median * 1000, p99 * 1000)
+                        channel.close()
+
+                    if simulated:
+                        os.close(slave)
+                        os.close(master)
+
+                    sys.stdout.write("%-10s %8u %11s %11s %s\n" %
+                                     (operation, baud, low_latency, read_ahead, result))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Benchmark UARTChannel with and without the read-ahead thread over a
+pseudo-terminal pair (POSIX only; no hardware required).
+
+A simulated device answers each 16-byte command with an 8-byte RAM kernel
+response header followed by a payload.  Two things are measured:
+
+* the round-trip latency of small command/response exchanges, and
+* the throughput of a large response read in page-sized pieces while the
+  host does a little work between reads (as flash_dump does when it
+  checksums each page).
+
+A pty does not pace data at the configured baud rate, so these figures
+measure host-side overhead only.
+
+  $ PYTHONPATH=. python benchmarks/bench_uart_readahead.py
+"""
+import os
+import sys
+import time
+import struct
+import threading
+
+from pyatk.channel.uart import UARTChannel
+from pyatk import ramkernel
+
+def device(fd, payload):
+    """ Reply to every 16-byte command with a header and ``payload``. """
+    response = struct.pack(">hHI", 0, 0, len(payload)) + payload
+    while True:
+        command = b""
+        while len(command) < 16:
+            try:
+                data = os.read(fd, 16 - len(command))
+            except OSError:
+                return
+            if not data:
+                return
+            command += data
+
+        view = memoryview(response)
+        while len(view) > 0:
+            view = view[os.write(fd, view):]
+
+def run(read_ahead, payload_size, iterations, page_size):
+    master, slave = os.openpty()
+    channel = UARTChannel(os.ttyname(slave), read_ahead = read_ahead)
+    channel.open()
+
+    thread = threading.Thread(target = device, args = (master, b"\xa5" * payload_size))
+    thread.daemon = True
+    thread.start()
+
+    command = b"\x00" * 16
+    start = time.perf_counter()
+    for _ in range(iterations):
+        channel.write(command)
+        channel.read(8)
+        remaining = payload_size
+        while remaining > 0:
+            page = channel.read(min(page_size, remaining))
+            ramkernel.calculate_checksum(page)
+            remaining -= len(page)
+    elapsed = time.perf_counter() - start
+
+    channel.close()
+    os.close(slave)
+    os.close(master)
+    return elapsed
+
+def main():
+    sys.stdout.write("%-12s %10s %14s %14s\n" % ("read-ahead", "payload", "ms per cmd", "MB/s"))
+    for payload_size, iterations in ((0, 2000), (2048, 500), (256 * 1024, 8)):
+        for read_ahead in (False, True):
+            elapsed = run(read_ahead, payload_size, iterations, 2048)
+            per_cmd = elapsed * 1000.0 / iterations
+            rate = payload_size * iterations / elapsed / (1024 * 1024)
+            sys.stdout.write("%-12s %10u %14.3f %14.2f\n" %
+                             (read_ahead, payload_size, per_cmd, rate))
+
+if __name__ == "__main__":
+    main()
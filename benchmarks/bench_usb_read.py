@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Benchmark host-side cost of USBChannel.read() per megabyte received.
+
+Compares the original "bytes += packet" buffering scheme against the
+ring buffer implementation, with :class:`MockChannel` (which does no
+packet handling at all) as a reference.  The IN endpoint is simulated,
+so no hardware is required.
+
+  $ python benchmarks/bench_usb_read.py
+"""
+import sys
+import time
+
+import usb
+
+from pyatk.channel import usbdev
+from pyatk.tests.mockchannel import MockChannel
+
+PACKET_SIZE = 64
+
+class SimulatedEndpoint(object):
+    """
+    Serve ``stream`` through a full-speed bulk IN endpoint.  Each read
+    returns as much of the stream as the transfer asked for.
+    """
+    def __init__(self, stream):
+        self.wMaxPacketSize = PACKET_SIZE
+        self.stream = memoryview(stream)
+        self.offset = 0
+
+    def read(self, size_or_buffer, timeout = None):
+        if isinstance(size_or_buffer, int):
+            size = size_or_buffer
+        else:
+            size = len(size_or_buffer)
+        size = min(size, len(self.stream) - self.offset)
+        if size <= 0:
+            raise usb.USBError("Operation timed out")
+
+        packet = self.stream[self.offset:self.offset + size]
+        self.offset += size
+        if isinstance(size_or_buffer, int):
+            return packet.tobytes()
+
+        memoryview(size_or_buffer)[:size] = packet
+        return size
+
+class LegacyUSBRead(object):
+    """ The pre-ring-buffer USBChannel.read() algorithm. """
+    def __init__(self, endpoint):
+        self.endpoint_in = endpoint
+        self.internal_read_buffer = b""
+
+    def read(self, length):
+        while len(self.internal_read_buffer) < length:
+            self.internal_read_buffer += self.endpoint_in.read(64)
+
+        return_data = self.internal_read_buffer[:length]
+        self.internal_read_buffer = self.internal_read_buffer[length:]
+        return return_data
+
+def make_ring_channel(stream):
+    channel = usbdev.USBChannel(idProduct = 0)
+    channel.endpoint_in = SimulatedEndpoint(stream)
+    return channel
+
+def make_mock_channel(stream):
+    channel = MockChannel()
+    channel.queue_data(bytes(stream))
+    return channel
+
+def run(factory, stream, request_size):
+    reader = factory(stream)
+    remaining = len(stream)
+    start = time.perf_counter()
+    while remaining > 0:
+        reader.read(min(request_size, remaining))
+        remaining -= request_size
+    return time.perf_counter() - start
+
+def main():
+    implementations = (
+        ("legacy", lambda s: LegacyUSBRead(SimulatedEndpoint(s))),
+        ("ring", make_ring_channel),
+        ("mock", make_mock_channel),
+    )
+
+    sys.stdout.write("%-8s %10s %10s %12s\n" % ("impl", "total", "request", "ms per MB"))
+    for total_kb in (256, 1024, 4096):
+        stream = bytes(bytearray(i & 0xff for i in range(total_kb * 1024)))
+        # Whole-region reads (read_memory) and header/page reads (flash_dump).
+        for request_size in (len(stream), 2048):
+            for name, factory in implementations:
+                # The legacy scheme is quadratic; don't wait minutes for it.
+                if name == "legacy" and request_size == len(stream) and total_kb > 1024:
+                    sys.stdout.write("%-8s %9uK %10u %12s\n" % (name, total_kb, request_size, "(skipped)"))
+                    continue
+
+                elapsed = run(factory, stream, request_size)
+                per_mb = elapsed * 1000.0 / (total_kb / 1024.0)
+                sys.stdout.write("%-8s %9uK %10u %12.2f\n" % (name, total_kb, request_size, per_mb))
+
+if __name__ == "__main__":
+    main()
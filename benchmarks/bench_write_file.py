@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Measure SerialBootProtocol.write_file upload throughput, and the number of
+progress callbacks made, for a RAM kernel sized image and a large
+application image under several chunk sizes.
+
+The board is simulated in-process (no hardware required), so the figures
+are the host-side cost of an upload: reading the image, the channel write
+calls and the progress callbacks.  "1 kB, every chunk" is the behaviour
+before write_file chunk sizes adapted to the channel.
+
+  $ PYTHONPATH=. python benchmarks/bench_write_file.py
+  $ PYTHONPATH=. python benchmarks/bench_write_file.py -s 64 -n 5
+"""
+import io
+import os
+import sys
+import time
+from optparse import OptionParser
+
+from pyatk.channel.usbdev import DEFAULT_MAX_TRANSFER_SIZE
+from pyatk.channel.base import CHANNEL_TYPE_UART
+from pyatk.tests.mockboard import SimulatedBoard, BoardChannel
+from pyatk import boot
+
+KERNEL_SIZE = 128 * 1024
+
+# (name, chunk_size, progress_interval)
+SETTINGS = (
+    ("1 kB, every chunk", 1024, 0),
+    ("UART default", boot.WRITE_FILE_CHUNK_SIZES[CHANNEL_TYPE_UART],
+     boot.DEFAULT_PROGRESS_INTERVAL),
+    ("USB default", DEFAULT_MAX_TRANSFER_SIZE, boot.DEFAULT_PROGRESS_INTERVAL),
+)
+
+def upload(image, chunk_size, progress_interval):
+    """ Upload ``image`` once; return ``(seconds, callbacks)``. """
+    sbp = boot.SerialBootProtocol(BoardChannel(SimulatedBoard()))
+    callbacks = [0]
+
+    def progress(current, total):
+        callbacks[0] += 1
+
+    start = time.perf_counter()
+    sbp.write_file(boot.FILE_TYPE_APPLICATION, 0x80000000, len(image), io.BytesIO(image),
+                   progress_callback = progress,
+                   chunk_size = chunk_size,
+                   progress_interval = progress_interval)
+    return time.perf_counter() - start, callbacks[0]
+
+def main():
+    parser = OptionParser(usage = "%prog [options]")
+    parser.add_option("--size", "-s", dest = "size", type = "int", default = 16,
+                      help = "Application image size in MB (default 16).")
+    parser.add_option("--iterations", "-n", dest = "iterations", type = "int", default = 3,
+                      help = "Uploads per setting; the fastest is reported.")
+    options, _ = parser.parse_args()
+
+    images = (
+        ("RAM kernel", os.urandom(KERNEL_SIZE)),
+        ("application", os.urandom(options.size * 1024 * 1024)),
+    )
+
+    sys.stdout.write("%-12s %10s %-20s %10s %10s\n" %
+                     ("image", "kB", "setting", "MB/s", "callbacks"))
+    for image_name, image in images:
+        for setting_name, chunk_size, progress_interval in SETTINGS:
+            best, callbacks = min(upload(image, chunk_size, progress_interval)
+                                  for _ in range(options.iterations))
+            sys.stdout.write("%-12s %10u %-20s %10.1f %10u\n" % (
+                image_name, len(image) // 1024, setting_name,
+                len(image) / (1024.0 * 1024.0) / best, callbacks))
+
+if __name__ == "__main__":
+    main()
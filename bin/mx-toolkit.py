@@ -28,14 +28,22 @@ Portable Python command-line tool for bootstrapping i.MX processors.
 import os
 import sys
 import time
+import functools
 import traceback
 from optparse import OptionParser, OptionGroup
 
 from pyatk.channel.uart import UARTChannel
-from pyatk.channel.usbdev import USBChannel
+from pyatk.channel.usbdev import USBChannel, DEFAULT_MAX_TRANSFER_SIZE
+from pyatk.channel.usbdev import VID_FREESCALE, discover_devices, format_port_path
+from pyatk.channel import hotplug
 from pyatk import boot
 from pyatk import ramkernel
 from pyatk import bspinfo
+from pyatk import bootplan
+from pyatk import flashmanifest
+from pyatk import inittable
+from pyatk import memtest
+from pyatk import multiboard
 from pyatk import __version__ as pyatk_version
 
 MX_FLASHTOOL_VERSION = "0.0.4"
@@ -83,6 +91,14 @@ class ToolkitApplication(object):
         self.bsp_info = None
         self.channel = None
         self.sbp = None
+        self.hotplug = None
+        self._usb = False
+        # The error that aborted the last flash command, if any.
+        self.flash_error = None
+        # (imx_type, flash_model, capacity) reported by the RAM kernel.
+        self.flash_info = None
+        # Board name from the processor's unique ID fuses, if known.
+        self.board_uid = None
 
     def bsp_initialize(self, options, require_bsp = True):
         bsp_table = get_bsp_table(options)
@@ -100,15 +116,31 @@ class ToolkitApplication(object):
 
         return bsp_table
 
-    def channel_init(self, options):
-        if options.serialport and options.usb_vid_pid:
-            raise ToolkitError("Cannot select both a serial port and a USB device!")
+    def uart_settings(self, options):
+        """ Return UARTChannel keyword arguments from the BSP and command line. """
+        bsp_info = self.bsp_info
+
+        def choose(option, bsp_value):
+            if option is None:
+                return bsp_value
+            return option
+
+        return {
+            "baudrate": choose(options.uart_baudrate, bsp_info.uart_baudrate),
+            "read_timeout": choose(options.uart_read_timeout, bsp_info.uart_read_timeout),
+            "inter_byte_timeout": choose(options.uart_inter_byte_timeout,
+                                         bsp_info.uart_inter_byte_timeout),
+            "low_latency": options.uart_low_latency or bsp_info.uart_low_latency,
+            "read_ahead": options.uart_read_ahead,
+        }
 
+    def usb_ids(self, options):
+        """ Return the USB ``(vid, pid)`` to look for; ``pid`` may be ``None``. """
         # VID/PID specified explicitly
         if options.usb_vid_pid:
             try:
                 if ":" in options.usb_vid_pid:
-                    vid_str, pid_str = options.usb_vid_pid.partition(":")
+                    vid_str, _, pid_str = options.usb_vid_pid.partition(":")
                     vid = int(vid_str, 0)
                     pid = int(pid_str, 0)
                 else:
@@ -118,17 +150,35 @@ class ToolkitApplication(object):
             except ValueError:
                 raise ToolkitError("Could not convert USB VID/PID %r to integer." % options.usb_vid_pid)
 
+            return vid, pid
+
         # VID/PID inferred from BSP configuration
-        else:
-            vid = self.bsp_info.usb_vid
-            pid = self.bsp_info.usb_pid
+        return self.bsp_info.usb_vid, self.bsp_info.usb_pid
+
+    def channel_init(self, options):
+        if options.serialport and (options.usb_vid_pid or options.usb_path):
+            raise ToolkitError("Cannot select both a serial port and a USB device!")
+
+        vid, pid = self.usb_ids(options)
 
         if options.serialport:
-            self.channel = UARTChannel(options.serialport)
+            self.channel = UARTChannel(options.serialport,
+                                       **self.uart_settings(options))
         else:
-            self.channel = USBChannel(idVendor = vid, idProduct = pid)
+            try:
+                self.channel = USBChannel(idVendor = vid, idProduct = pid,
+                                          max_transfer_size = options.usb_transfer_size,
+                                          async_transfers = options.usb_async_transfers,
+                                          port_path = options.usb_path)
+            except ValueError as err:
+                raise ToolkitError(str(err))
             self._usb = True
 
+            # Watch for the board re-enumerating from now on, so that
+            # channel_reinit() can reconnect the moment it reappears.
+            self.hotplug_stop()
+            self.hotplug = hotplug.create_monitor(vid, pid)
+
         self.sbp = boot.SerialBootProtocol(self.channel)
 
         writeln(" [*] Opening bootstrap communications channel...")
@@ -150,39 +200,39 @@ class ToolkitApplication(object):
             writeln("     is missing or invalid for your target.")
             raise
 
-    def channel_reinit(self):
-        """ Close and re-open the ATK channel. """
+    def hotplug_stop(self):
+        """ Stop watching for the board re-enumerating, if we were. """
+        if self.hotplug is not None:
+            self.hotplug.stop()
+            self.hotplug = None
+
+    def channel_reinit(self, reenumerated = False):
+        """
+        Close and re-open the ATK channel.  ``reenumerated`` is ``True``
+        if the board has been reset and is expected to come back at a new
+        USB address.
+        """
         # This only applies to USB.  When the USB interface
         # is reset (either via loading an application
         # or resetting the CPU back into SBP mode), the interface
         # takes some time to reset and be recognized by the host
         # OS.
-        # 
-        # This takes longer when USB passthrough is used
-        # for virtual machines, thus we attempt to re-connect
-        # multiple times with a short timeout.
         #
-        # It would be nice if we could wait for OS hotplug events,
-        # but that's not possible with libusb (maybe libusbx?)
-        # and it's not really worth the effort IMHO.
+        # This takes longer when USB passthrough is used
+        # for virtual machines, so the channel waits for the
+        # device to reappear: it is woken by OS hotplug events
+        # where available, and otherwise polls the bus.
         if self._usb:
             writeln(" [*] Re-initialize USB channel.")
-            self.channel.close()
-            
-            attempts = 0
-            while attempts < 3:
-                time.sleep(3)
-                try:
-                    self.channel.open()
-                    break
-
-                except IOError as err:
-                    #writeln("Attempt {0} to re-open channel failed: {1}".format(attempts, err))
-                    attempts += 1
-            
-            if attempts == 3:
+            try:
+                elapsed = self.channel.reopen(timeout = self.bsp_info.reopen_timeout,
+                                              reenumerated = reenumerated,
+                                              monitor = self.hotplug)
+            except IOError:
                 raise IOError("unable to re-open USB channel! Is the device connected?")
 
+            writeln(" [*] USB channel re-opened after %.2f s." % (elapsed,))
+
     def get_base_parser(self, command_specific_help = ""):
         parser = OptionParser(
             "i.MX Flash Toolkit version " + MX_FLASHTOOL_VERSION +
@@ -208,9 +258,40 @@ class ToolkitApplication(object):
         comgroup.add_option("--serialport", "-s", action = "store",
                             dest = "serialport", metavar = "DEVICE",
                             help = "Use serial port DEVICE instead of USB.")
+        comgroup.add_option("--uart-baud", action = "store",
+                            dest = "uart_baudrate", type = "int", metavar = "BAUD",
+                            help = "Serial port baud rate (overrides BSP; default 115200).")
+        comgroup.add_option("--uart-timeout", action = "store",
+                            dest = "uart_read_timeout", type = "float", metavar = "SECONDS",
+                            help = "Serial port read timeout (overrides BSP; default 5).")
+        comgroup.add_option("--uart-inter-byte-timeout", action = "store",
+                            dest = "uart_inter_byte_timeout", type = "float", metavar = "SECONDS",
+                            help = "Give up on a response after SECONDS without a byte.")
+        comgroup.add_option("--uart-low-latency", action = "store_true",
+                            dest = "uart_low_latency", default = False,
+                            help = "Enable the serial driver's low-latency mode (Linux only).")
+        comgroup.add_option("--uart-read-ahead", action = "store_true",
+                            dest = "uart_read_ahead", default = False,
+                            help = ("Continuously read the serial port into a buffer "
+                                    "on a background thread."))
         comgroup.add_option("--usb", "-u", action = "store",
                             dest = "usb_vid_pid", metavar = "VID[:PID]",
                             help = "Override USB vendor ID/product ID in BSP data.")
+        comgroup.add_option("--usb-path", action = "store",
+                            dest = "usb_path", metavar = "BUS-PORT[.PORT...]",
+                            help = ("Use the USB device on this physical port (see the "
+                                    "'listdev' command).  Needed when several boards "
+                                    "with the same VID/PID are connected."))
+        comgroup.add_option("--usb-transfer-size", action = "store",
+                            dest = "usb_transfer_size", type = "int", metavar = "BYTES",
+                            default = DEFAULT_MAX_TRANSFER_SIZE,
+                            help = ("Maximum size of a single USB bulk transfer "
+                                    "(default %u)." % DEFAULT_MAX_TRANSFER_SIZE))
+        comgroup.add_option("--usb-async", action = "store",
+                            dest = "usb_async_transfers", type = "int", metavar = "N",
+                            default = 0,
+                            help = ("Keep N USB transfers in flight in each direction "
+                                    "(requires python-libusb1; default is synchronous I/O)."))
 
         parser.add_option_group(comgroup)
 
@@ -227,19 +308,36 @@ class ToolkitApplication(object):
             bsp_data = bsp_table[bsp_name]
             writeln(" [*] %-10s -- %s" % (bsp_name, bsp_data.description))
 
-    def run_flash(self, args):
-        #
-        # "Manually specify USB VID/PID (PID is optional):\n"
-        # "  %prog -b PLAT_BSP -uVID[:PID] ...\n"
-        # "Or serial port (COMx on Windows, /dev/ttyusbX on Linux, etc.):\n"
-        # "  %prog -b PLAT_BSP -s COM1 ...",
-
+    def run_list_devices(self, args):
         parser = self.get_base_parser(
-            "Flashing a program via a RAM kernel to the start of flash (0x0):\n"
-            "  %prog flash program -b PLAT_BSP BOARD.ROM 0x0\n\n"
-            "Dumping 2 kB of flash memory starting at address 0x00000000:\n"
-            "  %prog flash dump -b PLAT_BSP 2048 0x0"
+            "List connected boards in serial boot mode and their USB port paths:\n"
+            "  %prog listdev -b PLAT_BSP"
         )
+        options, args = parser.parse_args(args)
+        self.bsp_initialize(options, require_bsp = False)
+
+        if options.usb_vid_pid or self.bsp_info is not None:
+            vid, pid = self.usb_ids(options)
+        else:
+            vid, pid = VID_FREESCALE, None
+
+        try:
+            devices = discover_devices(vid, pid)
+        except IOError as err:
+            raise ToolkitError(str(err))
+
+        writeln("Listing USB devices (VID 0x%04x):" % (vid,))
+        writeln("---------------------------------")
+        for device in devices:
+            writeln(" [*] --usb-path %-12s  %04x:%04x  (bus %03u, address %03u)" % (
+                device.port_path or "(unknown)", device.vid, device.pid,
+                device.bus, device.address))
+
+        if not devices:
+            writeln(" [!] No matching devices found.")
+
+    def get_flash_parser(self, command_specific_help = ""):
+        parser = self.get_base_parser(command_specific_help)
 
         rkgroup = OptionGroup(parser, "Flash Command Options")
         rkgroup.add_option("--ram-kernel", "-k", action = "store",
@@ -262,43 +360,379 @@ class ToolkitApplication(object):
                            dest = "set_bbt_flag", default = False,
                            help = ("Set this flag to enable bad block table (BBT) "
                                    "handling in the RAM kernel."))
+        rkgroup.add_option("--sparse", action = "store_true",
+                           dest = "sparse_program", default = False,
+                           help = ("For 'flash program', erase blocks that are all 0xFF "
+                                   "in the file instead of sending and programming them."))
+        rkgroup.add_option("--erase", action = "append",
+                           dest = "erase_ranges", metavar = "BYTES@ADDRESS", default = [],
+                           help = ("For 'flash program', also erase BYTES at ADDRESS first. "
+                                   "May be given more than once; blocks that are about to "
+                                   "be programmed are not erased twice."))
+        rkgroup.add_option("--host-merge", action = "store_true",
+                           dest = "host_merge", default = False,
+                           help = ("For 'flash program' at an address inside a block, read "
+                                   "the block back and merge on the host even if the RAM "
+                                   "kernel supports unaligned programming."))
+        rkgroup.add_option("--differential", action = "store_true",
+                           dest = "differential_program", default = False,
+                           help = ("For 'flash program', only program blocks that changed "
+                                   "since the last differential program of this board."))
+        rkgroup.add_option("--spot-check", action = "store", type = "int",
+                           dest = "spot_check_blocks", metavar = "COUNT", default = 2,
+                           help = ("With --differential, read back COUNT recorded blocks "
+                                   "to confirm the flash still matches (default 2)."))
+        rkgroup.add_option("--board-id", action = "store",
+                           dest = "board_id", metavar = "NAME",
+                           help = ("Name of the board for --differential (default is its "
+                                   "unique ID fuses if the BSP sets uid_fuse_address, else "
+                                   "its USB port path or serial port)."))
 
         parser.add_option_group(rkgroup)
 
+        return parser
+
+    def get_flash_many_parser(self):
+        parser = self.get_flash_parser(
+            "Programming BOARD.ROM to every connected board at once:\n"
+            "  %prog flash-many program -b PLAT_BSP BOARD.ROM 0x0\n\n"
+            "Each board is flashed by its own process; its output goes to\n"
+            "LOGDIR/board-PORTPATH.log and 'flash dump' writes one dump file per board."
+        )
+
+        group = OptionGroup(parser, "Multiple Board Options")
+        group.add_option("--log-dir", action = "store",
+                         dest = "log_dir", metavar = "LOGDIR",
+                         default = "flash-many-logs",
+                         help = "Directory for per-board logs (default 'flash-many-logs').")
+        group.add_option("--board-timeout", action = "store",
+                         dest = "board_timeout", type = "float", metavar = "SECONDS",
+                         help = "Give up on a board that has not finished after SECONDS.")
+        group.add_option("--jobs", "-j", action = "store",
+                         dest = "jobs", type = "int", metavar = "N",
+                         help = "Flash at most N boards at a time (default: all).")
+        parser.add_option_group(group)
+
+        return parser
+
+    def run_flash(self, args):
+        #
+        # "Manually specify USB VID/PID (PID is optional):\n"
+        # "  %prog -b PLAT_BSP -uVID[:PID] ...\n"
+        # "Or serial port (COMx on Windows, /dev/ttyusbX on Linux, etc.):\n"
+        # "  %prog -b PLAT_BSP -s COM1 ...",
+
+        parser = self.get_flash_parser(
+            "Flashing a program via a RAM kernel to the start of flash (0x0):\n"
+            "  %prog flash program -b PLAT_BSP BOARD.ROM 0x0\n\n"
+            "Dumping 2 kB of flash memory starting at address 0x00000000:\n"
+            "  %prog flash dump -b PLAT_BSP 2048 0x0"
+        )
+
         options, args = parser.parse_args(args)
         self.bsp_initialize(options)
         self.channel_init(options)
         self.run_ram_kernel(options, args)
 
-    def run_run(self, args):
+    def run_flash_many(self, args):
+        parser = self.get_flash_many_parser()
+        options, flash_args = parser.parse_args(args)
+
+        if options.serialport or options.usb_path:
+            raise ToolkitError("'flash-many' finds its boards on USB; do not give "
+                               "--serialport or --usb-path.")
+
+        self.bsp_initialize(options)
+        job_size = flash_job_size(flash_args)
+        vid, pid = self.usb_ids(options)
+
+        try:
+            devices = discover_devices(vid, pid)
+        except IOError as err:
+            raise ToolkitError(str(err))
+
+        if not devices:
+            raise ToolkitError("No boards found with USB VID 0x%04x." % (vid,))
+
+        if any(device.port_path is None for device in devices):
+            raise ToolkitError("Cannot determine the USB port of every board; "
+                               "flash them one at a time with 'flash --usb-path'.")
+
+        port_paths = [device.port_path for device in devices]
+        writeln(" [*] Flashing %u boards: %s" % (len(port_paths), ", ".join(port_paths)))
+        writeln(" [*] Per-board logs in %s" % (options.log_dir,))
+
+        start = time.time()
+        results = multiboard.run_boards(port_paths, functools.partial(flash_board, args),
+                                        options.log_dir,
+                                        timeout = options.board_timeout,
+                                        max_workers = options.jobs)
+        wall_time = time.time() - start
+
+        writeln()
+        writeln(" %-14s %-6s %9s %12s  %s" % ("USB port", "result", "seconds", "kB/s", "details"))
+        for result in results:
+            if result.ok:
+                status = "OK"
+                details = ""
+            else:
+                status = "FAILED"
+                details = "%s (see %s)" % (result.error, result.log_path)
+
+            writeln(" %-14s %-6s %9.1f %12.1f  %s" % (
+                result.target, status, result.elapsed,
+                job_size / 1024.0 / max(result.elapsed, 1e-6), details))
+
+        succeeded = [result for result in results if result.ok]
+        slowest = max(result.elapsed for result in results)
+        writeln()
+        writeln(" [*] %u of %u boards succeeded in %.1f s (slowest board %.1f s)." % (
+            len(succeeded), len(results), wall_time, slowest))
+        writeln(" [*] Aggregate throughput: %.1f kB/s" % (
+            job_size * len(succeeded) / 1024.0 / max(wall_time, 1e-6),))
+
+        if len(succeeded) < len(results):
+            sys.exit(1)
+
+    def get_memtest_parser(self):
         parser = self.get_base_parser(
-            "Execute an application (u-boot.bin) compiled to start at 0x82000000:\n"
-            "  %prog run -b PLAT_BSP u-boot.bin 0x82000000"
+            "Testing the first 16 MB of SDRAM with every pattern:\n"
+            "  %prog memtest -b PLAT_BSP\n\n"
+            "Testing all of SDRAM with the random pattern only:\n"
+            "  %prog memtest -b PLAT_BSP --size all --pattern random"
         )
+
+        group = OptionGroup(parser, "Memory Test Options")
+        group.add_option("--start", action = "store",
+                         dest = "memtest_start", metavar = "ADDRESS",
+                         help = "First address to test (default: start of SDRAM).")
+        group.add_option("--size", action = "store",
+                         dest = "memtest_size", metavar = "BYTES",
+                         default = "0x1000000",
+                         help = ("Bytes to test, or 'all' for the rest of SDRAM "
+                                 "(default 16 MB)."))
+        group.add_option("--pattern", action = "store",
+                         dest = "memtest_patterns", metavar = "PATTERN[,PATTERN...]",
+                         default = ",".join(memtest.PATTERNS),
+                         help = ("Patterns to run, from %s (default: all)." %
+                                 ", ".join(memtest.PATTERNS)))
+        group.add_option("--seed", action = "store",
+                         dest = "memtest_seed", type = "int", default = 0,
+                         help = "Seed for the random pattern (default 0).")
+        group.add_option("--chunk-size", action = "store",
+                         dest = "memtest_chunk_size", type = "int", metavar = "BYTES",
+                         default = memtest.DEFAULT_CHUNK_SIZE,
+                         help = ("Bytes per upload and per read-back request "
+                                 "(default %u)." % memtest.DEFAULT_CHUNK_SIZE))
+        parser.add_option_group(group)
+
+        return parser
+
+    def memtest_region(self, options):
+        """ Return the ``(start, size)`` of SDRAM selected by ``options``. """
+        memory_start = self.bsp_info.base_memory_address
+        memory_end = self.bsp_info.memory_bottom_address + 1
+
+        try:
+            if options.memtest_start is None:
+                start = memory_start
+            else:
+                start = int(options.memtest_start, 0)
+
+            if "all" == options.memtest_size.lower():
+                size = memory_end - start
+            else:
+                size = int(options.memtest_size, 0)
+
+        except ValueError as err:
+            raise ToolkitError("Invalid memory test region: %s" % (err,))
+
+        if start < memory_start or size <= 0 or start + size > memory_end:
+            raise ToolkitError("Memory test region 0x%08X-0x%08X is outside SDRAM "
+                               "(0x%08X-0x%08X)." % (start, start + size - 1,
+                                                     memory_start, memory_end - 1))
+
+        if start % 4 or size % 4 or options.memtest_chunk_size % 4 or \
+           options.memtest_chunk_size <= 0:
+            raise ToolkitError("Memory test start, size and chunk size must be "
+                               "multiples of 4.")
+
+        return start, size
+
+    def run_memtest(self, args):
+        parser = self.get_memtest_parser()
+        options, args = parser.parse_args(args)
+        self.bsp_initialize(options)
+
+        patterns = [pattern.strip() for pattern in options.memtest_patterns.split(",")]
+        for pattern in patterns:
+            if pattern not in memtest.PATTERNS:
+                raise ToolkitError("Unknown memory test pattern %r!" % (pattern,))
+
+        start, size = self.memtest_region(options)
+        self.channel_init(options)
+
+        def progress_cb(phase, current, total):
+            bar_len = 35
+            bar_on = int(float(current) / total * bar_len)
+            bar_off = bar_len - bar_on
+            sys.stdout.write("     %-5s [%s%s] %u / %u kB\r" % (
+                phase, "="*bar_on, " "*bar_off, current // 1024, total // 1024))
+            sys.stdout.flush()
+
+        failed = False
+        for pattern in patterns:
+            writeln(" [*] Testing 0x%08X-0x%08X with pattern %r..." % (
+                start, start + size - 1, pattern))
+            result = memtest.run_pattern(self.sbp, pattern, start, size,
+                                         seed = options.memtest_seed,
+                                         chunk_size = options.memtest_chunk_size,
+                                         progress_callback = progress_cb)
+            writeln()
+
+            megabytes = size / (1024.0 * 1024.0)
+            writeln("    [>] Write: %.2f MB/s, read: %.2f MB/s" % (
+                megabytes / max(result.write_seconds, 1e-6),
+                megabytes / max(result.read_seconds, 1e-6)))
+
+            if not result.failure_count:
+                writeln("    [>] Pattern %r passed." % (pattern,))
+                continue
+
+            failed = True
+            writeln(" <!> Pattern %r: %u words failed." % (pattern, result.failure_count))
+            for failure in result.failures:
+                writeln(" <!>   0x%08X: expected 0x%08X, read 0x%08X (bits 0x%08X)" % (
+                    failure.address, failure.expected, failure.actual,
+                    failure.expected ^ failure.actual))
+            if result.failure_count > len(result.failures):
+                writeln(" <!>   ... and %u more." % (
+                    result.failure_count - len(result.failures),))
+
+        if failed:
+            sys.exit(1)
+
+    def run_memdump(self, args):
+        parser = self.get_base_parser(
+            "Dumping 1 MB of SDRAM starting at 0x80000000 to memdump.bin:\n"
+            "  %prog memdump -b PLAT_BSP 0x100000 0x80000000"
+        )
+
+        group = OptionGroup(parser, "Memory Dump Options")
+        group.add_option("--dump-file", "-f", action = "store",
+                         dest = "memdump_file", metavar = "FILE",
+                         default = "memdump.bin",
+                         help = "File to write the dump to (default 'memdump.bin').")
+        group.add_option("--width", action = "store",
+                         dest = "memdump_width", type = "choice", choices = ["8", "16", "32"],
+                         default = "32",
+                         help = "Access width in bits: 8, 16 or 32 (default 32).")
+        group.add_option("--byteorder", action = "store",
+                         dest = "memdump_byteorder", type = "choice",
+                         choices = ["little", "big"],
+                         help = ("Write values in this byte order (default: as they are "
+                                 "in memory)."))
+        parser.add_option_group(group)
+
         options, args = parser.parse_args(args)
 
-        application_file = args[0]
         try:
-            load_address = int(args[1], 0)
+            count = int(args[0], 0)
+            address = int(args[1], 0)
+
+        except IndexError:
+            raise ToolkitError("'memdump' needs a byte count and a start address!")
+
+        except ValueError as err:
+            raise ToolkitError("Invalid memory dump region: %s" % (err,))
+
+        datasize = int(options.memdump_width)
+        if count <= 0 or count % (datasize // 8) or address % (datasize // 8):
+            raise ToolkitError("Memory dump address and size must be positive multiples "
+                               "of the %u-bit access width." % (datasize,))
+
+        self.bsp_initialize(options)
+        self.channel_init(options)
 
-        except ValueError:
-            raise ToolkitError("Invalid flash address %r!" % (args[1],))
+        def progress_cb(current, total):
+            bar_len = 35
+            bar_on = int(float(current) / total * bar_len)
+            bar_off = bar_len - bar_on
+            sys.stdout.write("     [%s%s] %u / %u kB\r" % (
+                "="*bar_on, " "*bar_off, current // 1024, total // 1024))
+            sys.stdout.flush()
 
+        writeln(" [*] Dumping memory @ 0x%08X, count %u to %s..." % (
+            address, count, options.memdump_file))
+        start = time.time()
+        with open(options.memdump_file, "wb") as dump_fp:
+            try:
+                self.sbp.read_memory_into(address, count, dump_fp, datasize,
+                                          byteorder = options.memdump_byteorder,
+                                          progress_callback = progress_cb)
+            except ValueError as err:
+                raise ToolkitError(str(err))
+        elapsed = time.time() - start
+
+        writeln()
+        writeln(" [*] Read %u bytes in %.2f s (%.1f kB/s)." % (
+            count, elapsed, count / 1024.0 / max(elapsed, 1e-6)))
+
+    def run_run(self, args):
+        parser = self.get_base_parser(
+            "Execute an application (u-boot.bin) compiled to start at 0x82000000:\n"
+            "  %prog run -b PLAT_BSP u-boot.bin 0x82000000\n\n"
+            "Load an initramfs and device tree, then boot a kernel at 0x80008000:\n"
+            "  %prog run -b PLAT_BSP initrd.img@0x81000000 board.dtb@0x80f00000 "
+            "zImage@0x80008000\n\n"
+            "Images are loaded in order and only the last is executed."
+        )
+        options, args = parser.parse_args(args)
         self.bsp_initialize(options)
+
+        if 2 == len(args) and "@" not in args[0]:
+            try:
+                image_specs = [(args[0], int(args[1], 0))]
+            except ValueError:
+                raise ToolkitError("Invalid load address %r!" % (args[1],))
+        elif args:
+            try:
+                image_specs = [bootplan.parse_image_spec(spec) for spec in args]
+            except bootplan.BootPlanError as err:
+                raise ToolkitError(str(err))
+        else:
+            raise ToolkitError("'run' needs BINARY LOADADDR or FILE@ADDRESS arguments!")
+
+        # A single application may be loaded anywhere, e.g. internal RAM;
+        # several images are meant for SDRAM.
+        plan = bootplan.BootPlan(self.bsp_info, sdram_only = len(image_specs) > 1)
+        try:
+            for path, address in image_specs:
+                plan.add(path, address)
+        except bootplan.BootPlanError as err:
+            raise ToolkitError(str(err))
+
         self.channel_init(options)
-        self.run_application(application_file, load_address)
+        self.run_boot_plan(plan)
 
     def run(self, command, args):
         command_map = {
             "flash": self.run_flash,
+            "flash-many": self.run_flash_many,
             "listbsp": self.run_list_bsp,
+            "listdev": self.run_list_devices,
+            "memdump": self.run_memdump,
+            "memtest": self.run_memtest,
             "run": self.run_run,
         }
         if command.lower() not in command_map:
             raise ToolkitError("Invalid command %r!" % (command,))
 
         # Strip off the initial command
-        command_map[command](args)
+        try:
+            command_map[command](args)
+        finally:
+            self.hotplug_stop()
 
         # except boot.CommandResponseError as exc:
         #     writeln("Command response error: %s" % exc)
@@ -337,8 +771,19 @@ class ToolkitApplication(object):
             init_file = self.bsp_info.memory_init_file
 
         if init_file is not None:
-            mem_init_data = read_initialization_file(init_file)
+            try:
+                mem_init_data = inittable.load(init_file, self.bsp_info,
+                                               cache_dir = os.path.join(get_user_dir(),
+                                                                        "inittable-cache"))
+            except IOError as err:
+                raise ToolkitError("Cannot read memory initialization file: %s" % (err,))
+            except inittable.InitTableError as err:
+                raise ToolkitError("Invalid memory initialization file: %s" % (err,))
+
             writeln(" [*] Initializing processor memory...")
+            if self.bsp_info.dcd_format is not None and self.mem_initialize_dcd(mem_init_data):
+                return
+
             for initaddr, initval, initwidth in mem_init_data:
                 if boot.DATA_SIZE_WORD == initwidth:
                     writeln("  [>] Write 0x%08X to 0x%08X" % (initval, initaddr))
@@ -346,11 +791,38 @@ class ToolkitApplication(object):
                     writeln("  [>] Write 0x%04X to 0x%08X" % (initval, initaddr))
                 if boot.DATA_SIZE_BYTE == initwidth:
                     writeln("  [>] Write 0x%02X to 0x%08X" % (initval, initaddr))
-                self.sbp.write_memory(initaddr, initwidth, initval)
+
+            # Pipelined; a failure names the entry that was not written.
+            self.sbp.write_memory_batch(mem_init_data)
         else:
             writeln(" [W] No memory initialization file specified.")
             writeln(" [W] Device communication may not work at all.")
 
+    def mem_initialize_dcd(self, mem_init_data):
+        """
+        Send the memory initialization table as a single DCD.  Return
+        ``False`` if that is not possible, so that the caller can write
+        the registers one at a time instead.
+        """
+        dcd_format = self.bsp_info.dcd_format
+        dcd_address = self.bsp_info.dcd_address
+        writeln("  [>] Sending %u writes as one %s DCD at 0x%08X" % (
+            len(mem_init_data), dcd_format, dcd_address))
+        try:
+            self.sbp.write_dcd(dcd_address, mem_init_data, dcd_format)
+
+        except ValueError as err:
+            writeln(" [!] Cannot build DCD: %s" % (err,))
+
+        except boot.PROBE_ERRORS as err:
+            writeln(" [!] DCD not accepted: %s" % (err,))
+
+        else:
+            return True
+
+        writeln(" [!] Falling back to one write per register.")
+        return False
+
     def run_ram_kernel(self, options, args):
         kernel = ramkernel.RAMKernelProtocol(self.channel)
 
@@ -407,7 +879,7 @@ class ToolkitApplication(object):
         writeln()
 
         # Re-open channel
-        self.channel_reinit()
+        self.channel_reinit(reenumerated = True)
 
         try:
             enable_disable_str = ("enable" if options.set_bbt_flag else "disable")
@@ -421,34 +893,82 @@ class ToolkitApplication(object):
             writeln("    [>] Part number:    %u" % (imxtype,))
             writeln("    [>] Flash model:    %r" % (flashmodel,))
 
-            flash_capacity_mbits = kernel.flash_get_capacity() * 8 / 1024
+            flash_capacity = kernel.flash_get_capacity()
+            flash_capacity_mbits = flash_capacity * 8 / 1024
             writeln("    [>] Flash capacity: %u Mb" % (flash_capacity_mbits,))
+            self.flash_info = (imxtype, flashmodel, flash_capacity)
+
+            if self.bsp_info.uid_fuse_address is not None:
+                self.board_uid = flashmanifest.fuse_uid(kernel, self.bsp_info.uid_fuse_address,
+                                                        self.bsp_info.uid_fuse_count)
+                writeln("    [>] Unique ID:      %s" % (self.board_uid[4:],))
 
             flash_run_method(kernel, options, args[1:])
 
         except ramkernel.CommandResponseError as err:
+            self.flash_error = err
             writeln(" <!> RAM kernel error: %s" % (err,))
 
         except Exception as err:
+            self.flash_error = err
             tb = sys.exc_info()[2]
             writeln(" <!> Unhandled error: %s" % (err,))
             writeln(" <!> Traceback: %s" % ("\n".join(traceback.format_tb(tb)),))
 
         finally:
-            writeln(" [*] Resetting CPU...")
             # Sometimes we need to let the RAM kernel "settle" after
-            # flash commands before issuing the RKL reset command.
-            time.sleep(1)
-            kernel.reset()
-            self.channel_reinit()
+            # flash commands before issuing the RKL reset command; wait
+            # until it answers again.
+            timeout = self.bsp_info.kernel_ready_timeout
+            try:
+                _, elapsed = kernel.wait_ready(timeout)
+                writeln(" [*] RAM kernel ready after %.2f s." % (elapsed,))
+            except boot.PROBE_ERRORS + (ramkernel.CommandResponseError,) as err:
+                writeln(" [!] RAM kernel not answering after %g s (%s); "
+                        "resetting anyway." % (timeout, err))
 
-            # Allow channel/bootstrap to settle
-            time.sleep(2)
+            writeln(" [*] Resetting CPU...")
+            kernel.reset()
+            self.channel_reinit(reenumerated = True)
 
+            # Wait for the boot ROM to come back up.
+            status, elapsed = self.sbp.wait_ready(self.bsp_info.boot_ready_timeout)
+            writeln(" [*] Bootstrap ready after %.2f s." % (elapsed,))
             writeln(" [*] Bootstrap status after reset: %s" % (
-                boot.get_status_string(self.sbp.get_status()),
+                boot.get_status_string(status),
             ))
 
+    def board_identity(self, options):
+        """ Return a name for the connected board, for per-board caches. """
+        if options.board_id:
+            return options.board_id
+
+        if self.board_uid:
+            return self.board_uid
+
+        if options.serialport:
+            return "uart:%s" % (options.serialport,)
+
+        if self.channel.port_path is not None:
+            return "usb:%s" % (format_port_path(*self.channel.port_path),)
+
+        if self.channel.pid is not None:
+            return "usb:%04x:%04x" % (self.channel.vid, self.channel.pid)
+
+        # Only the vendor is known; the bus address at least tells boards
+        # apart for as long as they stay connected.
+        return "usb:bus%u-addr%u" % self.channel.address
+
+    def flash_manifest_identity(self, options, block_size):
+        """
+        Return the flash manifest directory and the
+        :class:`~pyatk.flashmanifest.FlashIdentity` of the connected board.
+        """
+        imxtype, flashmodel, capacity = self.flash_info
+        identity = flashmanifest.FlashIdentity(self.board_identity(options), imxtype,
+                                               flashmodel, capacity, block_size)
+        return os.path.join(get_user_dir(), "flash-manifests"), identity
+
     def ram_kernel_flash_dump(self, kernel, options, args):
         count = int(args[0], 0)
         page_size = 2048
@@ -490,20 +1010,20 @@ class ToolkitApplication(object):
             start_address = 0
 
         writeln(" [*] Programming %r to 0x%08x" % (path, start_address))
-        block_size = 0x20000
+        block_size = ramkernel.DEFAULT_FLASH_BLOCK_SIZE
 
-        current_address = 0
         bar_len = 35
 
         class Progress(object):
             def __init__(self):
                 self.program_current = 0
                 self.verify_current  = 0
-                self.current_address = 0
                 self.start_time = time.time()
 
             def write_progress(self, current, length):
-                ratio = float(self.program_current) / data_size
+                # A partial first block may be programmed whole.
+                ratio = min(1.0, float(self.program_current) /
+                            (data_size + start_address - block_start))
                 percent = ratio * 100.0
                 bar_on = int(ratio * bar_len)
                 bar_off = bar_len - bar_on
@@ -511,7 +1031,7 @@ class ToolkitApplication(object):
 
                 sys.stdout.write("[%s%s] 0x%08X (%5.2f%%) %02d:%02d\r" % \
                                  ("="*bar_on, " "*bar_off,
-                                  current_address, percent, total_time / 60, total_time % 60))
+                                  block_start + current, percent, total_time / 60, total_time % 60))
 
                 sys.stdout.flush()
 
@@ -525,109 +1045,237 @@ class ToolkitApplication(object):
                 self.write_progress(self.verify_current, verify_length)
                 self.verify_current += verify_length
 
+            def erase_cb(self, block, erase_length):
+                # Erased blocks count as programmed and verified.
+                sys.stdout.write("     Erase   ")
+                self.write_progress(self.program_current, erase_length)
+                self.program_current += erase_length
+                self.verify_current += erase_length
+
         data_size = os.stat(path).st_size
-        num_blocks = data_size / block_size
         # flash_program will only write starting at the block boundary.
         # The RAM kernel will pretend it is writing to the specified address,
         # but it always erases and then writes starting from block page 0.
-        # Thus, we pad the data if the start address starts after the first
-        # byte of the block.
+        # Thus, program_stream merges the start of a partial first block
+        # with what is already in flash.
         block_start = (start_address & ~(block_size-1))
         if block_start < start_address:
-            initial_pad = b"\x00" * (start_address - block_start)
             writeln(" [!] Flash program start address does not fall on block boundary.")
-            writeln(" [!] Writing {0} pad bytes at start of block.".format(len(initial_pad)))
-
-        else:
-            initial_pad = b""
+            writeln(" [!] Keeping the first {0} bytes of the block.".format(
+                start_address - block_start))
+            if options.host_merge:
+                kernel.program_ub = False
+
+        manifest_dir, identity = self.flash_manifest_identity(options, block_size)
+        previous = None
+        block_hashes = None
+        if options.differential_program:
+            if not (options.board_id or self.board_uid):
+                writeln(" [!] No unique ID fuses in the BSP; identifying the board by its "
+                        "port (%s)." % (identity.board,))
+                writeln(" [!] Another board with the same flash in that port would only be "
+                        "caught by --spot-check.")
+            previous = flashmanifest.load(manifest_dir, identity)
+            block_hashes = {}
+            if previous is None:
+                writeln(" [*] No flash manifest for %s; programming every block." % (
+                    identity.board,))
+
+            elif options.spot_check_blocks > 0:
+                mismatches = flashmanifest.spot_check(kernel, previous,
+                                                      options.spot_check_blocks)
+                if mismatches:
+                    writeln(" [!] Flash at 0x%08X does not match the manifest; "
+                            "programming every block." % (mismatches[0],))
+                    previous = None
+                else:
+                    writeln(" [*] Flash manifest spot-check passed.")
+
+        planner = ramkernel.ErasePlanner(kernel, block_size)
+        for erase_range in options.erase_ranges:
+            erase_address, erase_size = parse_erase_range(erase_range)
+            planner.erase(erase_address, erase_size)
+            if previous:
+                # Erased blocks no longer hold what the manifest says.
+                previous = dict((address, entry) for address, entry in previous.items()
+                                if address + entry[0] <= erase_address or
+                                address >= erase_address + erase_size)
+        planner.program(start_address, data_size)
+
+        # The flash is about to change: a program that fails part way must
+        # not leave a manifest behind that claims otherwise.
+        flashmanifest.discard(manifest_dir, identity)
+
+        if options.erase_ranges:
+            self.run_erase_plan(planner)
 
         with open(path, "rb") as file_fp:
-            read_size = block_size
-            # Start writing at block start address
-            current_address = block_start
-            # Pad the first read from the file, adjusted for the remaining size of the
-            # block.
-            chunk = initial_pad + file_fp.read(read_size - len(initial_pad))
-
             prog = Progress()
-            while current_address < (start_address + data_size):
-                kernel.flash_program(current_address, chunk,
-                                     read_back_verify = True,
-                                     program_callback = prog.program_cb,
-                                     verify_callback  = prog.verify_cb)
-                current_address += len(chunk)
-                chunk = file_fp.read(read_size)
+            # Each chunk is read while the previous one programs.
+            result = kernel.program_stream(start_address, file_fp,
+                                           length = data_size,
+                                           block_size = block_size,
+                                           read_back_verify = True,
+                                           sparse = options.sparse_program,
+                                           previous = previous,
+                                           block_hashes = block_hashes,
+                                           program_callback = prog.program_cb,
+                                           verify_callback  = prog.verify_cb,
+                                           erase_callback   = prog.erase_cb)
+
+        if options.differential_program:
+            # Blocks outside the image still hold what they held before.
+            flashmanifest.save(manifest_dir, identity,
+                               flashmanifest.merge(previous, block_hashes))
 
         writeln()
+        writeln(" [*] Programmed %u bytes in %u chunks, %.1f s (%.2f MB/s)." % (
+            result.size, result.chunks, result.seconds,
+            result.size / (1024.0 * 1024.0) / max(result.seconds, 1e-6)))
+        if options.sparse_program:
+            writeln(" [*] Skipped %u bytes (%.1f%%) of erased blocks." % (
+                result.skipped, 100.0 * result.skipped / max(result.size, 1)))
+        if options.differential_program:
+            writeln(" [*] Left %u bytes (%.1f%%) of unchanged blocks alone." % (
+                result.unchanged, 100.0 * result.unchanged / max(result.size, 1)))
 
     def ram_kernel_flash_erase(self, kernel, options, args):
-        erase_size = args[0]
-        try:
-            erase_size = int(erase_size, 0)
+        if not args:
+            raise ToolkitError("Missing erase size for 'flash erase'!")
 
-        except ValueError:
-            raise ToolkitError("Invalid flash erase size %r!" % (erase_size,))
+        if len(args) < 2:
+            writeln(" [*] Start address not specified; starting at block 0.")
+            args = args + ["0"]
+
+        if len(args) % 2:
+            raise ToolkitError("Missing erase start address after size %r!" % (args[-1],))
+
+        planner = ramkernel.ErasePlanner(kernel)
+        # BYTES ADDRESS [BYTES ADDRESS ...]
+        for erase_size, address in zip(args[0::2], args[1::2]):
+            try:
+                erase_size = int(erase_size, 0)
+
+            except ValueError:
+                raise ToolkitError("Invalid flash erase size %r!" % (erase_size,))
 
-        if len(args) > 1:
-            address = args[1]
             try:
                 start_address = int(address, 0)
 
             except ValueError:
                 raise ToolkitError("Invalid erase start address %r!" % (address,))
 
-        else:
-            writeln(" [*] Start address not specified; starting at block 0.")
-            start_address = 0
+            if erase_size < 0:
+                raise ToolkitError("Erase size cannot be negative!")
 
-        if erase_size < 0:
-            raise ToolkitError("Erase size cannot be negative!")
+            if start_address < 0:
+                raise ToolkitError("Start address cannot be negative!")
 
-        if start_address < 0:
-            raise ToolkitError("Start address cannot be negative!")
+            writeln(" [*] Erase %u bytes starting at 0x%08x." % (erase_size, start_address))
+            planner.erase(start_address, erase_size)
 
-        writeln(" [*] Erase %u bytes starting at 0x%08x." % (erase_size, start_address))
+        manifest_dir, identity = self.flash_manifest_identity(options,
+                                                              ramkernel.DEFAULT_FLASH_BLOCK_SIZE)
+        flashmanifest.discard(manifest_dir, identity)
+        self.run_erase_plan(planner)
 
+    def run_erase_plan(self, planner):
+        """ Carry out the erases of :class:`~pyatk.ramkernel.ErasePlanner` ``planner``. """
         def erase_cb(block_index, block_size):
             writeln("   [>] Erased block %d (size %d bytes)." % (block_index, block_size))
 
-        kernel.flash_erase(start_address, erase_size, erase_callback = erase_cb)
+        erased = planner.execute(erase_callback = erase_cb)
+        writeln(" [*] Erased %u bytes with %u command(s)." % (
+            sum(size for _, size in erased), len(erased)))
+
+    def run_boot_plan(self, plan):
+        current_image = [None]
+
+        def progcb(image, current, total):
+            if image is not current_image[0]:
+                current_image[0] = image
+                if image is plan.images[-1]:
+                    writeln(" [*] Loading application %r to 0x%08X..." % (
+                        image.path, image.address))
+                else:
+                    writeln(" [*] Loading %r to 0x%08X-0x%08X..." % (
+                        image.path, image.address, image.address + image.size - 1))
 
-    def run_application(self, filename, load_address):
-        appl_stat = os.stat(filename)
-        image_size = appl_stat.st_size
-        def progcb(current, total):
             bar_len = 50
             bar_on = int(float(current) / total * bar_len)
             bar_off = bar_len - bar_on
             sys.stdout.write("   [%s%s] %u/%u B\r" % ("="*bar_on, " "*bar_off, current, total))
             sys.stdout.flush()
+            if current == total:
+                writeln()
 
-        with open(filename, "rb") as appl_fd:
-            writeln(" [*] Loading application %r to 0x%08X..." % (filename, load_address))
-            self.sbp.write_file(boot.FILE_TYPE_APPLICATION,
-                                load_address, image_size, appl_fd, progress_callback = progcb)
-            writeln(" [*] Application write/execute OK!")
-
-def read_initialization_file(filename):
-    with open(filename, "r") as initfp:
-        initialization_data = []
-        for line in initfp:
-            line = line.strip()
-            if line == "" or line.startswith("#"):
-                continue
+        start = time.time()
+        plan.execute(self.sbp, progress_callback = progcb)
+        elapsed = time.time() - start
 
-            data = line.split(" ")
-            memaddr  = int(data[0], 0)
-            memval   = int(data[1], 0)
-            memwidth = int(data[2], 0)
+        writeln(" [*] Loaded %u image(s) (%u bytes) in %.2f s (%.1f kB/s)." % (
+            len(plan.images), plan.total_size, elapsed,
+            plan.total_size / 1024.0 / max(elapsed, 1e-6)))
+        writeln(" [*] Application write/execute OK!")
 
-            initialization_data.append((memaddr, memval, memwidth))
+def flash_job_size(args):
+    """ Return the number of bytes a 'flash' subcommand with ``args`` works on. """
+    try:
+        flash_command = args[0]
+        if "program" == flash_command:
+            return os.stat(args[1]).st_size
+        elif "erase" == flash_command:
+            return sum(int(size, 0) for size in args[1::2])
+        elif "dump" == flash_command:
+            return int(args[1], 0)
+        else:
+            raise ToolkitError("Unknown 'flash' subcommand %r!" % (flash_command,))
 
-        return initialization_data
+    except IndexError:
+        raise ToolkitError("Missing arguments for 'flash' command!")
+    except (OSError, ValueError) as err:
+        raise ToolkitError(str(err))
 
-def get_bsp_table(options):
-    """ Load BSP config files as necessary, returning the combined BSP table. """
+def parse_erase_range(erase_range):
+    """ Return ``(address, size)`` from a 'BYTES@ADDRESS' ``--erase`` argument. """
+    size, sep, address = erase_range.partition("@")
+    try:
+        if not sep:
+            raise ValueError
+        size, address = int(size, 0), int(address, 0)
+    except ValueError:
+        raise ToolkitError("Invalid erase range %r; expected BYTES@ADDRESS!" % (erase_range,))
+
+    if size < 0 or address < 0:
+        raise ToolkitError("Erase size and address cannot be negative!")
+
+    return address, size
+
+def flash_board(args, port_path):
+    """
+    Run 'flash-many' arguments ``args`` on the single board at USB port
+    ``port_path``.  Runs in a worker process; see :func:`multiboard.run_boards`.
+    """
+    app = ToolkitApplication()
+    options, flash_args = app.get_flash_many_parser().parse_args(
+        args + ["--usb-path", port_path])
+
+    # Keep each board's dump apart.
+    root, ext = os.path.splitext(options.flash_dump_file)
+    options.flash_dump_file = "%s-%s%s" % (root, port_path, ext)
+
+    app.bsp_initialize(options)
+    try:
+        app.channel_init(options)
+        app.run_ram_kernel(options, flash_args)
+    finally:
+        app.hotplug_stop()
+
+    if app.flash_error is not None:
+        raise app.flash_error
+
+def get_user_dir():
+    """ Return the per-user configuration directory, creating it if needed. """
     if "nt" == os.name:
         user_dir = os.path.join(os.getenv("APPDATA"), "pyatk")
 
@@ -638,6 +1286,12 @@ def get_bsp_table(options):
         writeln(" [i] Creating configuration directory...")
         os.makedirs(user_dir, 0o770)
 
+    return user_dir
+
+def get_bsp_table(options):
+    """ Load BSP config files as necessary, returning the combined BSP table. """
+    user_dir = get_user_dir()
+
     bsp_table_search_list = [
         os.path.join(user_dir, "bspinfo.conf"),
         options.bsp_config_file,
@@ -646,6 +1300,9 @@ def get_bsp_table(options):
     try:
         return bspinfo.load_board_support_table(bsp_table_search_list)
 
+    except ValueError as err:
+        raise ToolkitError("Invalid BSP configuration: %s" % (err,))
+
     except IOError as err:
         writeln(" [!] Error loading BSP information table: %s" % (err,))
         writeln("    [*] Search paths:")
@@ -659,11 +1316,15 @@ def main():
         sys.stderr.write("\nUsage: %s COMMAND [OPTIONS...]\n\n" % (sys.argv[0],))
         sys.stderr.write("  COMMAND = flash program -b BSP FILE  [ADDRESS=0]\n"
                          "            flash dump    -b BSP BYTES [ADDRESS=0]\n"
-                         "            flash erase   -b BSP BYTES [ADDRESS=0]\n"
+                         "            flash erase   -b BSP BYTES [ADDRESS=0] [BYTES ADDRESS...]\n"
+                         "            flash-many program|dump|erase -b BSP ...\n"
                          #"            flash test    -b BSP\n"
-                         #"            memtest       -b BSP\n"
+                         "            memdump -b BSP BYTES ADDRESS [-f FILE]\n"
+                         "            memtest -b BSP [--size BYTES|all] [--pattern P,...]\n"
                          "            run -b BSP BINARY LOADADDR\n"
-                         "            listbsp\n\n")
+                         "            run -b BSP FILE@ADDRESS [FILE@ADDRESS...]\n"
+                         "            listbsp\n"
+                         "            listdev [-b BSP]\n\n")
 
         if error:
             sys.stderr.write("Error: %s\n" % (error,))
@@ -296,15 +296,11 @@ class ToolkitMainWindow(QMainWindow):
             ram_kernel_file = self.ui.ram_kernel_binary_lineedit.text()
             memory_init_file = self.ui.memory_init_lineedit.text()
 
-            selected_bsp_info = bspinfo.BoardSupportInfo(
-                "%s [Custom Kernel]" % (selected_bsp_info.description,),
-                selected_bsp_info.base_memory_address,
-                selected_bsp_info.memory_bottom_address,
-                memory_init_file,
-                ram_kernel_file,
-                ram_kernel_origin,
-                selected_bsp_info.usb_vid,
-                selected_bsp_info.usb_pid,
+            selected_bsp_info = selected_bsp_info._replace(
+                description = "%s [Custom Kernel]" % (selected_bsp_info.description,),
+                memory_init_file = memory_init_file,
+                ram_kernel_file = ram_kernel_file,
+                ram_kernel_origin = ram_kernel_origin,
             )
 
         return selected_bsp_info
@@ -0,0 +1,182 @@
+# Copyright (c) 2012-2013, Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met: 
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer. 
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution. 
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+asyncio version of the Freescale i.MX Serial Boot Protocol.
+
+Requires Python 3.7 or later.
+"""
+import io
+import struct
+import asyncio
+
+from pyatk.channel.base import ChannelTimeout
+from pyatk import boot
+
+class AsyncSerialBootProtocol(object):
+    """
+    The coroutine counterpart of :class:`~pyatk.boot.SerialBootProtocol`,
+    communicating over an :class:`~pyatk.channel.aio.AsyncATKChannelI`.
+    """
+    def __init__(self, channel, byteorder = 'little'):
+        self.channel = channel
+        self.byteorder = byteorder
+
+    async def _read_status(self):
+        return boot._unpack_status(await self.channel.read(4))
+
+    async def _read_ack(self):
+        return boot._check_ack(await self._read_status())
+
+    async def _write_command(self, command):
+        await self.channel.write(boot._pad_command(command))
+
+    async def get_status(self):
+        """
+        Query for and return the ROM status.
+        """
+        await self._write_command(struct.pack(">H", boot.CMD_GET_STATUS))
+        return await self._read_status()
+
+    async def read_memory(self, address, datasize, length = 1):
+        """
+        See :meth:`~pyatk.boot.SerialBootProtocol.read_memory`.
+        """
+        await self._write_command(boot._read_memory_command(address, datasize, length))
+        await self._read_ack()
+
+        data = await self.channel.read((datasize // 8) * length)
+        return boot._memory_array(data, datasize, length, self.byteorder)
+
+    async def read_memory_single(self, address, datasize):
+        """
+        See :meth:`~pyatk.boot.SerialBootProtocol.read_memory_single`.
+        """
+        data = await self.read_memory(address, datasize, 1)
+        return data[0]
+
+    async def write_memory(self, address, datasize, data):
+        """
+        See :meth:`~pyatk.boot.SerialBootProtocol.write_memory`.
+        """
+        await self._write_command(boot._write_memory_command(address, datasize, data))
+        await self._read_ack()
+
+        try:
+            ack = await self._read_status()
+        except boot.CommandResponseError:
+            raise boot.CommandResponseError("Write memory failed!")
+
+        boot._check_write_ack(ack)
+
+    async def write_memory_batch(self, entries, window = None):
+        """
+        See :meth:`~pyatk.boot.SerialBootProtocol.write_memory_batch`.
+        """
+        entries = list(entries)
+        if window is None:
+            window = boot.WRITE_BATCH_WINDOWS.get(self.channel.chantype, 1)
+        if window < 1:
+            raise ValueError("write_memory_batch: window must be at least 1")
+
+        commands = [boot._write_memory_command(address, datasize, value)
+                    for address, value, datasize in entries]
+
+        sent = 0
+        for index, entry in enumerate(entries):
+            if sent < len(commands) and sent - index < window:
+                end = min(len(commands), index + window)
+                await self.channel.write(b"".join(commands[sent:end]))
+                sent = end
+
+            try:
+                boot._check_ack(await self._read_status())
+                boot._check_write_ack(await self._read_status())
+            except (boot.CommandResponseError, ChannelTimeout) as err:
+                try:
+                    await asyncio.wait_for(self._drain_statuses(boot._batch_outstanding(index, sent)),
+                                           boot.WRITE_BATCH_DRAIN_TIMEOUT)
+                except asyncio.TimeoutError:
+                    pass
+                raise boot.WriteMemoryBatchError(index, entry, err)
+
+    async def _drain_statuses(self, count):
+        """
+        See :meth:`~pyatk.boot.SerialBootProtocol._drain_statuses`.
+        """
+        for _ in range(count):
+            try:
+                await self._read_status()
+            except (boot.CommandResponseError, ChannelTimeout):
+                break
+
+    async def write_file(self, filetype, address, length, stream,
+                         progress_callback = None,
+                         chunk_size = None,
+                         progress_interval = boot.DEFAULT_PROGRESS_INTERVAL):
+        """
+        See :meth:`~pyatk.boot.SerialBootProtocol.write_file`.  ``stream`` is
+        an ordinary (blocking) file-like object.
+        """
+        if chunk_size is None:
+            chunk_size = boot._write_file_chunk_size(self.channel)
+        progress_callback = boot._rate_limited(progress_callback, progress_interval)
+
+        await self._write_command(boot._write_file_command(filetype, address, length))
+        await self._read_ack()
+
+        bytes_consumed = 0
+        for chunk in boot._file_chunks(stream, length, chunk_size):
+            await self.channel.write(chunk)
+            bytes_consumed += len(chunk)
+
+            if progress_callback:
+                progress_callback(bytes_consumed, length)
+
+        if boot.FILE_TYPE_APPLICATION == filetype:
+            padding = boot._file_padding(bytes_consumed)
+            if padding:
+                await self.channel.write(padding)
+
+            await self._complete_boot()
+
+    async def write_dcd(self, address, entries, dcd_format):
+        """
+        See :meth:`~pyatk.boot.SerialBootProtocol.write_dcd`.
+        """
+        dcd = boot.encode_dcd(entries, dcd_format)
+        await self.write_file(boot.FILE_TYPE_DCD, address, len(dcd), io.BytesIO(dcd))
+        boot._check_write_ack(await self._read_status())
+
+    async def reenumerate_usb(self, serialnum):
+        """
+        See :meth:`~pyatk.boot.SerialBootProtocol.reenumerate_usb`.
+        """
+        await self._write_command(boot._reenumerate_usb_command(serialnum))
+        resp = await self.channel.read(4)
+        if resp != boot.REENUMERATE_USB_RESPONSE:
+            raise boot.CommandResponseError("Invalid re-enumerate response: %r" % resp)
+
+    async def _complete_boot(self):
+        return boot._check_boot_complete(await self.get_status())
@@ -0,0 +1,234 @@
+# Copyright (c) 2012-2013, Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met: 
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer. 
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution. 
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+asyncio version of the Freescale i.MX ATK RAM kernel protocol.
+
+Requires Python 3.7 or later.
+"""
+from pyatk import aioboot
+from pyatk import boot
+from pyatk import ramkernel
+
+class AsyncRAMKernelProtocol(object):
+    """
+    The coroutine counterpart of :class:`~pyatk.ramkernel.RAMKernelProtocol`,
+    communicating over an :class:`~pyatk.channel.aio.AsyncATKChannelI`.
+    Each instance drives a single device; run one per board in the same
+    event loop to drive many at once.
+    """
+    def __init__(self, channel):
+        self.channel = channel
+
+        self._flash_init = False
+        self._kernel_init = False
+
+    # The state checks are identical to the blocking implementation.
+    _check_state = ramkernel.RAMKernelProtocol._check_state
+
+    async def _read_response(self):
+        return ramkernel._unpack_response(await self.channel.read(8))
+
+    async def _send_command(self, command,
+                            address = 0x00000000,
+                            param1  = 0x00000000,
+                            param2  = 0x00000000,
+                            wait_for_response = True):
+        self._check_state(command)
+
+        await self.channel.write(ramkernel._command_packet(command, address, param1, param2))
+
+        if wait_for_response:
+            ack, checksum, length = await self._read_response()
+            if ack not in (ramkernel.ACK_SUCCESS, ramkernel.ACK_FLASH_PARTLY):
+                raise ramkernel.CommandResponseError(command, ack, length)
+
+            return ack, checksum, length
+
+    async def run_image(self, image_fp, image_size, bsp_info, load_cb = None):
+        """
+        See :meth:`~pyatk.ramkernel.RAMKernelProtocol.run_image`.
+        """
+        if self._kernel_init:
+            raise ValueError("RAM kernel already loaded and initialized.")
+
+        sbp = aioboot.AsyncSerialBootProtocol(self.channel)
+        await sbp.write_memory(bsp_info.base_memory_address,
+                               boot.DATA_SIZE_WORD,
+                               self.channel.chantype)
+        await sbp.write_file(boot.FILE_TYPE_APPLICATION,
+                             bsp_info.ram_kernel_origin, image_size,
+                             image_fp, progress_callback = load_cb)
+
+        self._kernel_init = True
+
+    async def getver(self):
+        """
+        See :meth:`~pyatk.ramkernel.RAMKernelProtocol.getver`.
+        """
+        _, checksum, length = await self._send_command(ramkernel.CMD_GETVER)
+        if length > 0:
+            payload = await self.channel.read(length)
+        else:
+            payload = b""
+
+        return checksum, payload
+
+    async def flash_initial(self):
+        """
+        See :meth:`~pyatk.ramkernel.RAMKernelProtocol.flash_initial`.
+        """
+        await self._send_command(ramkernel.CMD_FLASH_INITIAL)
+        self._flash_init = True
+
+    async def flash_dump(self, address, size):
+        """
+        See :meth:`~pyatk.ramkernel.RAMKernelProtocol.flash_dump`.
+        """
+        payload_list = []
+        async def read_payload(checksum, length):
+            if length > 0:
+                payload = await self.channel.read(length)
+            else:
+                payload = b""
+
+            mychecksum = ramkernel.calculate_checksum(payload)
+            if mychecksum != checksum:
+                raise ramkernel.ChecksumError(checksum, mychecksum)
+
+            payload_list.append(payload)
+            return len(payload)
+
+        ack, checksum, length = await self._send_command(ramkernel.CMD_FLASH_DUMP,
+                                                         address = address,
+                                                         param1 = size,
+                                                         param2 = 0)
+        total_bytes = await read_payload(checksum, length)
+
+        while total_bytes < size:
+            ack, checksum, length = await self._read_response()
+            if ack != ramkernel.ACK_FLASH_PARTLY:
+                raise ramkernel.CommandResponseError(ramkernel.CMD_FLASH_DUMP, ack, length)
+
+            total_bytes += await read_payload(checksum, length)
+
+        return b"".join(payload_list)
+
+    async def flash_get_capacity(self):
+        """
+        See :meth:`~pyatk.ramkernel.RAMKernelProtocol.flash_get_capacity`.
+        """
+        await self._send_command(ramkernel.CMD_FLASH_GET_CAPACITY, wait_for_response = False)
+        ack, _, capacity = await self._read_response()
+
+        if ack != ramkernel.ACK_SUCCESS:
+            raise ramkernel.CommandResponseError(ramkernel.CMD_FLASH_GET_CAPACITY, ack, capacity)
+
+        return capacity
+
+    async def flash_set_bbt(self, enable):
+        await self._set_flag_cmd(ramkernel.CMD_FL_BBT, enable)
+
+    async def flash_set_interleave(self, enable):
+        await self._set_flag_cmd(ramkernel.CMD_FL_INTLV, enable)
+
+    async def flash_set_lba(self, enable):
+        await self._set_flag_cmd(ramkernel.CMD_FL_LBA, enable)
+
+    async def _set_flag_cmd(self, flag_cmd, enable):
+        await self._send_command(flag_cmd, 0, 1 if enable else 0, 0)
+
+    async def flash_erase(self, start_address, size, erase_callback = None):
+        """
+        See :meth:`~pyatk.ramkernel.RAMKernelProtocol.flash_erase`.
+        """
+        await self._send_command(ramkernel.CMD_FLASH_ERASE,
+                                 address = start_address,
+                                 param1  = size,
+                                 param2  = 0,
+                                 wait_for_response = False)
+
+        ack = ramkernel.ACK_FLASH_ERASE
+        while ramkernel.ACK_FLASH_ERASE == ack:
+            ack, i, block_size = await self._read_response()
+
+            if ramkernel.ACK_FLASH_ERASE == ack and erase_callback:
+                erase_callback(i, block_size)
+
+            if ack not in (ramkernel.ACK_FLASH_ERASE, ramkernel.ACK_SUCCESS):
+                raise ramkernel.CommandResponseError(ramkernel.CMD_FLASH_ERASE, ack, block_size)
+
+    async def flash_program(self, start_address, data,
+                            file_format = ramkernel.FLASH_FILE_FORMAT_NORMAL,
+                            read_back_verify = False,
+                            program_callback = None,
+                            verify_callback = None):
+        """
+        See :meth:`~pyatk.ramkernel.RAMKernelProtocol.flash_program`.
+        """
+        ramkernel._check_program_args(start_address, data, file_format)
+
+        flash_command = ramkernel.CMD_FLASH_PROGRAM
+
+        flags = file_format
+        if read_back_verify:
+            flags |= ramkernel.FLASH_PROGRAM_PARAM1_VERIFY
+
+        await self._send_command(flash_command,
+                                 address = start_address,
+                                 param1 = len(data),
+                                 param2 = flags,
+                                 wait_for_response = False)
+
+        ack, checksum, length = await self._read_response()
+        if ramkernel.ACK_SUCCESS != ack:
+            raise ramkernel.CommandResponseError(flash_command, ack, length)
+
+        await self.channel.write(data)
+
+        ack, block, length = await self._read_response()
+        while ramkernel.ACK_FLASH_PARTLY == ack:
+            if program_callback:
+                program_callback(block, length)
+
+            ack, block, length = await self._read_response()
+
+        if read_back_verify:
+            if ramkernel.ACK_FLASH_VERIFY != ack:
+                raise ramkernel.CommandResponseError(flash_command, ack, length)
+
+            while ramkernel.ACK_FLASH_VERIFY == ack:
+                if verify_callback:
+                    verify_callback(block, length)
+
+                ack, block, length = await self._read_response()
+
+        if ramkernel.ACK_SUCCESS != ack:
+            raise ramkernel.CommandResponseError(flash_command, ack, length)
+
+    async def reset(self):
+        """
+        Reset the device CPU.
+        """
+        await self._send_command(ramkernel.CMD_RESET, wait_for_response = False)
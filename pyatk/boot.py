@@ -24,11 +24,16 @@
 """
 Freescale i.MX Serial Boot Protocol implementation
 """
+import io
 import sys
+import time
 import array
 import struct
 import binascii
 
+from pyatk.channel.base import ChannelTimeout, CHANNEL_TYPE_UART, CHANNEL_TYPE_USB
+from pyatk import timing
+
 ## More of these are defined depending on the i.MX part and
 ## installed bootloader. These are all that is needed for
 ## the i.MX258, as far as we can tell.
@@ -42,6 +47,8 @@ DATA_SIZE_BYTE     = 0x08
 DATA_SIZE_HALFWORD = 0x10
 DATA_SIZE_WORD     = 0x20
 
+#: Load data into memory without executing it.
+FILE_TYPE_LOAD_ONLY   = 0x00
 #: Terminates serial protocol and runs application.
 FILE_TYPE_APPLICATION = 0xAA
 #: Secure boot mode only.
@@ -93,6 +100,324 @@ class CommandResponseError(Exception):
     def __str__(self):
         return self.msg
 
+class WriteMemoryBatchError(CommandResponseError):
+    """
+    A write in :meth:`SerialBootProtocol.write_memory_batch` failed.
+    ``index`` is the position of the failing entry in the batch and
+    ``entry`` the entry itself.
+    """
+    def __init__(self, index, entry, reason):
+        address, value, datasize = entry
+        super(WriteMemoryBatchError, self).__init__(
+            "Write %u of batch (0x%0*X to 0x%08X) failed: %s" % (
+                index, datasize // 4, value, address, reason))
+        self.index = index
+        self.entry = entry
+
+#: Default number of :meth:`SerialBootProtocol.write_memory_batch` commands
+#: in flight, by channel type.  The UART ROM has only a small receive FIFO;
+#: USB flow control holds back commands the ROM is not ready for.
+WRITE_BATCH_WINDOWS = {
+    CHANNEL_TYPE_UART: 2,
+    CHANNEL_TYPE_USB: 16,
+}
+
+#: Seconds :meth:`SerialBootProtocol.write_memory_batch` spends reading and
+#: discarding the responses to commands sent after a failed write.
+WRITE_BATCH_DRAIN_TIMEOUT = 1.0
+
+#: Default :meth:`SerialBootProtocol.write_file` chunk size, by channel type,
+#: for channels that do not have a ``max_transfer_size``.
+WRITE_FILE_CHUNK_SIZES = {
+    CHANNEL_TYPE_UART: 4096,
+    CHANNEL_TYPE_USB: 64 * 1024,
+}
+
+#: Default shortest time, in seconds, between two ``progress_callback``
+#: calls from :meth:`SerialBootProtocol.write_file`.
+DEFAULT_PROGRESS_INTERVAL = 0.1
+
+#: Default longest wait, in seconds, in :meth:`SerialBootProtocol.wait_ready`.
+DEFAULT_READY_TIMEOUT = 5
+
+#: Default largest READ_MEMORY request made by
+#: :meth:`SerialBootProtocol.read_memory_into`; larger regions are split.
+READ_MEMORY_MAX_SIZE = 64 * 1024
+
+# Errors that mean a device is not answering (yet).
+PROBE_ERRORS = (IOError, ChannelTimeout, CommandResponseError)
+
+_ARRAY_TYPECODES = {
+    DATA_SIZE_BYTE: "B",
+    DATA_SIZE_HALFWORD: "H",
+    DATA_SIZE_WORD: "I",
+}
+
+def _pad_command(command):
+    """ Pad serial bootloader command string ``command`` to 16 bytes. """
+    if len(command) < 16:
+        command += b"\x00" * (16 - len(command))
+
+    return command
+
+def _unpack_status(status_raw):
+    if len(status_raw) != 4:
+        raise CommandResponseError("Expected 4-byte status word, "
+                                   "got %r (%r) instead" % (status_raw, binascii.hexlify(status_raw)))
+
+    return struct.unpack("<I", status_raw)[0]
+
+def _batch_outstanding(index, sent):
+    """
+    Return the most status words still to come when entry ``index`` of a
+    write batch has failed with ``sent`` commands sent.  Each command is
+    answered by an ACK and a write status, and at least one word of the
+    failing entry has been read.
+    """
+    return 2 * (sent - index) - 1
+
+def _check_ack(ack):
+    if ack not in (ACK_PRODUCTION_PART, ACK_ENGINEERING_PART):
+        raise CommandResponseError("Received unexpected status code instead "
+                                   "of ACK: 0x%08X" % ack)
+
+    return ack
+
+def _check_write_ack(ack):
+    # The i.MX25 manual lies.  This is the SUCCESS ACK! The error
+    # acknowledge is no response after 0x56787856, but the manual
+    # says it's the other way around...
+    if ack != ACK_WRITE_SUCCESS:
+        raise CommandResponseError("Received unexpected status instead "
+                                   "of ACK: 0x%08X" % ack)
+
+def _file_padding(length):
+    """
+    Return what to send after a ``length``-byte file before reading the
+    status that follows it.
+    """
+    # HACK: The i.MX25 USB implementation does not
+    # like writing files that are multiples of 64 bytes!
+    # The status that follows never arrives.  To fix this
+    # for now, push out one more byte before trying to
+    # read the damn status.
+    if 0 == (length % 64):
+        return b"\x00"
+    return b""
+
+def _check_load_complete(status):
+    # HAB4 ROMs send the boot protocol completion code once the data is in
+    # memory; older ROMs send the write ACK.
+    if status not in (ACK_WRITE_SUCCESS, BOOT_PROTOCOL_COMPLETE):
+        raise CommandResponseError("Received unexpected status 0x%08X after "
+                                   "loading file" % status)
+
+def _check_boot_complete(status):
+    if status != BOOT_PROTOCOL_COMPLETE:
+        raise CommandResponseError("Expected boot protocol completion code 0x88888888, "
+                                   ", got 0x%08X instead!" % status)
+
+    return status
+
+def _read_memory_command(address, datasize, length):
+    if datasize not in (DATA_SIZE_BYTE,
+                        DATA_SIZE_HALFWORD,
+                        DATA_SIZE_WORD):
+        raise ValueError("read_memory: Invalid data size")
+
+    if not (UINT32_MIN <= address <= UINT32_MAX):
+        raise ValueError("read_memory: Invalid address")
+
+    return _pad_command(struct.pack(">HIBI", CMD_READ_MEMORY, address, datasize, length))
+
+def _memory_array(data, datasize, length, byteorder):
+    """
+    Convert ``length`` values of width ``datasize`` read from memory in
+    ``data`` to an array, in host byte order.
+    """
+    total_length = (datasize // 8) * length
+    if len(data) != total_length:
+        raise CommandResponseError("Data received is of invalid length "
+                                   "(expected %u bytes, received %u)" % (total_length, len(data)))
+
+    retarray = array.array(_ARRAY_TYPECODES[datasize])
+    retarray.frombytes(data)
+
+    # You send things MSB first, but get them back in processor order.
+    if byteorder != sys.byteorder:
+        retarray.byteswap()
+
+    return retarray
+
+def _write_memory_command(address, datasize, data):
+    if datasize not in (DATA_SIZE_BYTE,
+                        DATA_SIZE_HALFWORD,
+                        DATA_SIZE_WORD):
+        raise ValueError("write_memory: Invalid data size")
+
+    if not (UINT32_MIN <= address <= UINT32_MAX):
+        raise ValueError("write_memory: Invalid address")
+
+    command = struct.pack(">HIB4x", CMD_WRITE_MEMORY, address, datasize)
+
+    if datasize == DATA_SIZE_BYTE:
+        command += struct.pack(">3xB", data)
+    elif datasize == DATA_SIZE_HALFWORD:
+        command += struct.pack(">2xH", data)
+    elif datasize == DATA_SIZE_WORD:
+        command += struct.pack(">I", data)
+
+    return _pad_command(command)
+
+def _write_file_command(filetype, address, length):
+    if not (UINT32_MIN <= address <= UINT32_MAX):
+        raise ValueError("Write start address must be a 32-bit integer")
+
+    if not (UINT32_MIN <= length <= UINT32_MAX):
+        raise ValueError("Write length must be a 32-bit integer")
+
+    return _pad_command(struct.pack(">HIxI4xB", CMD_WRITE_FILE, address, length, filetype))
+
+def _write_file_chunk_size(channel):
+    """
+    Return the default :meth:`SerialBootProtocol.write_file` chunk size for
+    ``channel``: enough to fill every transfer a USB channel can have in
+    flight, or else the size for its channel type.
+    """
+    max_transfer_size = getattr(channel, "max_transfer_size", None)
+    if max_transfer_size:
+        return max_transfer_size * max(1, getattr(channel, "async_transfers", 0))
+
+    return WRITE_FILE_CHUNK_SIZES.get(channel.chantype, 1024)
+
+def _file_chunks(stream, length, chunk_size):
+    """
+    Generate ``length`` bytes of ``stream`` in chunks of at most
+    ``chunk_size`` bytes.  Streams with ``readinto`` are read into one
+    reusable buffer, so each chunk is only valid until the next is
+    generated.
+    """
+    if chunk_size < 1:
+        raise ValueError("write_file: chunk size must be at least 1")
+
+    readinto = getattr(stream, "readinto", None)
+    if readinto is not None:
+        view = memoryview(bytearray(min(chunk_size, length)))
+
+    bytes_consumed = 0
+    while bytes_consumed < length:
+        wanted = min(chunk_size, length - bytes_consumed)
+        if readinto is not None:
+            count = readinto(view[:wanted]) or 0
+            chunk = view[:count]
+        else:
+            chunk = stream.read(wanted)
+            count = len(chunk)
+
+        if not count:
+            raise ValueError("File stream ends early after %u "
+                             "bytes consumed." % bytes_consumed)
+        bytes_consumed += count
+        yield chunk
+
+def _rate_limited(callback, interval, clock = time.time):
+    """
+    Wrap progress callback ``callback(current, total)`` so that it is
+    called at most once every ``interval`` seconds, plus once at the end.
+    """
+    if callback is None:
+        return None
+
+    last_call = [None]
+
+    def limited(current, total):
+        now = clock()
+        if (current >= total or last_call[0] is None or
+                now - last_call[0] >= interval):
+            last_call[0] = now
+            callback(current, total)
+
+    return limited
+
+def _reenumerate_usb_command(serialnum):
+    if len(serialnum) != 4:
+        raise ValueError("Invalid serial number")
+
+    return _pad_command(struct.pack(">H7x4s", CMD_REENUMERATE_USB, serialnum))
+
+## Device Configuration Data (DCD) formats.
+#: i.MX25/i.MX35/i.MX51 DCD: a barker code and length, then
+#: ``(type, address, value)`` entries, all little-endian words.
+DCD_FORMAT_V1   = "v1"
+#: HAB4 DCD (i.MX53 and later): a tagged header followed by big-endian
+#: Write Data commands.
+DCD_FORMAT_HAB4 = "hab4"
+DCD_FORMATS = (DCD_FORMAT_V1, DCD_FORMAT_HAB4)
+
+DCD_V1_BARKER       = 0xB17219E9
+DCD_HAB4_TAG        = 0xD2
+DCD_HAB4_VERSION    = 0x40
+DCD_HAB4_WRITE_DATA = 0xCC
+#: Largest DCD a HAB4 ROM accepts, in bytes.
+DCD_HAB4_MAX_SIZE   = 1768
+
+def _check_dcd_entry(address, value, datasize):
+    if datasize not in (DATA_SIZE_BYTE,
+                        DATA_SIZE_HALFWORD,
+                        DATA_SIZE_WORD):
+        raise ValueError("DCD: Invalid data size %r at 0x%08X" % (datasize, address))
+
+    if not (UINT32_MIN <= address <= UINT32_MAX):
+        raise ValueError("DCD: Invalid address %r" % (address,))
+
+    if not (0 <= value < (1 << datasize)):
+        raise ValueError("DCD: Value 0x%X does not fit in %u bits at 0x%08X" % (
+            value, datasize, address))
+
+def encode_dcd(entries, dcd_format):
+    """
+    Compile memory initialization ``entries``, a sequence of
+    ``(address, value, datasize)`` tuples as read from a memory
+    initialization file, into a Device Configuration Data blob in
+    ``dcd_format`` (:const:`DCD_FORMAT_V1` or :const:`DCD_FORMAT_HAB4`).
+    Writes are kept in order.
+
+    :exc:`ValueError` is raised for an unknown format, an invalid entry or a
+    table too large for the format.
+    """
+    entries = list(entries)
+    for address, value, datasize in entries:
+        _check_dcd_entry(address, value, datasize)
+
+    if DCD_FORMAT_V1 == dcd_format:
+        body = b"".join(struct.pack("<III", datasize // 8, address, value)
+                        for address, value, datasize in entries)
+        return struct.pack("<II", DCD_V1_BARKER, len(body)) + body
+
+    elif DCD_FORMAT_HAB4 == dcd_format:
+        # One Write Data command per run of writes of the same width.
+        commands = []
+        run = []
+        for index, (address, value, datasize) in enumerate(entries):
+            run.append(struct.pack(">II", address, value))
+            if index + 1 == len(entries) or entries[index + 1][2] != datasize:
+                commands.append(struct.pack(">BHB", DCD_HAB4_WRITE_DATA, 4 + 8 * len(run),
+                                            datasize // 8) + b"".join(run))
+                run = []
+
+        body = b"".join(commands)
+        length = 4 + len(body)
+        if length > DCD_HAB4_MAX_SIZE:
+            raise ValueError("DCD: %u bytes is larger than the HAB4 limit of %u bytes" % (
+                length, DCD_HAB4_MAX_SIZE))
+
+        return struct.pack(">BHB", DCD_HAB4_TAG, length, DCD_HAB4_VERSION) + body
+
+    raise ValueError("Unknown DCD format %r" % (dcd_format,))
+
+#: Response to :const:`CMD_REENUMERATE_USB`.
+REENUMERATE_USB_RESPONSE = b"\x89\x23\x23\x89"
+
 class SerialBootProtocol(object):
     """
     A protocol object for communicating with an i.MX processor
@@ -108,12 +433,7 @@ class SerialBootProtocol(object):
         self.byteorder = byteorder
 
     def _read_status(self):
-        status_raw = self.channel.read(4)
-        if len(status_raw) != 4:
-            raise CommandResponseError("Expected 4-byte status word, "
-                                       "got %r (%r) instead" % (status_raw, binascii.hexlify(status_raw)))
-
-        return struct.unpack("<I", status_raw)[0]
+        return _unpack_status(self.channel.read(4))
 
     def _read_ack(self):
         """
@@ -121,23 +441,14 @@ class SerialBootProtocol(object):
         :const:`ACK_PRODUCTION_PART` or const:`ACK_ENGINEERING_PART`,
         :exc:`CommandResponseError` is raised.
         """
-        ack = self._read_status()
-        if ack not in (ACK_PRODUCTION_PART, ACK_ENGINEERING_PART):
-            raise CommandResponseError("Received unexpected status code instead "
-                                       "of ACK: 0x%08X" % ack)
-
-        return ack
+        return _check_ack(self._read_status())
     
     def _write_command(self, command):
         """
         Write serial bootloader command string ``command``,
         automatically padded to 16 bytes.
         """
-        # Pad command to 16 bytes
-        if len(command) < 16:
-            command += b"\x00" * (16 - len(command))
-
-        self.channel.write(command)
+        self.channel.write(_pad_command(command))
 
     def get_status(self):
         """
@@ -147,6 +458,15 @@ class SerialBootProtocol(object):
         self._write_command(command)
         return self._read_status()
 
+    def wait_ready(self, timeout = DEFAULT_READY_TIMEOUT):
+        """
+        Poll :meth:`get_status`, with exponential backoff, until the boot ROM
+        answers.  Return the tuple ``(status, elapsed)``, with ``elapsed``
+        the seconds spent waiting.  If there is still no answer after
+        ``timeout`` seconds, the last error is raised.
+        """
+        return timing.retry(self.get_status, timeout, exceptions = PROBE_ERRORS)
+
     def read_memory(self, address, datasize, length = 1):
         """
         Read memory at ``address``.  Read ``length`` successive
@@ -156,46 +476,89 @@ class SerialBootProtocol(object):
         All values are converted from device byte order (specified
         in the constructor) to host byte order, if necessary.
         """
-        if datasize not in (DATA_SIZE_BYTE,
-                            DATA_SIZE_HALFWORD,
-                            DATA_SIZE_WORD):
-            raise ValueError("read_memory: Invalid data size")
-
-        if not (UINT32_MIN <= address <= UINT32_MAX):
-            raise ValueError("read_memory: Invalid address")
-
-        command = struct.pack(">HIBI", CMD_READ_MEMORY, address, datasize, length)
-        self._write_command(command)
+        self._write_command(_read_memory_command(address, datasize, length))
 
         # Receive 4-byte ACK
         _ = self._read_ack()
 
-        array_typecode = {
-            DATA_SIZE_BYTE: "B",
-            DATA_SIZE_HALFWORD: "H",
-            DATA_SIZE_WORD: "I"
-        }[datasize]
-
-        # convert to byte width
-        datasize = datasize // 8
-        
-        retarray = array.array(array_typecode)
-
-        total_length = datasize * length
         # Get variable-length data
-        data = self.channel.read(total_length)
-        if len(data) != total_length:
-            raise CommandResponseError("Data received is of invalid length "
-                                       "(expected %u bytes, received %u)" % (total_length, len(data)))
-
-        # Push data into array
-        retarray.fromstring(data)
-
-        # You send things MSB first, but get them back in processor order.
-        if self.byteorder != sys.byteorder:
-            retarray.byteswap()
+        data = self.channel.read((datasize // 8) * length)
+        return _memory_array(data, datasize, length, self.byteorder)
+
+    def read_memory_into(self, address, length, sink,
+                         datasize = DATA_SIZE_WORD,
+                         byteorder = None,
+                         max_read_size = READ_MEMORY_MAX_SIZE,
+                         progress_callback = None):
+        """
+        Read ``length`` bytes of memory at ``address`` into ``sink``, with
+        accesses of width ``datasize``.  ``sink`` is either a file-like
+        object, which is written one chunk at a time, or a writable buffer
+        of at least ``length`` bytes, which is filled in place.  The region
+        is read with as many requests of at most ``max_read_size`` bytes as
+        needed, so it is never held in memory as a whole.
+
+        Values are stored in device byte order (a raw memory image) unless
+        ``byteorder`` ("little" or "big") says otherwise, in which case they
+        are byteswapped if needed.  If given, ``progress_callback(current,
+        total)`` is called after each chunk.  Return ``length``.
+        """
+        width = datasize // 8
+        if datasize not in _ARRAY_TYPECODES:
+            raise ValueError("read_memory_into: Invalid data size")
+        if length % width or max_read_size < width:
+            raise ValueError("read_memory_into: Length and maximum read size must be "
+                             "multiples of the data size")
+        if not (UINT32_MIN <= address and address + length <= UINT32_MAX + 1):
+            raise ValueError("read_memory_into: Invalid address")
+
+        swap = byteorder is not None and byteorder != self.byteorder and width > 1
+        chunk_size = min(length, max_read_size - max_read_size % width)
+
+        if hasattr(sink, "write"):
+            sink_view = None
+        else:
+            sink_view = memoryview(sink).cast("B")
+            if len(sink_view) < length:
+                raise ValueError("read_memory_into: Buffer is smaller than %u bytes" % length)
+
+        # Chunks that must be byteswapped, or written to a file, go through
+        # one reusable buffer; otherwise they land directly in the sink.
+        if swap or sink_view is None:
+            staging = array.array(_ARRAY_TYPECODES[datasize], bytes(chunk_size))
+            staging_view = memoryview(staging).cast("B")
+
+        offset = 0
+        while offset < length:
+            count = min(chunk_size, length - offset)
+            self._write_command(_read_memory_command(address + offset, datasize, count // width))
+            self._read_ack()
+
+            if swap or sink_view is None:
+                view = staging_view[:count]
+            else:
+                view = sink_view[offset:offset + count]
+
+            received = self.channel.readinto(view)
+            if received != count:
+                raise CommandResponseError("Data received is of invalid length "
+                                           "(expected %u bytes, received %u)" % (count, received))
+
+            if swap:
+                # Swapped in place; on a short last chunk the stale tail
+                # is swapped too, but never used.
+                staging.byteswap()
+
+            if sink_view is None:
+                sink.write(view)
+            elif swap:
+                sink_view[offset:offset + count] = view
+
+            offset += count
+            if progress_callback:
+                progress_callback(offset, length)
 
-        return retarray
+        return length
 
     def read_memory_single(self, address, datasize):
         """
@@ -212,24 +575,7 @@ class SerialBootProtocol(object):
         Perform a memory write of size ``datasize`` (see :const:`DATA_SIZE_BYTE, etc.)
         with unsigned integer value ``data``.
         """
-        if datasize not in (DATA_SIZE_BYTE,
-                            DATA_SIZE_HALFWORD,
-                            DATA_SIZE_WORD):
-            raise ValueError("write_memory: Invalid data size")
-
-        if not (UINT32_MIN <= address <= UINT32_MAX):
-            raise ValueError("write_memory: Invalid address")
-
-        command = struct.pack(">HIB4x", CMD_WRITE_MEMORY, address, datasize)
-        
-        if datasize == DATA_SIZE_BYTE:
-            command += struct.pack(">3xB", data)
-        elif datasize == DATA_SIZE_HALFWORD:
-            command += struct.pack(">2xH", data)
-        elif datasize == DATA_SIZE_WORD:
-            command += struct.pack(">I", data)
-
-        self._write_command(command)
+        self._write_command(_write_memory_command(address, datasize, data))
 
         ack = self._read_ack()
 
@@ -242,45 +588,97 @@ class SerialBootProtocol(object):
         except CommandResponseError:
             raise CommandResponseError("Write memory failed!")
 
-        # The i.MX25 manual lies.  This is the SUCCESS ACK! The error
-        # acknowledge is no response after 0x56787856, but the manual
-        # says it's the other way around...
-        if ack != ACK_WRITE_SUCCESS:
-            raise CommandResponseError("Received unexpected status instead "
-                                       "of ACK: 0x%08X" % ack)
-        
-    def write_file(self, filetype, address, length, stream, progress_callback = None):
+        _check_write_ack(ack)
+
+    def write_memory_batch(self, entries, window = None):
+        """
+        Write ``entries``, a sequence of ``(address, value, datasize)``
+        tuples as read from a memory initialization file, in order.
+
+        Unlike calling :meth:`write_memory` for each entry, up to ``window``
+        commands are sent ahead of their responses (default: from
+        :data:`WRITE_BATCH_WINDOWS` for the channel type), and the ACK and
+        write status words are then matched to the entries in order.
+
+        If a write fails, :exc:`WriteMemoryBatchError` is raised for the
+        first failing entry.  Commands already sent after it may still have
+        been carried out; their responses are read and discarded first (for
+        up to :data:`WRITE_BATCH_DRAIN_TIMEOUT` seconds), so that they are
+        not taken for the responses to the next command.
+        """
+        entries = list(entries)
+        if window is None:
+            window = WRITE_BATCH_WINDOWS.get(self.channel.chantype, 1)
+        if window < 1:
+            raise ValueError("write_memory_batch: window must be at least 1")
+
+        # Check every entry before sending anything.
+        commands = [_write_memory_command(address, datasize, value)
+                    for address, value, datasize in entries]
+
+        sent = 0
+        for index, entry in enumerate(entries):
+            if sent < len(commands) and sent - index < window:
+                end = min(len(commands), index + window)
+                self.channel.write(b"".join(commands[sent:end]))
+                sent = end
+
+            # A failed write is not acknowledged, so the next entry's ACK
+            # (or a timeout) arrives in place of its write status.
+            try:
+                _check_ack(self._read_status())
+                _check_write_ack(self._read_status())
+            except (CommandResponseError, ChannelTimeout) as err:
+                self._drain_statuses(_batch_outstanding(index, sent))
+                raise WriteMemoryBatchError(index, entry, err)
+
+    def _drain_statuses(self, count, timeout = WRITE_BATCH_DRAIN_TIMEOUT):
+        """
+        Read and discard up to ``count`` status words, stopping early once
+        the device has nothing more to send or ``timeout`` seconds pass.
+        """
+        deadline = time.time() + timeout
+        for _ in range(count):
+            if time.time() >= deadline:
+                break
+            try:
+                self._read_status()
+            except (CommandResponseError, ChannelTimeout):
+                break
+
+    def write_file(self, filetype, address, length, stream,
+                   progress_callback = None,
+                   chunk_size = None,
+                   progress_interval = DEFAULT_PROGRESS_INTERVAL):
         """
         Write ``length`` bytes from the file-like object ``stream`` to the memory
         starting at ``address``.  ``filetype`` must be specified and may be one of:
 
         * :const:`FILE_TYPE_APPLICATION` -- a binary application to be executed
-        * :const:`FILE_TYPE_DCD` -- used in secure boot mode
+        * :const:`FILE_TYPE_LOAD_ONLY` -- data to be loaded, not executed
+        * :const:`FILE_TYPE_DCD` -- device configuration data (see :meth:`write_dcd`)
         * :const:`FILE_TYPE_CSF` -- used in secure boot mode
 
         If ``filetype`` is :const:`FILE_TYPE_APPLICATION`, you must call
         :meth:`complete_boot` to trigger execution.
-        """
-        if not (UINT32_MIN <= address <= UINT32_MAX):
-            raise ValueError("Write start address must be a 32-bit integer")
 
-        if not (UINT32_MIN <= length <= UINT32_MAX):
-            raise ValueError("Write length must be a 32-bit integer")
+        ``stream`` is sent in chunks of ``chunk_size`` bytes, by default
+        sized to the channel (see :data:`WRITE_FILE_CHUNK_SIZES`), read with
+        ``readinto`` if the stream has it.  ``progress_callback(current,
+        total)`` is called at most every ``progress_interval`` seconds, and
+        once the whole file is sent.
+        """
+        if chunk_size is None:
+            chunk_size = _write_file_chunk_size(self.channel)
+        progress_callback = _rate_limited(progress_callback, progress_interval)
 
-        command = struct.pack(">HIxI4xB", CMD_WRITE_FILE, address, length, filetype)
-        self._write_command(command)
+        self._write_command(_write_file_command(filetype, address, length))
         self._read_ack()
 
         bytes_consumed = 0
-        chunk_size = 1024
-
-        while bytes_consumed < length:
-            chunk = stream.read(chunk_size)
-            if chunk == b"":
-                raise ValueError("File stream ends early after %u "
-                                 "bytes consumed." % bytes_consumed)
-            bytes_consumed += len(chunk)
+        for chunk in _file_chunks(stream, length, chunk_size):
             self.channel.write(chunk)
+            bytes_consumed += len(chunk)
 
             if progress_callback:
                 progress_callback(bytes_consumed, length)
@@ -290,28 +688,49 @@ class SerialBootProtocol(object):
         # sending 16 additional bytes of data.
         # This is done in _complete_boot().
         if FILE_TYPE_APPLICATION == filetype:
-            # HACK: The i.MX25 USB implementation does not
-            # like writing files that are multiples of 64 bytes!
-            # This will cause _complete_boot() to time out waiting
-            # for a response.  To fix this for now,
-            # push out one more byte before trying to read
-            # the damn status (which should be 0x88888888).
-            if 0 == (bytes_consumed % 64):
-                self.channel.write(b"\x00")
+            padding = _file_padding(bytes_consumed)
+            if padding:
+                self.channel.write(padding)
 
             self._complete_boot()
 
+    def load_file(self, address, length, stream, **kwargs):
+        """
+        Write ``length`` bytes from ``stream`` to memory at ``address`` as a
+        :const:`FILE_TYPE_LOAD_ONLY` file with :meth:`write_file`, which
+        is passed ``kwargs``, and check the status the ROM sends once the
+        data is in memory.  Left unread, that status would be taken as the
+        response to the next command.
+        """
+        self.write_file(FILE_TYPE_LOAD_ONLY, address, length, stream, **kwargs)
+        # The same i.MX25 USB workaround as for applications.
+        padding = _file_padding(length)
+        if padding:
+            self.channel.write(padding)
+        _check_load_complete(self._read_status())
+
+    def write_dcd(self, address, entries, dcd_format):
+        """
+        Send memory initialization ``entries`` (see :func:`encode_dcd`) to
+        the ROM as a single DCD in ``dcd_format``, staged at ``address``
+        (usually internal RAM), instead of one :meth:`write_memory` round
+        trip per entry.
+
+        :exc:`CommandResponseError` is raised if the ROM does not accept
+        the DCD; the entries can then be written one at a time with
+        :meth:`write_memory`.
+        """
+        dcd = encode_dcd(entries, dcd_format)
+        self.write_file(FILE_TYPE_DCD, address, len(dcd), io.BytesIO(dcd))
+        _check_write_ack(self._read_status())
+
     def reenumerate_usb(self, serialnum):
         """
         Force re-enumeration of USB PHY with serial number ``serialnum``
         """
-        if len(serialnum) != 4:
-            raise ValueError("Invalid serial number")
-
-        command = struct.pack(">H7x4s", CMD_REENUMERATE_USB, serialnum)
-        self._write_command(command)
+        self._write_command(_reenumerate_usb_command(serialnum))
         resp = self.channel.read(4)
-        if resp != b"\x89\x23\x23\x89":
+        if resp != REENUMERATE_USB_RESPONSE:
             raise CommandResponseError("Invalid re-enumerate response: %r" % resp)
 
     def _complete_boot(self):
@@ -322,10 +741,4 @@ class SerialBootProtocol(object):
         """
         # You can write anything, as long as it's 16 bytes, and it will
         # move along the boot process.
-        status = self.get_status()
-
-        if status != BOOT_PROTOCOL_COMPLETE:
-            raise CommandResponseError("Expected boot protocol completion code 0x88888888, "
-                                       ", got 0x%08X instead!" % status)
-
-        return status
+        return _check_boot_complete(self.get_status())
@@ -0,0 +1,157 @@
+# Copyright (c) 2012-2013 Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Boot plans: load several images into memory through the boot ROM and
+execute only the last, e.g. a kernel, device tree and initramfs booted
+straight from SDRAM.
+"""
+import os
+import functools
+import collections
+
+from pyatk import boot
+
+#: An image file ``path`` of ``size`` bytes to be loaded at ``address``.
+BootImage = collections.namedtuple("BootImage", ("path", "address", "size"))
+
+class BootPlanError(ValueError):
+    """ An image that cannot be added to a :class:`BootPlan`. """
+    pass
+
+def parse_image_spec(spec):
+    """
+    Split a ``FILE@ADDRESS`` image specification into the tuple
+    ``(path, address)``.  The last ``@`` separates the two, so ``FILE``
+    may itself contain one.
+    """
+    path, separator, address = spec.rpartition("@")
+    if not separator or not path:
+        raise BootPlanError("Expected FILE@ADDRESS, got %r" % (spec,))
+
+    try:
+        return path, int(address, 0)
+    except ValueError:
+        raise BootPlanError("Invalid load address %r in %r" % (address, spec))
+
+class BootPlan(object):
+    """
+    An ordered list of images to load.  Every image but the last is loaded
+    without being executed; the boot ROM jumps to the last one.
+
+    If ``sdram_only`` is set, every image must lie in the SDRAM window of
+    ``bsp_info``; otherwise images may go anywhere, such as internal RAM.
+    Images may never overlap each other.
+    """
+    def __init__(self, bsp_info = None, sdram_only = False):
+        self.bsp_info = bsp_info
+        self.sdram_only = sdram_only
+        #: The :class:`BootImage` objects, in load order.
+        self.images = []
+
+    @property
+    def entry_point(self):
+        """ The address the boot ROM jumps to: the last image's. """
+        if not self.images:
+            return None
+        return self.images[-1].address
+
+    @property
+    def total_size(self):
+        """ Total bytes to be uploaded. """
+        return sum(image.size for image in self.images)
+
+    def add(self, path, address):
+        """
+        Append the image file at ``path`` to be loaded at ``address``, and
+        return its :class:`BootImage`.  :exc:`BootPlanError` is raised if the
+        file is empty or cannot be read, or if the image does not fit in
+        memory or overlaps an image already in the plan.
+        """
+        try:
+            size = os.stat(path).st_size
+        except OSError as err:
+            raise BootPlanError("Cannot read image %r: %s" % (path, err))
+
+        if not size:
+            raise BootPlanError("Image %r is empty" % (path,))
+
+        end = address + size - 1
+        if address < boot.UINT32_MIN or end > boot.UINT32_MAX:
+            raise BootPlanError("Image %r (%u bytes) does not fit at 0x%X" % (path, size, address))
+
+        bsp_info = self.bsp_info
+        if self.sdram_only and bsp_info is not None and not (
+                bsp_info.base_memory_address <= address and
+                end <= bsp_info.memory_bottom_address):
+            raise BootPlanError(
+                "Image %r at 0x%08X-0x%08X is outside SDRAM (0x%08X-0x%08X)" % (
+                    path, address, end,
+                    bsp_info.base_memory_address, bsp_info.memory_bottom_address))
+
+        for other in self.images:
+            if address <= other.address + other.size - 1 and other.address <= end:
+                raise BootPlanError(
+                    "Image %r at 0x%08X-0x%08X overlaps %r at 0x%08X-0x%08X" % (
+                        path, address, end,
+                        other.path, other.address, other.address + other.size - 1))
+
+        image = BootImage(path, address, size)
+        self.images.append(image)
+        return image
+
+    def execute(self, sbp, progress_callback = None):
+        """
+        Upload every image through :class:`~pyatk.boot.SerialBootProtocol`
+        ``sbp`` and start the last one.  Each file is streamed to the device
+        through one reusable buffer (see
+        :meth:`~pyatk.boot.SerialBootProtocol.write_file`), not read into
+        memory whole.
+
+        If given, ``progress_callback(image, current, total)`` is called as
+        each image is uploaded.
+        """
+        if not self.images:
+            raise BootPlanError("Boot plan has no images")
+
+        for index, image in enumerate(self.images):
+            if index == len(self.images) - 1:
+                upload = functools.partial(sbp.write_file, boot.FILE_TYPE_APPLICATION)
+            else:
+                # Also reads the status the ROM sends after the data.
+                upload = sbp.load_file
+
+            if progress_callback:
+                def image_progress(current, total, image = image):
+                    progress_callback(image, current, total)
+            else:
+                image_progress = None
+
+            with open(image.path, "rb") as image_fp:
+                # The file may have changed since it was added.
+                size = os.fstat(image_fp.fileno()).st_size
+                if size != image.size:
+                    raise BootPlanError("Image %r changed size from %u to %u bytes" % (
+                        image.path, image.size, size))
+
+                upload(image.address, image.size, image_fp,
+                       progress_callback = image_progress)
@@ -23,6 +23,8 @@
 
 import sys
 import collections
+
+from pyatk import boot
 if sys.version_info > (3, 0):
     from configparser import ConfigParser
     from configparser import NoOptionError
@@ -62,9 +64,59 @@ BoardSupportInfo = collections.namedtuple(
         "usb_vid",
         # USB product ID
         "usb_pid",
+
+        # UART baud rate
+        "uart_baudrate",
+        # UART read timeout, in seconds
+        "uart_read_timeout",
+        # UART inter-byte timeout, in seconds (None to disable)
+        "uart_inter_byte_timeout",
+        # Enable the serial driver's low-latency mode (Linux only)
+        "uart_low_latency",
+
+        # Longest wait, in seconds, for a USB board to reappear after it
+        # re-enumerates
+        "reopen_timeout",
+        # Longest wait, in seconds, for the RAM kernel to answer getver
+        # (e.g. while it finishes a flash operation)
+        "kernel_ready_timeout",
+        # Longest wait, in seconds, for the boot ROM to answer get_status
+        # after a reset
+        "boot_ready_timeout",
+
+        # Device Configuration Data format supported by the boot ROM
+        # (boot.DCD_FORMAT_V1 or boot.DCD_FORMAT_HAB4), or None to write
+        # the memory initialization table one register at a time
+        "dcd_format",
+        # Address to stage the DCD at (internal RAM)
+        "dcd_address",
+
+        # First RAM kernel fuse address of the processor's unique ID, or
+        # None if it is not known for this BSP
+        "uid_fuse_address",
+        # Number of fuse rows in the unique ID
+        "uid_fuse_count",
     )
 )
-BSI = lambda *args: BoardSupportInfo._make(args)
+
+# The UART settings, readiness limits and DCD settings are optional.  These
+# are their defaults, in field order; they must be the last fields.
+_FIELD_DEFAULTS = collections.OrderedDict([
+    ("uart_baudrate",           115200),
+    ("uart_read_timeout",       5),
+    ("uart_inter_byte_timeout", None),
+    ("uart_low_latency",        False),
+    ("reopen_timeout",          10),
+    ("kernel_ready_timeout",    5),
+    ("boot_ready_timeout",      5),
+    ("dcd_format",              None),
+    ("dcd_address",             None),
+    ("uid_fuse_address",        None),
+    ("uid_fuse_count",          8),
+])
+assert BoardSupportInfo._fields[-len(_FIELD_DEFAULTS):] == tuple(_FIELD_DEFAULTS)
+BoardSupportInfo.__new__.__defaults__ = tuple(_FIELD_DEFAULTS.values())
+BSI = lambda *args: BoardSupportInfo(*args)
 
 def load_board_support_table(info_filename_list):
     """
@@ -104,7 +156,36 @@ def load_board_support_table(info_filename_list):
         bsp_usb_vid = getint("usb_vid")
         bsp_usb_pid = getint("usb_pid")
 
-        new_bsp_info = BSI(
+        def getoptional(key, conv):
+            try:
+                return conv(reader.get(section, key))
+            except NoOptionError:
+                return _FIELD_DEFAULTS[key]
+
+        optional = {}
+        for key, conv in (("uart_baudrate",           lambda v: int(v, 0)),
+                          ("uart_read_timeout",       float),
+                          ("uart_inter_byte_timeout", float),
+                          ("uart_low_latency",        lambda v: reader.getboolean(section, "uart_low_latency")),
+                          ("reopen_timeout",          float),
+                          ("kernel_ready_timeout",    float),
+                          ("boot_ready_timeout",      float),
+                          ("dcd_format",              lambda v: v.lower()),
+                          ("dcd_address",             lambda v: int(v, 0)),
+                          ("uid_fuse_address",        lambda v: int(v, 0)),
+                          ("uid_fuse_count",          lambda v: int(v, 0))):
+            optional[key] = getoptional(key, conv)
+
+        bsp_dcd_format = optional["dcd_format"]
+        bsp_dcd_address = optional["dcd_address"]
+        if bsp_dcd_format is not None:
+            if bsp_dcd_format not in boot.DCD_FORMATS:
+                raise ValueError("BSP %r: unknown dcd_format %r (expected one of %s)" % (
+                    bsp_name, bsp_dcd_format, ", ".join(boot.DCD_FORMATS)))
+            if bsp_dcd_address is None:
+                raise ValueError("BSP %r: dcd_format requires dcd_address" % (bsp_name,))
+
+        new_bsp_info = BoardSupportInfo(
             bsp_desc,
             bsp_base_addr,
             bsp_bottom_addr,
@@ -113,6 +194,7 @@ def load_board_support_table(info_filename_list):
             bsp_ram_kernel_origin,
             bsp_usb_vid,
             bsp_usb_pid,
+            **optional
         )
 
         new_bsp_table[bsp_name] = new_bsp_info
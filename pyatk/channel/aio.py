@@ -0,0 +1,277 @@
+# Copyright (c) 2012-2013 Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+asyncio ATK communications channel interface and adapters for the
+blocking channel implementations.
+
+Requires Python 3.7 or later.
+"""
+import os
+import errno
+import asyncio
+import concurrent.futures
+
+from pyatk.channel import base
+
+# Largest single read from a file descriptor.
+_FD_READ_SIZE = 4096
+
+class AsyncATKChannelI(object):
+    """
+    The coroutine counterpart of :class:`~pyatk.channel.base.ATKChannelI`.
+    """
+    def __init__(self):
+        self._ramkernel_channel_type = base.CHANNEL_TYPE_UART
+
+    @property
+    def chantype(self):
+        """ Return the RAM kernel channel type, as an integer. """
+        return self._ramkernel_channel_type
+
+    async def open(self):
+        """
+        Open the communication channel.
+        """
+        raise NotImplementedError()
+
+    async def close(self):
+        """
+        Close the communication channel.
+        """
+        raise NotImplementedError()
+
+    async def read(self, length):
+        """
+        Read exactly ``length`` bytes from the underlying ATK communication
+        channel.  :exc:`~pyatk.channel.base.ChannelReadTimeout` is raised if
+        ``length`` bytes could not be read.
+        """
+        raise NotImplementedError()
+
+    async def write(self, data):
+        """
+        Write ``data`` binary string to the underlying ATK communication
+        channel.
+        """
+        raise NotImplementedError()
+
+class ThreadedChannelAdapter(AsyncATKChannelI):
+    """
+    Adapt a blocking :class:`~pyatk.channel.base.ATKChannelI` by running its
+    operations on a private worker thread, one at a time, in the order they
+    are awaited.
+    """
+    def __init__(self, channel):
+        super(ThreadedChannelAdapter, self).__init__()
+        self.channel = channel
+        self._ramkernel_channel_type = channel.chantype
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def open(self):
+        await self._call(self.channel.open)
+
+    async def close(self):
+        try:
+            await self._call(self.channel.close)
+        finally:
+            self._executor.shutdown(wait = False)
+
+    async def read(self, length):
+        return await self._call(self.channel.read, length)
+
+    async def write(self, data):
+        await self._call(self.channel.write, data)
+
+class AsyncUSBChannel(ThreadedChannelAdapter):
+    """
+    asyncio adapter for :class:`~pyatk.channel.usbdev.USBChannel`.  libusb
+    I/O is blocking, so each channel gets a worker thread.
+    """
+    pass
+
+class DirectChannelAdapter(AsyncATKChannelI):
+    """
+    Adapt a channel whose operations never block, such as
+    :class:`~pyatk.tests.mockchannel.MockChannel`.  Each operation yields
+    to the event loop once so that sessions on several channels interleave.
+    """
+    def __init__(self, channel):
+        super(DirectChannelAdapter, self).__init__()
+        self.channel = channel
+        self._ramkernel_channel_type = channel.chantype
+
+    async def open(self):
+        self.channel.open()
+
+    async def close(self):
+        self.channel.close()
+
+    async def read(self, length):
+        await asyncio.sleep(0)
+        return self.channel.read(length)
+
+    async def write(self, data):
+        await asyncio.sleep(0)
+        self.channel.write(data)
+
+class AsyncFdChannel(AsyncATKChannelI):
+    """
+    A channel on a POSIX file descriptor (serial port, pseudo-terminal),
+    driven by the event loop's reader and writer callbacks rather than by
+    blocking reads.
+    """
+    def __init__(self, fd = None, read_timeout = 5):
+        super(AsyncFdChannel, self).__init__()
+        self.fd = None
+        #: Seconds to wait for a complete read before timing out.
+        self.read_timeout = read_timeout
+
+        self._loop = None
+        self._read_buffer = bytearray()
+        self._read_waiter = None
+        self._read_error = None
+
+        if fd is not None:
+            self._attach(fd)
+
+    def _attach(self, fd):
+        self._loop = asyncio.get_running_loop()
+        self.fd = fd
+        os.set_blocking(fd, False)
+        self._loop.add_reader(fd, self._on_readable)
+
+    def _detach(self):
+        if self.fd is not None:
+            self._loop.remove_reader(self.fd)
+            self.fd = None
+
+    def _wake_reader(self):
+        if self._read_waiter is not None and not self._read_waiter.done():
+            self._read_waiter.set_result(None)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.fd, _FD_READ_SIZE)
+        except OSError as err:
+            if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            data = b""
+            self._read_error = err
+
+        if not data:
+            # End of file (or a hangup on a pty); nothing more will arrive.
+            if self._read_error is None:
+                self._read_error = IOError("Channel closed by peer.")
+            self._loop.remove_reader(self.fd)
+
+        self._read_buffer += data
+        self._wake_reader()
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        self._detach()
+
+    async def read(self, length):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.read_timeout
+
+        while len(self._read_buffer) < length:
+            remaining = deadline - loop.time()
+            if remaining <= 0 or self._read_error is not None:
+                data = bytes(self._read_buffer)
+                del self._read_buffer[:]
+                raise base.ChannelReadTimeout(length, data)
+
+            self._read_waiter = loop.create_future()
+            try:
+                await asyncio.wait_for(self._read_waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._read_waiter = None
+
+        data = bytes(self._read_buffer[:length])
+        del self._read_buffer[:length]
+        return data
+
+    async def write(self, data):
+        loop = asyncio.get_running_loop()
+        view = memoryview(data)
+        while len(view) > 0:
+            try:
+                written = os.write(self.fd, view)
+                view = view[written:]
+                continue
+            except OSError as err:
+                if err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    raise
+
+            # The output buffer is full; wait until it drains.
+            writable = loop.create_future()
+            loop.add_writer(self.fd, writable.set_result, None)
+            try:
+                await writable
+            finally:
+                loop.remove_writer(self.fd)
+
+        # A fast port may never push back; yield anyway so that other
+        # sessions on the loop run between the chunks of a long transfer.
+        await asyncio.sleep(0)
+
+class AsyncUARTChannel(AsyncFdChannel):
+    """
+    asyncio adapter for :class:`~pyatk.channel.uart.UARTChannel` on POSIX
+    systems.  The port is configured by the wrapped channel; data is
+    then moved directly on its file descriptor; the channel's read-ahead
+    thread, if configured, is not used.
+    """
+    def __init__(self, uart_channel):
+        super(AsyncUARTChannel, self).__init__(read_timeout = uart_channel.read_timeout)
+        self.uart_channel = uart_channel
+        self._ramkernel_channel_type = uart_channel.chantype
+
+    async def open(self):
+        self.uart_channel._open_port()
+        self._attach(self.uart_channel.port.fileno())
+
+    async def close(self):
+        self._detach()
+        self.uart_channel.port.close()
+
+def async_channel(channel):
+    """
+    Return an :class:`AsyncATKChannelI` adapter for the blocking channel
+    ``channel``.
+    """
+    from pyatk.channel import uart
+
+    if isinstance(channel, uart.UARTChannel) and os.name == "posix":
+        return AsyncUARTChannel(channel)
+
+    return ThreadedChannelAdapter(channel)
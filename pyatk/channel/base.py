@@ -64,6 +64,18 @@ class ATKChannelI(object):
         """
         raise NotImplementedError()
 
+    def readinto(self, buf):
+        """
+        Read up to ``len(buf)`` bytes into the writable byte buffer ``buf``,
+        returning the number of bytes stored.  Channels that can receive
+        straight into a buffer override this; the default copies the
+        result of :meth:`read`.
+        """
+        view = memoryview(buf)
+        data = self.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+
     def write(self, data):
         """
         Write ``data`` binary string to underlying ATK communication
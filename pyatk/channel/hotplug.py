@@ -0,0 +1,295 @@
+# Copyright (c) 2012-2013 Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+USB hotplug monitoring, used to reconnect to a board as soon as it
+re-enumerates instead of polling the bus.
+
+Two event sources are available: libusb hotplug callbacks (through
+python-libusb1, where libusb supports them) and, on Linux, the kernel's
+uevent netlink socket.  :func:`create_monitor` picks the best one.
+"""
+import sys
+import time
+import socket
+import threading
+import collections
+
+try:
+    import usb1
+except ImportError:
+    usb1 = None
+
+#: A USB device arrival.  ``port_numbers`` is a tuple of port numbers from
+#: the root hub to the device, or ``None`` if the source cannot tell.
+HotplugEvent = collections.namedtuple(
+    "HotplugEvent", ("vid", "pid", "bus", "address", "port_numbers")
+)
+
+# Interval at which the monitor threads check whether to stop, in seconds.
+_POLL_INTERVAL = 0.1
+
+# Largest number of unconsumed arrivals kept.
+_MAX_PENDING_EVENTS = 64
+
+class HotplugUnavailableError(Exception):
+    """ A hotplug event source is not available on this system. """
+    pass
+
+class HotplugMonitor(object):
+    """
+    Base class for device arrival monitors.  Event sources call
+    :meth:`_post` (from any thread) for each device that arrives;
+    consumers call :meth:`wait_for_arrival`.
+
+    Arrivals are queued from the moment the monitor is started, so a
+    device that arrives before anyone starts waiting is not missed.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._events = collections.deque(maxlen = _MAX_PENDING_EVENTS)
+
+    def start(self):
+        """ Start monitoring. """
+        raise NotImplementedError()
+
+    def stop(self):
+        """ Stop monitoring and release any resources. """
+        raise NotImplementedError()
+
+    def clear(self):
+        """ Discard any arrivals not yet consumed. """
+        with self._cond:
+            self._events.clear()
+
+    def _post(self, event):
+        with self._cond:
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def wait_for_arrival(self, match, timeout):
+        """
+        Wait up to ``timeout`` seconds for a device arrival for which
+        ``match(event)`` is true, consuming arrivals as they are examined.
+        Return the :class:`HotplugEvent`, or ``None`` on timeout.
+        """
+        with self._cond:
+            deadline = time.time() + timeout
+            while True:
+                while self._events:
+                    event = self._events.popleft()
+                    if match(event):
+                        return event
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+class LibusbHotplugMonitor(HotplugMonitor):
+    """
+    Device arrivals reported by libusb hotplug callbacks.  Requires
+    python-libusb1 and a libusb build with hotplug support.
+    """
+    def __init__(self, vid = None, pid = None):
+        super(LibusbHotplugMonitor, self).__init__()
+        if usb1 is None:
+            raise HotplugUnavailableError("libusb hotplug requires python-libusb1.")
+
+        self.vid = vid
+        self.pid = pid
+        try:
+            self._context = usb1.USBContext()
+        except usb1.USBError as err:
+            raise HotplugUnavailableError("Cannot create libusb context: %s" % (err,))
+        if not self._context.hasCapability(usb1.CAP_HAS_HOTPLUG):
+            self._context.close()
+            raise HotplugUnavailableError("libusb was built without hotplug support.")
+
+        self._handle = None
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        kwargs = {}
+        if self.vid is not None:
+            kwargs["vendor_id"] = self.vid
+        if self.pid is not None:
+            kwargs["product_id"] = self.pid
+
+        try:
+            self._handle = self._context.hotplugRegisterCallback(
+                self._callback, events = usb1.HOTPLUG_EVENT_DEVICE_ARRIVED,
+                flags = 0, **kwargs)
+        except usb1.USBError as err:
+            self._context.close()
+            raise HotplugUnavailableError("Cannot register hotplug callback: %s" % (err,))
+
+        self._running = True
+        self._thread = threading.Thread(target = self._run, name = "pyatk-hotplug")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            self._context.handleEventsTimeout(_POLL_INTERVAL)
+
+    def _callback(self, context, device, event):
+        try:
+            port_numbers = tuple(device.getPortNumberList())
+        except usb1.USBError:
+            port_numbers = None
+
+        self._post(HotplugEvent(device.getVendorID(), device.getProductID(),
+                                device.getBusNumber(), device.getDeviceAddress(),
+                                port_numbers))
+        # Stay registered.
+        return False
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._handle is not None:
+            self._context.hotplugDeregisterCallback(self._handle)
+            self._handle = None
+        self._context.close()
+
+# From <linux/netlink.h>.
+_NETLINK_KOBJECT_UEVENT = 15
+# Kernel (as opposed to udev) uevent multicast group.
+_UEVENT_KERNEL_GROUP = 1
+
+def parse_uevent(message):
+    """
+    Parse a kernel uevent ``message`` (as read from the netlink socket).
+    Return a :class:`HotplugEvent` if it announces a new USB device,
+    otherwise ``None``.
+    """
+    fields = {}
+    for line in message.split(b"\0")[1:]:
+        key, sep, value = line.partition(b"=")
+        if sep:
+            fields[key] = value
+
+    if (fields.get(b"ACTION") != b"add" or fields.get(b"SUBSYSTEM") != b"usb" or
+        fields.get(b"DEVTYPE") != b"usb_device"):
+        return None
+
+    try:
+        # PRODUCT is "vid/pid/bcdDevice" in hex, without leading zeros.
+        vid, pid = [int(field, 16) for field in fields[b"PRODUCT"].split(b"/")[:2]]
+        bus = int(fields[b"BUSNUM"], 10)
+        address = int(fields[b"DEVNUM"], 10)
+    except (KeyError, ValueError):
+        return None
+
+    # The last DEVPATH component is the kernel device name, "BUS-PORT.PORT...".
+    port_numbers = None
+    name = fields.get(b"DEVPATH", b"").rsplit(b"/", 1)[-1]
+    _, sep, ports = name.partition(b"-")
+    if sep:
+        try:
+            port_numbers = tuple(int(port) for port in ports.split(b"."))
+        except ValueError:
+            pass
+
+    return HotplugEvent(vid, pid, bus, address, port_numbers)
+
+class NetlinkHotplugMonitor(HotplugMonitor):
+    """
+    Device arrivals read from the Linux kernel uevent netlink socket.  No
+    extra packages or privileges are needed.
+
+    The kernel announces a device before udev has applied its permission
+    rules, so opening the device may still fail for a short while after
+    an arrival is reported.
+    """
+    def __init__(self):
+        super(NetlinkHotplugMonitor, self).__init__()
+        if not sys.platform.startswith("linux"):
+            raise HotplugUnavailableError("Netlink uevents are only available on Linux.")
+
+        self._socket = None
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                                 _NETLINK_KOBJECT_UEVENT)
+            sock.bind((0, _UEVENT_KERNEL_GROUP))
+        except (AttributeError, socket.error) as err:
+            raise HotplugUnavailableError("Cannot open uevent socket: %s" % (err,))
+
+        sock.settimeout(_POLL_INTERVAL)
+        self._socket = sock
+        self._running = True
+        self._thread = threading.Thread(target = self._run, name = "pyatk-hotplug")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            try:
+                message = self._socket.recv(8192)
+            except socket.timeout:
+                continue
+            except socket.error:
+                # Receive buffer overrun; later events still arrive.
+                continue
+
+            event = parse_uevent(message)
+            if event is not None:
+                self._post(event)
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+def create_monitor(vid = None, pid = None):
+    """
+    Create and start the best hotplug monitor available on this system for
+    devices matching ``vid`` and ``pid`` (``None`` matches any).  Return
+    ``None`` if no hotplug source is available.
+    """
+    factories = [lambda: LibusbHotplugMonitor(vid, pid)]
+    if sys.platform.startswith("linux"):
+        factories.append(NetlinkHotplugMonitor)
+
+    for factory in factories:
+        try:
+            monitor = factory()
+            monitor.start()
+            return monitor
+        except HotplugUnavailableError:
+            continue
+
+    return None
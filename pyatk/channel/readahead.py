@@ -0,0 +1,137 @@
+# Copyright (c) 2012-2013 Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Background read-ahead for stream channels.
+"""
+import time
+import threading
+
+from pyatk.channel import base
+from pyatk.channel.ringbuffer import RingBuffer
+
+#: Default read-ahead buffer size, in bytes.  Large enough to hold a
+#: full-size RAM kernel flash dump response at high baud rates.
+DEFAULT_READ_AHEAD_SIZE = 256 * 1024
+
+class ReadAheadReader(object):
+    """
+    Continuously drain a byte stream into a bounded :class:`RingBuffer` on a
+    background thread, so that data is pulled off the device as soon as it
+    arrives rather than when the protocol layer next asks for it.
+
+    ``read_func(max_length)`` is called repeatedly on the reader thread.  It
+    must return at most ``max_length`` bytes and should return ``b""`` after
+    a short timeout if nothing arrives, so that :meth:`stop` takes effect
+    promptly.  When the buffer is full the reader thread stops reading until
+    the consumer catches up; the device's own buffering (and flow control,
+    if any) applies in the meantime.
+    """
+    def __init__(self, read_func, capacity = DEFAULT_READ_AHEAD_SIZE):
+        self.read_func = read_func
+        self.buffer = RingBuffer(capacity)
+
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        # Exception raised by read_func, re-raised in the consumer.
+        self._error = None
+
+    def start(self):
+        """ Start the reader thread. """
+        if self._thread is not None:
+            return
+
+        self._running = True
+        self._error = None
+        self._thread = threading.Thread(target = self._run, name = "pyatk-read-ahead")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stop the reader thread and discard any buffered data. """
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self.buffer.clear()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and self.buffer.free == 0:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                free = self.buffer.free
+
+            try:
+                data = self.read_func(free)
+            except Exception as err:
+                with self._cond:
+                    self._error = err
+                    self._running = False
+                    self._cond.notify_all()
+                return
+
+            if data:
+                with self._cond:
+                    self.buffer.write(data)
+                    self._cond.notify_all()
+
+    def read(self, length, timeout, inter_byte_timeout = None):
+        """
+        Read exactly ``length`` bytes, waiting at most ``timeout`` seconds
+        in total, and at most ``inter_byte_timeout`` seconds (if not
+        ``None``) for more data once some has been received.
+        :exc:`~pyatk.channel.base.ChannelReadTimeout` is raised (with
+        whatever data did arrive) if either deadline passes first.
+        """
+        result = bytearray(length)
+        view = memoryview(result)
+        received = 0
+        overall_deadline = time.time() + timeout
+        deadline = overall_deadline
+
+        with self._cond:
+            while True:
+                if len(self.buffer) > 0:
+                    received += self.buffer.readinto(view[received:])
+                    # Let the reader thread refill the space just freed.
+                    self._cond.notify_all()
+                    if inter_byte_timeout is not None:
+                        deadline = min(overall_deadline, time.time() + inter_byte_timeout)
+                if received == length:
+                    return bytes(result)
+
+                if self._error is not None:
+                    raise IOError("Read-ahead failed: %s" % self._error)
+
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self._running:
+                    raise base.ChannelReadTimeout(length, bytes(result[:received]))
+
+                self._cond.wait(remaining)
@@ -0,0 +1,127 @@
+# Copyright (c) 2012-2013 Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Fixed-size byte ring buffer used by the channel implementations to hold
+data received ahead of the protocol layer asking for it.
+"""
+
+class RingBufferOverflow(Exception):
+    """ Exception raised when writing more data than a ring buffer can hold. """
+    pass
+
+class RingBuffer(object):
+    """
+    A preallocated, fixed-capacity FIFO of bytes.
+
+    Data is copied in and out through :class:`memoryview` slices of a single
+    :class:`bytearray`, so neither writing nor reading allocates intermediate
+    strings, and the cost of each operation is linear in the amount of data
+    moved (never in the amount of data buffered).
+    """
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("Ring buffer capacity must be positive.")
+
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        # Index of the oldest byte in the buffer.
+        self._head = 0
+        # Number of bytes currently stored.
+        self._count = 0
+
+    @property
+    def capacity(self):
+        """ Total number of bytes the buffer can hold. """
+        return len(self._buffer)
+
+    @property
+    def free(self):
+        """ Number of bytes that can be written before the buffer is full. """
+        return len(self._buffer) - self._count
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        """ Discard all buffered data. """
+        self._head = 0
+        self._count = 0
+
+    def write(self, data):
+        """
+        Append the bytes-like object ``data`` to the buffer.
+
+        :exc:`RingBufferOverflow` is raised (and nothing is written) if
+        ``data`` does not fit in the remaining free space.
+        """
+        data = memoryview(data)
+        length = len(data)
+        if length > self.free:
+            raise RingBufferOverflow("Cannot buffer %u bytes; only %u bytes free." %
+                                     (length, self.free))
+
+        capacity = len(self._buffer)
+        tail = (self._head + self._count) % capacity
+        # The write may wrap around the end of the buffer, in which case
+        # it is done in two pieces.
+        first = min(length, capacity - tail)
+        self._view[tail:tail + first] = data[:first]
+        if first < length:
+            self._view[:length - first] = data[first:]
+
+        self._count += length
+        return length
+
+    def readinto(self, buf):
+        """
+        Move up to ``len(buf)`` bytes from the buffer into the writable
+        bytes-like object ``buf``.  Return the number of bytes moved.
+        """
+        buf = memoryview(buf)
+        length = min(len(buf), self._count)
+
+        capacity = len(self._buffer)
+        first = min(length, capacity - self._head)
+        buf[:first] = self._view[self._head:self._head + first]
+        if first < length:
+            buf[first:length] = self._view[:length - first]
+
+        self._consume(length)
+        return length
+
+    def read(self, length):
+        """
+        Remove and return up to ``length`` bytes from the buffer as a
+        :class:`bytes` object.
+        """
+        result = bytearray(min(length, self._count))
+        self.readinto(result)
+        return bytes(result)
+
+    def _consume(self, length):
+        self._count -= length
+        if self._count == 0:
+            # Rewind when empty so subsequent writes are contiguous.
+            self._head = 0
+        else:
+            self._head = (self._head + length) % len(self._buffer)
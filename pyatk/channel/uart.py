@@ -21,38 +21,97 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import time
+
 import serial
 
 from pyatk.channel import base
+from pyatk.channel.readahead import ReadAheadReader, DEFAULT_READ_AHEAD_SIZE
+
+# Serial port timeout used by the read-ahead thread; it only bounds how
+# long close() waits for the thread to notice it should stop.
+_READ_AHEAD_POLL_TIMEOUT = 0.05
+
+#: Default baud rate; every i.MX serial bootloader supports it.
+DEFAULT_BAUDRATE = 115200
+#: Default read timeout, in seconds.
+DEFAULT_READ_TIMEOUT = 5
 
 class UARTChannel(base.ATKChannelI):
     """
     A serial port communications channel.
 
-    The serial port is automatically configured for 115200 baud, 8N1, no flow control.
+    The serial port is configured for ``baudrate`` baud (115200 by default),
+    8N1, no flow control.  :meth:`read` gives up after ``read_timeout``
+    seconds, or after ``inter_byte_timeout`` seconds without receiving a
+    byte if that is set.  If ``low_latency`` is ``True``, the driver's
+    low-latency mode is enabled when the port is opened (Linux only); this
+    avoids the USB serial adapter latency timer delaying short responses.
+
+    If ``read_ahead`` is ``True``, a background thread continuously drains the
+    serial port into a buffer of ``read_ahead_size`` bytes, and :meth:`read`
+    is served from that buffer.
     """
-    def __init__(self, port):
+    def __init__(self, port,
+                 baudrate = DEFAULT_BAUDRATE,
+                 read_timeout = DEFAULT_READ_TIMEOUT,
+                 inter_byte_timeout = None,
+                 low_latency = False,
+                 read_ahead = False,
+                 read_ahead_size = DEFAULT_READ_AHEAD_SIZE):
         super(UARTChannel, self).__init__()
 
         self._ramkernel_channel_type = base.CHANNEL_TYPE_UART
 
+        #: Seconds to wait for a complete :meth:`read`.
+        self.read_timeout = read_timeout
+        #: Seconds to wait between bytes of a response, or ``None``.
+        self.inter_byte_timeout = inter_byte_timeout
+        self.low_latency = low_latency
+
         self.port = None
         port = serial.serial_for_url(port, do_not_open = True)
-        port.baudrate = 115200
+        port.baudrate = baudrate
         port.parity   = serial.PARITY_NONE
         port.stopbits = serial.STOPBITS_ONE
         port.bytesize = serial.EIGHTBITS
-        port.timeout  = 5
+        # With an inter-byte timeout, each port read waits only that long
+        # and read() keeps track of the overall deadline itself.
+        port.timeout  = inter_byte_timeout or self.read_timeout
         port.rtscts   = False
         port.xonxoff  = False
         port.dsrdtr   = False
 
         self.port = port
 
-    def open(self):
+        self.reader = None
+        if read_ahead:
+            port.timeout = _READ_AHEAD_POLL_TIMEOUT
+            self.reader = ReadAheadReader(self._read_available, read_ahead_size)
+
+    def _open_port(self):
         self.port.open()
 
+        if self.low_latency:
+            try:
+                self.port.set_low_latency_mode(True)
+            except (AttributeError, NotImplementedError, ValueError) as err:
+                self.port.close()
+                raise IOError("Cannot enable low-latency mode on %s: %s" %
+                              (self.port.port, err))
+
+    def _read_available(self, max_length):
+        # Take everything the driver already has, or wait for the first byte.
+        return self.port.read(max(1, min(max_length, self.port.in_waiting)))
+
+    def open(self):
+        self._open_port()
+        if self.reader is not None:
+            self.reader.start()
+
     def close(self):
+        if self.reader is not None:
+            self.reader.stop()
         self.port.close()
         
     def write(self, data):
@@ -64,14 +123,22 @@ class UARTChannel(base.ATKChannelI):
         """
         Read exactly ``length`` bytes from the UART channel.
         """
+        if self.reader is not None:
+            return self.reader.read(length, self.read_timeout, self.inter_byte_timeout)
+
         data_read = []
         data_length = 0
+        deadline = time.time() + self.read_timeout
 
         while data_length < length:
             data = self.port.read((length - data_length))
-            # No data read indicates a timeout has occurred.
+            # No data read for a whole port timeout.  That is a timeout if
+            # the response had already started (inter-byte timeout) or the
+            # overall deadline has passed.
             if data == b"":
-                raise base.ChannelReadTimeout(length, b"".join(data_read))
+                if data_length > 0 or time.time() >= deadline:
+                    raise base.ChannelReadTimeout(length, b"".join(data_read))
+                continue
 
             data_read.append(data)
             data_length += len(data)
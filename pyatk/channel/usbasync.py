@@ -0,0 +1,415 @@
+# Copyright (c) 2012-2013 Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Asynchronous USB bulk transfer engine.
+
+Keeps several IN and OUT transfers in flight at once through libusb's
+asynchronous API, so the bus is not left idle while Python submits the
+next transfer.  Completions are processed on a background event thread.
+
+Real hardware requires python-libusb1 (the ``usb1`` module); the engine
+itself only talks to a :class:`TransferBackendI` and can be driven by any
+implementation of it.
+"""
+import collections
+import threading
+
+try:
+    import usb1
+except ImportError:
+    usb1 = None
+
+## Transfer completion status codes passed to backend callbacks.
+TRANSFER_COMPLETED = 0
+TRANSFER_TIMED_OUT = 1
+TRANSFER_CANCELLED = 2
+TRANSFER_ERROR     = 3
+TRANSFER_NO_DEVICE = 4
+
+_STATUS_STR_MAP = {
+    TRANSFER_COMPLETED: "transfer completed",
+    TRANSFER_TIMED_OUT: "transfer timed out",
+    TRANSFER_CANCELLED: "transfer cancelled",
+    TRANSFER_ERROR:     "transfer failed",
+    TRANSFER_NO_DEVICE: "device disconnected",
+}
+
+#: Default number of transfers kept in flight in each direction.
+DEFAULT_NUM_TRANSFERS = 4
+
+# How long the event thread blocks in libusb at a time, in seconds.
+_EVENT_INTERVAL = 0.1
+
+def transfer_strerror(status):
+    """ Return a string describing transfer status code ``status``. """
+    return _STATUS_STR_MAP.get(status, "unknown transfer status %r" % (status,))
+
+class TransferBackendI(object):
+    """
+    The asynchronous bulk transfer operations required by :class:`TransferEngine`.
+
+    Completion callbacks are only ever invoked from within
+    :meth:`handle_events`, and transfers on the same endpoint complete in
+    the order they were submitted.
+    """
+    def submit_read(self, endpoint, length, timeout, callback):
+        """
+        Submit a bulk IN transfer of up to ``length`` bytes on ``endpoint``
+        with a ``timeout`` in milliseconds.  On completion, ``callback`` is
+        called with ``(status, data)``; ``data`` is only valid for the
+        duration of the call.
+
+        Return a handle with a ``cancel()`` method.
+        """
+        raise NotImplementedError()
+
+    def submit_write(self, endpoint, data, timeout, callback):
+        """
+        Submit a bulk OUT transfer of the bytes-like object ``data`` on
+        ``endpoint``.  On completion, ``callback`` is called with
+        ``(status, length_written)``.
+
+        Return a handle with a ``cancel()`` method.
+        """
+        raise NotImplementedError()
+
+    def handle_events(self, timeout):
+        """
+        Process pending transfer completions, blocking at most ``timeout``
+        seconds waiting for one.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """ Release the device.  No transfers may be pending. """
+        raise NotImplementedError()
+
+class LibusbTransferBackend(TransferBackendI):
+    """
+    :class:`TransferBackendI` implementation on top of python-libusb1.
+    """
+    def __init__(self, bus, address, interface = 0):
+        """
+        Open the device at ``address`` on ``bus`` and claim ``interface``.
+        """
+        if usb1 is None:
+            raise IOError("Asynchronous USB transfers require python-libusb1 "
+                          "(the 'usb1' module).")
+
+        self._status_map = {
+            usb1.TRANSFER_COMPLETED: TRANSFER_COMPLETED,
+            usb1.TRANSFER_TIMED_OUT: TRANSFER_TIMED_OUT,
+            usb1.TRANSFER_CANCELLED: TRANSFER_CANCELLED,
+            usb1.TRANSFER_NO_DEVICE: TRANSFER_NO_DEVICE,
+        }
+
+        self.context = usb1.USBContext()
+        self.handle = None
+        for device in self.context.getDeviceIterator(skip_on_error = True):
+            if device.getBusNumber() == bus and device.getDeviceAddress() == address:
+                self.handle = device.open()
+                break
+
+        if self.handle is None:
+            self.context.close()
+            raise IOError("Unable to open USB device %03u:%03u with libusb1." % (bus, address))
+
+        self.interface = interface
+        self.handle.claimInterface(interface)
+        # Completed transfers are kept for reuse, rather than allocated
+        # for every submission.
+        self._free_transfers = []
+
+    def _get_transfer(self):
+        if self._free_transfers:
+            return self._free_transfers.pop()
+        return self.handle.getTransfer()
+
+    def submit_read(self, endpoint, length, timeout, callback):
+        transfer = self._get_transfer()
+        transfer.setBulk(endpoint, length,
+                         callback = self._read_complete,
+                         user_data = callback, timeout = timeout)
+        transfer.submit()
+        return transfer
+
+    def submit_write(self, endpoint, data, timeout, callback):
+        transfer = self._get_transfer()
+        transfer.setBulk(endpoint, data,
+                         callback = self._write_complete,
+                         user_data = callback, timeout = timeout)
+        transfer.submit()
+        return transfer
+
+    def _read_complete(self, transfer):
+        callback = transfer.getUserData()
+        status = self._status_map.get(transfer.getStatus(), TRANSFER_ERROR)
+        length = transfer.getActualLength()
+        callback(status, transfer.getBuffer()[:length])
+        # Only recycle the transfer once its buffer has been consumed.
+        self._free_transfers.append(transfer)
+
+    def _write_complete(self, transfer):
+        callback = transfer.getUserData()
+        status = self._status_map.get(transfer.getStatus(), TRANSFER_ERROR)
+        callback(status, transfer.getActualLength())
+        self._free_transfers.append(transfer)
+
+    def handle_events(self, timeout):
+        self.context.handleEventsTimeout(timeout)
+
+    def close(self):
+        for transfer in self._free_transfers:
+            transfer.close()
+        self._free_transfers = []
+
+        self.handle.releaseInterface(self.interface)
+        self.handle.close()
+        self.context.close()
+
+class TransferEngine(object):
+    """
+    Drive a :class:`TransferBackendI` with up to ``num_transfers`` IN and
+    ``num_transfers`` OUT transfers in flight, presenting the same blocking
+    :meth:`read`/:meth:`write` interface as the USB channel.
+
+    ``endpoint_in`` and ``endpoint_out`` are endpoint addresses
+    (``bEndpointAddress``) and ``packet_size`` is their ``wMaxPacketSize``.
+
+    IN transfers are only submitted while a reader is waiting, and never
+    ask for more than the reader still needs rounded up to a whole number
+    of packets.  Reading ahead with fixed-size transfers would leave a
+    response that happens to be an exact multiple of the packet size stuck
+    in a partially filled transfer until it timed out.
+    """
+    def __init__(self, backend, endpoint_in, endpoint_out, packet_size,
+                 max_transfer_size, num_transfers = DEFAULT_NUM_TRANSFERS,
+                 read_timeout = 1000, write_timeout = 2000):
+        if num_transfers < 1:
+            raise ValueError("At least one transfer must be allowed in flight.")
+
+        self.backend = backend
+        self.endpoint_in = endpoint_in
+        self.endpoint_out = endpoint_out
+        self.packet_size = packet_size
+        # Every transfer is a whole number of packets, except the last of a write.
+        self.transfer_size = max(packet_size, (max_transfer_size // packet_size) * packet_size)
+        self.num_transfers = num_transfers
+        self.read_timeout = read_timeout # ms
+        self.write_timeout = write_timeout # ms
+
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+        # Received data not yet handed to a reader, oldest first.
+        self._in_chunks = collections.deque()
+        self._in_offset = 0
+        # Outstanding IN transfers, as (handle, size), in submission order.
+        self._in_pending = collections.deque()
+        self._in_pending_bytes = 0
+        self._in_error = None
+
+        self._out_pending = collections.deque()
+        self._out_error = None
+        # Set when the event thread has died; unlike a failed transfer,
+        # this is not cleared by reporting it.
+        self._fatal_error = None
+
+    def start(self):
+        """ Start the event thread. """
+        if self._thread is not None:
+            raise ValueError("Transfer engine already started.")
+
+        self._stopping = False
+        self._fatal_error = None
+        self._thread = threading.Thread(target = self._run, name = "usb-transfer-events")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Cancel any outstanding transfers, stop the event thread and close
+        the backend.
+        """
+        with self._cond:
+            self._stopping = True
+            for handle, _ in self._in_pending:
+                handle.cancel()
+            for handle in self._out_pending:
+                handle.cancel()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self.backend.close()
+
+        self._in_chunks.clear()
+        self._in_offset = 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopping and not (self._in_pending or self._out_pending):
+                    return
+
+            try:
+                self.backend.handle_events(_EVENT_INTERVAL)
+            except Exception as err:
+                with self._cond:
+                    self._fatal_error = "USB event handling failed: %s" % (err,)
+                    self._in_pending.clear()
+                    self._in_pending_bytes = 0
+                    self._out_pending.clear()
+                    self._cond.notify_all()
+                return
+
+    ## IN direction
+    def _read_complete(self, size, status, data):
+        with self._cond:
+            self._in_pending.popleft()
+            self._in_pending_bytes -= size
+
+            if len(data) > 0:
+                # The backend's buffer is reused once we return.
+                self._in_chunks.append(bytes(data))
+
+            if status not in (TRANSFER_COMPLETED, TRANSFER_CANCELLED):
+                self._in_error = transfer_strerror(status)
+
+            self._cond.notify_all()
+
+    def _submit_reads(self, needed):
+        """ Top up IN transfers to cover ``needed`` more bytes. Caller holds the lock. """
+        while len(self._in_pending) < self.num_transfers:
+            wanted = needed - self._in_pending_bytes
+            if wanted <= 0:
+                break
+
+            size = ((wanted + self.packet_size - 1) // self.packet_size) * self.packet_size
+            size = min(size, self.transfer_size)
+            callback = lambda status, data, size = size: self._read_complete(size, status, data)
+            handle = self.backend.submit_read(self.endpoint_in, size, self.read_timeout, callback)
+            self._in_pending.append((handle, size))
+            self._in_pending_bytes += size
+
+    def _drain(self, view):
+        """ Move buffered IN data into ``view``. Caller holds the lock. """
+        copied = 0
+        while copied < len(view) and self._in_chunks:
+            chunk = self._in_chunks[0]
+            count = min(len(chunk) - self._in_offset, len(view) - copied)
+            view[copied:copied + count] = chunk[self._in_offset:self._in_offset + count]
+            copied += count
+            self._in_offset += count
+            if self._in_offset == len(chunk):
+                self._in_chunks.popleft()
+                self._in_offset = 0
+
+        return copied
+
+    def readinto(self, buf):
+        """
+        Read exactly ``len(buf)`` bytes into the writable byte buffer ``buf``.
+        :exc:`IOError` is raised if a transfer fails or times out, and on
+        every call once the event thread has failed.
+        """
+        view = memoryview(buf)
+        length = len(view)
+        received = 0
+
+        with self._cond:
+            while True:
+                received += self._drain(view[received:])
+                if received == length:
+                    return length
+
+                if self._fatal_error is not None:
+                    raise IOError(self._fatal_error)
+
+                if self._in_error is not None:
+                    error, self._in_error = self._in_error, None
+                    raise IOError(error)
+
+                if self._stopping:
+                    raise IOError("Transfer engine stopped.")
+
+                self._submit_reads(length - received)
+                self._cond.wait(_EVENT_INTERVAL)
+
+    def read(self, length):
+        data = bytearray(length)
+        self.readinto(data)
+        return bytes(data)
+
+    ## OUT direction
+    def _write_complete(self, status, length):
+        with self._cond:
+            self._out_pending.popleft()
+            if status != TRANSFER_COMPLETED and self._out_error is None:
+                self._out_error = transfer_strerror(status)
+
+            self._cond.notify_all()
+
+    def write(self, data):
+        """
+        Write ``data``, keeping up to ``num_transfers`` transfers in flight.
+        Return once every transfer has completed; :exc:`IOError` is raised
+        if any of them failed.
+        """
+        view = memoryview(data)
+        if view.format != "B":
+            view = view.cast("B")
+
+        length = len(view)
+        offset = 0
+
+        with self._cond:
+            self._out_error = None
+            while offset < length or self._out_pending:
+                if self._fatal_error is not None:
+                    raise IOError(self._fatal_error)
+
+                if self._stopping:
+                    raise IOError("Transfer engine stopped.")
+
+                # Stop submitting after a failure, but let the transfers
+                # already in flight finish before reporting it.
+                while (offset < length and self._out_error is None and
+                       len(self._out_pending) < self.num_transfers):
+                    chunk = view[offset:offset + self.transfer_size]
+                    handle = self.backend.submit_write(self.endpoint_out, chunk,
+                                                       self.write_timeout,
+                                                       self._write_complete)
+                    self._out_pending.append(handle)
+                    offset += len(chunk)
+
+                if self._out_error is not None and not self._out_pending:
+                    break
+
+                self._cond.wait(_EVENT_INTERVAL)
+
+            if self._out_error is not None:
+                error, self._out_error = self._out_error, None
+                raise IOError(error)
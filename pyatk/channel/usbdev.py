@@ -26,23 +26,146 @@ libusb-0.1, libusb-1.0, libusbx, and OpenUSB.
 
 Requires PyUSB 1.0.
 """
+import time
+import array
+import collections
+
 import usb.core
 import usb.util
+from pyatk import timing
 from pyatk.channel import base
+from pyatk.channel import usbasync
+from pyatk.channel.ringbuffer import RingBuffer
 
 VID_FREESCALE = 0x15a2
 
+#: Default upper bound on the size of a single bulk transfer.  libusb
+#: splits each transfer into as many requests as the host controller
+#: needs, so this only bounds host memory use per transfer.
+DEFAULT_MAX_TRANSFER_SIZE = 256 * 1024
+
+#: Default time :meth:`USBChannel.reopen` waits for the device, in seconds.
+DEFAULT_REOPEN_TIMEOUT = 10
+
+# Largest bulk wMaxPacketSize allowed by the USB specification
+# (SuperSpeed; high-speed devices use 512).
+_MAX_BULK_PACKET_SIZE = 1024
+
+# Number of differently-sized IN staging buffers kept around for reuse.
+_TRANSFER_BUFFER_CACHE_SIZE = 8
+
+#: A matching USB device found by :func:`discover_devices`.  ``port_path``
+#: is the device's physical port path (see :func:`parse_port_path`), or
+#: ``None`` if the backend cannot report it.
+USBDeviceInfo = collections.namedtuple(
+    "USBDeviceInfo", ("vid", "pid", "bus", "address", "port_path")
+)
+
+def parse_port_path(port_path):
+    """
+    Parse a physical port path of the form ``"BUS-PORT[.PORT...]"`` (the
+    Linux sysfs device name, e.g. ``"1-1.4"`` for port 4 of the hub on port
+    1 of bus 1) into the tuple ``(bus, port_numbers)``.
+
+    :exc:`ValueError` is raised if ``port_path`` is malformed.
+    """
+    bus, sep, ports = port_path.partition("-")
+    if not sep or not ports:
+        raise ValueError("Invalid USB port path %r; expected BUS-PORT[.PORT...]" % (port_path,))
+
+    try:
+        return int(bus, 10), tuple(int(port, 10) for port in ports.split("."))
+    except ValueError:
+        raise ValueError("Invalid USB port path %r; expected BUS-PORT[.PORT...]" % (port_path,))
+
+def format_port_path(bus, port_numbers):
+    """ Return the ``"BUS-PORT[.PORT...]"`` string for ``bus`` and ``port_numbers``. """
+    return "%u-%s" % (bus, ".".join(str(port) for port in port_numbers))
+
+def _device_port_path(dev):
+    """ Return ``(bus, port_numbers)`` for PyUSB device ``dev``, or ``None``. """
+    # Not every backend can report port numbers.
+    try:
+        port_numbers = dev.port_numbers
+    except (AttributeError, NotImplementedError, usb.core.USBError):
+        return None
+
+    if not port_numbers:
+        return None
+    return (dev.bus, tuple(port_numbers))
+
+def _usb_id_kwargs(idVendor, idProduct):
+    # Setting idProduct = None doesn't work at all.
+    # Just don't pass idProduct if we don't want to match it.
+    kwargs = {"idVendor": idVendor}
+    if idProduct is not None:
+        kwargs["idProduct"] = idProduct
+    return kwargs
+
+def _find(*args, **kwargs):
+    """ :func:`usb.core.find`, raising :exc:`IOError` if libusb is missing. """
+    try:
+        return usb.core.find(*args, **kwargs)
+    except usb.core.NoBackendError as err:
+        raise IOError("No USB backend available (is libusb installed?): %s" % (err,))
+
+def discover_devices(idVendor = VID_FREESCALE, idProduct = None):
+    """
+    Return a list of :class:`USBDeviceInfo` for every connected device with
+    vendor ID ``idVendor`` and product ID ``idProduct`` (any product if
+    ``None``), ordered by port path.
+    """
+    devices = []
+    for dev in _find(True, **_usb_id_kwargs(idVendor, idProduct)):
+        port_path = _device_port_path(dev)
+        if port_path is not None:
+            port_path = format_port_path(*port_path)
+        devices.append(USBDeviceInfo(dev.idVendor, dev.idProduct, dev.bus, dev.address, port_path))
+
+    devices.sort(key = lambda info: (info.bus, info.port_path or "", info.address))
+    return devices
+
+def _staging_buffer(cache, size):
+    """
+    Return a reusable ``(array, memoryview)`` pair of ``size`` bytes from
+    the dictionary ``cache``, creating it if necessary.
+    """
+    try:
+        return cache[size]
+    except KeyError:
+        if len(cache) >= _TRANSFER_BUFFER_CACHE_SIZE:
+            cache.clear()
+
+        buf = array.array("B", bytes(size))
+        cache[size] = (buf, memoryview(buf))
+        return cache[size]
+
 class USBChannel(base.ATKChannelI):
     """
     USB ATK channel implementation.
     """
-    def __init__(self, idVendor = VID_FREESCALE, idProduct = None):
+    def __init__(self, idVendor = VID_FREESCALE, idProduct = None,
+                 max_transfer_size = DEFAULT_MAX_TRANSFER_SIZE,
+                 async_transfers = 0,
+                 port_path = None):
         """
         Prepare to connect to USB channel with vendor ID ``idVendor``
         and product ID ``idProduct``.  If ``idProduct`` is ``None``, match
         any device with ``idVendor``.
 
         The default ``idVendor`` is Freescale Semiconductor (``0x15a2``).
+
+        ``max_transfer_size`` limits the size in bytes of each bulk transfer
+        submitted to libusb.
+
+        If ``async_transfers`` is non-zero, reads and writes go through a
+        :class:`~pyatk.channel.usbasync.TransferEngine` keeping that many
+        transfers in flight in each direction.  This requires python-libusb1.
+
+        If ``port_path`` is given (a ``"BUS-PORT[.PORT...]"`` string, see
+        :func:`parse_port_path`), only the device plugged into that physical
+        port is used, so several boards with the same VID/PID can be driven
+        by separate channels.
         """
         super(USBChannel, self).__init__()
 
@@ -57,82 +180,193 @@ class USBChannel(base.ATKChannelI):
         self.pid = idProduct
 
         self.dev = None
+        #: ``(bus, address)`` of the device last opened.
+        self.address = None
+        #: ``(bus, port_numbers)`` of the device last opened, if known.
+        self.port_path = None
+        # True if only the device at port_path may be used.
+        self._port_pinned = port_path is not None
+        if port_path is not None:
+            self.port_path = parse_port_path(port_path)
         self.interface = None
         self.endpoint_in = None
         self.endpoint_out = None
         self.configuration = None
 
-        self.internal_read_buffer = b""
+        if max_transfer_size < _MAX_BULK_PACKET_SIZE:
+            raise ValueError("Maximum transfer size must be at least %u bytes." %
+                             _MAX_BULK_PACKET_SIZE)
+        self.max_transfer_size = max_transfer_size
+        self.async_transfers = async_transfers
+        self.engine = None
+
+        # Data received from the IN endpoint beyond what the caller asked
+        # for is held here until the next read.  IN transfers are never
+        # larger than the data still needed rounded up to the packet size,
+        # so at most one packet's worth is ever left over.
+        self.read_buffer = RingBuffer(_MAX_BULK_PACKET_SIZE)
+        # Reusable staging buffers for IN and OUT transfers, keyed by size.
+        # PyUSB can only read into array objects and always fills the whole
+        # array; anything other than an array is converted element by
+        # element before it is written.
+        self._in_buffers = {}
+        self._out_buffers = {}
 
         self.write_timeout = 2000 # ms
         self.read_timeout = 1000 # ms
 
-    def open(self):
-        # Setting idProduct = None doesn't work at all.
-        # Just don't pass idProduct if we don't want to match it.
-        kwargs = {}
-        if self.pid is not None:
-            kwargs["idProduct"] = self.pid
+    def _find_device(self, exclude_address = None):
+        """
+        Find the single device matching our VID/PID, skipping the device at
+        ``(bus, address)`` ``exclude_address`` if given.
+        """
+        kwargs = _usb_id_kwargs(self.vid, self.pid)
+
+        def usable(dev):
+            return exclude_address is None or (dev.bus, dev.address) != exclude_address
+
+        # Look on the port the board was last seen on first; find() stops
+        # at the first match instead of examining every device on the bus.
+        if self.port_path is not None:
+            bus, port_numbers = self.port_path
+            dev = _find(custom_match = lambda d: (d.bus == bus and usable(d) and
+                                                _device_port_path(d) == self.port_path),
+                                **kwargs)
+            if dev is not None:
+                return dev
+
+            if self._port_pinned:
+                raise IOError("No matching device on USB port %s." %
+                              format_port_path(*self.port_path))
 
         # Find all devices matching the specified VID/PID.
-        dev_list = usb.core.find(True, idVendor = self.vid, **kwargs)
+        dev_list = [dev for dev in _find(True, **kwargs) if usable(dev)]
 
         # We only accept one device.  If there are more than one
         # matching device, we have to bail - they all have the same
         # serial number!
-        if len(dev_list) == 1:
-            dev = dev_list[0]
-            # Just set the default configuration - there is only one.
-            dev.set_configuration()
-            self.configuration = dev.get_active_configuration()
-            # Dump information about the interface...
-            #for intf in cfg:
-            #    print "bInterfaceNumber", intf.bInterfaceNumber
-            #    print "bAlternateSetting", intf.bAlternateSetting
-            #    print
-            self.interface = usb.util.find_descriptor(
-                self.configuration,
-                bInterfaceNumber = 0,
-                bAlternateSetting = 0
-            )
-            # OUT endpoint
-            self.endpoint_out = usb.util.find_descriptor(
-                self.interface,
-                custom_match = lambda e: usb.util.endpoint_direction(e.bEndpointAddress) == usb.util.ENDPOINT_OUT
-            )
-            if self.endpoint_out is None:
-                raise IOError("Could not find OUT endpoint for USB device.")
-
-            #print "wMaxPacketSize", self.endpoint_out.wMaxPacketSize
-            #print "bLength", self.endpoint_out.bLength
-
-            # IN endpoint
-            self.endpoint_in = usb.util.find_descriptor(
-                self.interface,
-                custom_match = lambda e: usb.util.endpoint_direction(e.bEndpointAddress) == usb.util.ENDPOINT_IN
-            )
-            if self.endpoint_in is None:
-                raise IOError("Could not find IN endpoint for USB device.")
-
-            #print "wMaxPacketSize", self.endpoint_in.wMaxPacketSize
-            #print "bLength", self.endpoint_in.bLength
-
-            self.dev = dev
-
-        # Don't allow open() to connect to multiple devices.
-        elif len(dev_list) > 1:
+        if len(dev_list) > 1:
             raise IOError("Multiple devices matched. Please only connect one matching "
-                          "USB device.")
+                          "USB device, or select one by its port path.")
 
         # No devices matched.
-        else:
+        elif not dev_list:
             raise IOError("Unable to enumerate device. Is it connected and in "
                           "serial boot mode?")
 
+        return dev_list[0]
+
+    def open(self):
+        self._open()
+
+    def _open(self, exclude_address = None):
+        dev = self._find_device(exclude_address)
+
+        # There is only one configuration.  Setting it again when the
+        # device is already configured costs a control transfer and resets
+        # the endpoints, so only do it for a freshly enumerated device.
+        try:
+            self.configuration = dev.get_active_configuration()
+        except usb.core.USBError:
+            self.configuration = None
+
+        if self.configuration is None:
+            dev.set_configuration()
+            self.configuration = dev.get_active_configuration()
+
+        self.interface = usb.util.find_descriptor(
+            self.configuration,
+            bInterfaceNumber = 0,
+            bAlternateSetting = 0
+        )
+        # OUT endpoint
+        self.endpoint_out = usb.util.find_descriptor(
+            self.interface,
+            custom_match = lambda e: usb.util.endpoint_direction(e.bEndpointAddress) == usb.util.ENDPOINT_OUT
+        )
+        if self.endpoint_out is None:
+            raise IOError("Could not find OUT endpoint for USB device.")
+
+        # IN endpoint
+        self.endpoint_in = usb.util.find_descriptor(
+            self.interface,
+            custom_match = lambda e: usb.util.endpoint_direction(e.bEndpointAddress) == usb.util.ENDPOINT_IN
+        )
+        if self.endpoint_in is None:
+            raise IOError("Could not find IN endpoint for USB device.")
+
+        self.dev = dev
+        # Remember where the board is so reopen() can go straight to it.
+        self.address = (dev.bus, dev.address)
+        port_path = _device_port_path(dev)
+        if port_path is not None:
+            self.port_path = port_path
+
+        if self.async_transfers:
+            self._start_engine()
+
+    def reopen(self, timeout = DEFAULT_REOPEN_TIMEOUT, reenumerated = False, monitor = None):
+        """
+        Close the channel and open it again, waiting up to ``timeout``
+        seconds for the device to come back.  Return the time spent
+        waiting, in seconds.
+
+        If ``reenumerated`` is ``True`` (the device is expected to have
+        re-enumerated, e.g. after loading the RAM kernel or a CPU reset),
+        the device at the previous bus address is ignored, so that a board
+        that has not yet dropped off the bus is not mistaken for the new one.
+        Otherwise the device is expected back at the same address.
+
+        If a started :class:`~pyatk.channel.hotplug.HotplugMonitor` is given
+        as ``monitor``, each wait between attempts ends as soon as a
+        matching device arrives; otherwise the bus is polled with backoff.
+        """
+        exclude_address = None
+        if reenumerated:
+            exclude_address = self.address
+
+        self.close()
+
+        def wait(delay):
+            if monitor is not None:
+                monitor.wait_for_arrival(self._matches_arrival, delay)
+            else:
+                time.sleep(delay)
+
+        _, elapsed = timing.retry(lambda: self._open(exclude_address), timeout, sleep = wait)
+        return elapsed
+
+    def _matches_arrival(self, event):
+        """ Return ``True`` if hotplug ``event`` could be our device. """
+        if event.vid != self.vid or (self.pid is not None and event.pid != self.pid):
+            return False
+
+        if self._port_pinned and event.port_numbers is not None:
+            return (event.bus, event.port_numbers) == self.port_path
+
+        return True
+
+    def _start_engine(self):
+        backend = usbasync.LibusbTransferBackend(self.dev.bus, self.dev.address,
+                                                 self.interface.bInterfaceNumber)
+        self.engine = usbasync.TransferEngine(backend,
+                                              self.endpoint_in.bEndpointAddress,
+                                              self.endpoint_out.bEndpointAddress,
+                                              self.endpoint_out.wMaxPacketSize,
+                                              self.max_transfer_size,
+                                              num_transfers = self.async_transfers,
+                                              read_timeout = self.read_timeout,
+                                              write_timeout = self.write_timeout)
+        self.engine.start()
+
     def close(self):
         """
         Close the USB interface.
         """
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
+
         # Removing all references to endpoints, interfaces,
         # and device instances should release any claims
         # on the USB interface.
@@ -141,37 +375,101 @@ class USBChannel(base.ATKChannelI):
         self.endpoint_in = None
         self.interface = None
         self.dev = None
+        self.read_buffer.clear()
 
     def write(self, data):
-        max_packet_size = self.endpoint_out.wMaxPacketSize
+        """
+        Write ``data`` to the OUT endpoint.
+
+        ``data`` is submitted in transfers of up to :attr:`max_transfer_size`
+        bytes, which libusb breaks into packets.  Every transfer but the last
+        is a whole number of packets, so the device sees the same packet
+        boundaries as if each packet had been written separately; the i.MX25
+        workaround in :meth:`~pyatk.boot.SerialBootProtocol.write_file`
+        relies on that final short packet.
+        """
+        if self.engine is not None:
+            return self.engine.write(data)
+
+        view = memoryview(data)
+        if view.format != "B":
+            view = view.cast("B")
+
+        length = len(view)
+        transfer_size = self._max_transfer_size(self.endpoint_out.wMaxPacketSize)
         bytes_written = 0
-        while bytes_written < len(data):
-            pkt = data[bytes_written:bytes_written + max_packet_size]
+        while bytes_written < length:
+            chunk = view[bytes_written:bytes_written + transfer_size]
+            buf, bufview = _staging_buffer(self._out_buffers, len(chunk))
+            bufview[:] = chunk
             try:
-                self.endpoint_out.write(pkt, timeout = self.write_timeout)
-                bytes_written += len(pkt)
+                bytes_written += self.endpoint_out.write(buf, timeout = self.write_timeout)
             except usb.USBError as e:
                 raise IOError(str(e))
 
-    def read(self, length):
-        # Append to internal read buffer until we've received enough
-        # packets from the IN endpoint.
-        #
-        while len(self.internal_read_buffer) < length:
-            try:
-                # We can only read the size of the max packet size for
-                # the read endpoint...
-                data = self.endpoint_in.read(64, timeout = self.read_timeout).tostring()
-                #print "received", repr(data)
-                ## Buffer internally, since we may get more data than
-                ## we are expecting.
-                self.internal_read_buffer += data
+    def _max_transfer_size(self, packet_size):
+        """ Return :attr:`max_transfer_size` rounded down to a whole number of packets. """
+        return max(packet_size, (self.max_transfer_size // packet_size) * packet_size)
 
-            except usb.USBError as e:
-                raise IOError(str(e))
+    def _read_size(self, remaining):
+        """
+        Return the IN transfer size to use when ``remaining`` bytes are
+        still needed: ``remaining`` rounded up to a whole number of packets,
+        capped at :attr:`max_transfer_size`.
+        """
+        packet_size = self.endpoint_in.wMaxPacketSize
+        size = ((remaining + packet_size - 1) // packet_size) * packet_size
+        return min(size, self._max_transfer_size(packet_size))
 
-        # pull off the requested amount of data, if we did not time out.
-        return_data = self.internal_read_buffer[:length]
-        self.internal_read_buffer = self.internal_read_buffer[length:]
+    def _read_transfer(self, size):
+        """
+        Perform a single IN transfer of at most ``size`` bytes.  Return a
+        memoryview of the data received, which is only valid until the next
+        transfer of the same size.
+        """
+        buf, view = _staging_buffer(self._in_buffers, size)
+        try:
+            count = self.endpoint_in.read(buf, timeout = self.read_timeout)
+        except usb.USBError as e:
+            raise IOError(str(e))
 
-        return return_data
+        return view[:count]
+
+    def readinto(self, buf):
+        """
+        Read exactly ``len(buf)`` bytes from the IN endpoint into the
+        writable byte buffer ``buf``.
+        """
+        if self.engine is not None:
+            return self.engine.readinto(buf)
+
+        view = memoryview(buf)
+        length = len(view)
+
+        # Drain anything left over from previous transfers first.
+        received = 0
+        if len(self.read_buffer):
+            received = self.read_buffer.readinto(view)
+
+        while received < length:
+            # Ask for everything still needed in as few transfers as
+            # possible.  The device ends a transfer early with a short
+            # packet (or a zero-length packet) when it has nothing more to
+            # send; either way we simply go around again for the rest.
+            transfer = self._read_transfer(self._read_size(length - received))
+            count = len(transfer)
+
+            # Copy what the caller needs straight into its buffer, and
+            # keep any excess for the next read.
+            take = min(count, length - received)
+            view[received:received + take] = transfer[:take]
+            received += take
+            if take < count:
+                self.read_buffer.write(transfer[take:])
+
+        return length
+
+    def read(self, length):
+        data = bytearray(length)
+        self.readinto(data)
+        return bytes(data)
@@ -0,0 +1,144 @@
+# Copyright (c) 2012-2013 Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Per-board flash manifests: the content hash of every flash block written by
+the last successful program of a board, so that the next program of a
+similar image only rewrites the blocks that changed.
+
+Manifests are JSON files in a cache directory, one per
+:class:`FlashIdentity`.
+"""
+import os
+import json
+import random
+import hashlib
+import collections
+
+from pyatk import ramkernel
+
+_MANIFEST_VERSION = 1
+
+#: What a manifest describes: the ``board`` (see :func:`fuse_uid`, or
+#: failing that the port it is plugged into), the RAM kernel's ``getver``
+#: device type and flash model,
+#: the flash ``capacity`` and the ``block_size`` the image was hashed in.
+FlashIdentity = collections.namedtuple(
+    "FlashIdentity", ("board", "imx_type", "flash_model", "capacity", "block_size")
+)
+
+def fuse_uid(kernel, address, count):
+    """
+    Read the ``count`` fuse rows at ``address`` holding the processor's
+    unique ID through :class:`~pyatk.ramkernel.RAMKernelProtocol`
+    ``kernel``, and return them as a board name such as ``"uid:0123..."``.
+    """
+    return "uid:" + "".join("%02x" % (kernel.fuse_read(address + row) & 0xFF)
+                            for row in range(count))
+
+def manifest_key(identity):
+    """ Return the cache key for :class:`FlashIdentity` ``identity``. """
+    return hashlib.sha256(repr(tuple(identity)).encode("utf-8")).hexdigest()
+
+def manifest_path(cache_dir, identity):
+    """ Return the manifest file name for ``identity`` in ``cache_dir``. """
+    return os.path.join(cache_dir, manifest_key(identity) + ".json")
+
+def load(cache_dir, identity):
+    """
+    Return the block hashes recorded for ``identity`` in ``cache_dir``, as
+    a dictionary mapping block address to ``(length, digest)`` (see
+    :meth:`~pyatk.ramkernel.RAMKernelProtocol.program_stream`), or ``None``
+    if there is no usable manifest.
+    """
+    try:
+        with open(manifest_path(cache_dir, identity), "r") as manifest_fp:
+            manifest = json.load(manifest_fp)
+
+        if (manifest["version"] != _MANIFEST_VERSION or
+                manifest["key"] != manifest_key(identity)):
+            return None
+
+        return dict((int(address, 0), (length, digest))
+                    for address, (length, digest) in manifest["blocks"].items())
+
+    # A missing or damaged manifest just means programming everything.
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+def save(cache_dir, identity, blocks):
+    """ Record ``blocks`` (see :func:`load`) as the manifest for ``identity``. """
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    manifest = {
+        "version": _MANIFEST_VERSION,
+        "key": manifest_key(identity),
+        "board": identity.board,
+        "blocks": dict(("0x%08X" % address, [length, digest])
+                       for address, (length, digest) in blocks.items()),
+    }
+
+    path = manifest_path(cache_dir, identity)
+    temp_path = "%s.%u.tmp" % (path, os.getpid())
+    with open(temp_path, "w") as manifest_fp:
+        json.dump(manifest, manifest_fp, sort_keys = True)
+    getattr(os, "replace", os.rename)(temp_path, path)
+
+def merge(previous, block_hashes):
+    """
+    Return the blocks of manifest ``previous`` (or of none, if ``None``)
+    updated with the ``block_hashes`` filled in by
+    :meth:`~pyatk.ramkernel.RAMKernelProtocol.program_stream`.  Blocks it
+    programmed without knowing their new contents are dropped, so that the
+    next differential program writes them again.
+    """
+    blocks = dict(previous or {})
+    blocks.update(block_hashes)
+    return dict((address, entry) for address, entry in blocks.items()
+                if entry is not None)
+
+def discard(cache_dir, identity):
+    """ Forget the manifest for ``identity``, e.g. before its flash changes. """
+    try:
+        os.remove(manifest_path(cache_dir, identity))
+    except OSError:
+        pass
+
+def spot_check(kernel, blocks, count = 2, rng = None):
+    """
+    Read back ``count`` blocks chosen at random from ``blocks`` (see
+    :func:`load`) with :meth:`~pyatk.ramkernel.RAMKernelProtocol.flash_dump`
+    through ``kernel``, and return the addresses of those whose contents do
+    not match their recorded hash.
+    """
+    rng = rng or random.Random()
+    addresses = sorted(blocks)
+    chosen = sorted(rng.sample(addresses, min(count, len(addresses))))
+
+    mismatches = []
+    for address in chosen:
+        length, digest = blocks[address]
+        if ramkernel.block_digest(kernel.flash_dump(address, length)) != digest:
+            mismatches.append(address)
+
+    return mismatches
@@ -0,0 +1,204 @@
+# Copyright (c) 2012-2013 Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Memory initialization tables: parsing, validation, folding and a compiled
+binary cache.
+
+A memory initialization file has one write per line::
+
+    # address    value       width (bits)
+    0xB8001010   0x00000304  32
+    0x80000400   0x00        8
+
+Fields are separated by any whitespace; ``#`` starts a comment.
+"""
+import os
+import struct
+import hashlib
+import collections
+
+from pyatk import boot
+
+#: One memory write: ``value`` of ``datasize`` bits (see
+#: :const:`~pyatk.boot.DATA_SIZE_WORD`, etc.) written to ``address``.
+InitEntry = collections.namedtuple("InitEntry", ("address", "value", "datasize"))
+
+_DATASIZES = (boot.DATA_SIZE_BYTE, boot.DATA_SIZE_HALFWORD, boot.DATA_SIZE_WORD)
+
+# Compiled table file: magic, format version, entry count, then entries.
+_CACHE_MAGIC = b"PYATKINI"
+_CACHE_VERSION = 1
+_CACHE_HEADER = struct.Struct("<8sII")
+_CACHE_ENTRY = struct.Struct("<IIB")
+
+class InitTableError(ValueError):
+    """ An invalid line in a memory initialization table. """
+    def __init__(self, source, lineno, msg):
+        super(InitTableError, self).__init__("%s:%u: %s" % (source, lineno, msg))
+        self.source = source
+        self.lineno = lineno
+
+def parse(lines, source = "<init table>"):
+    """
+    Parse and validate memory initialization ``lines``.  Return a list of
+    :class:`InitEntry`.
+
+    :exc:`InitTableError` is raised, naming ``source`` and the line
+    number, for a malformed line, an unknown width, a value that does not
+    fit its width, or an unaligned or out-of-range address.
+    """
+    entries = []
+    for lineno, line in enumerate(lines, 1):
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+
+        if len(fields) != 3:
+            raise InitTableError(source, lineno, "expected 'ADDRESS VALUE WIDTH', got %r" %
+                                 (line.strip(),))
+        try:
+            address, value, datasize = [int(field, 0) for field in fields]
+        except ValueError:
+            raise InitTableError(source, lineno, "invalid number in %r" % (line.strip(),))
+
+        if datasize not in _DATASIZES:
+            raise InitTableError(source, lineno, "width must be 8, 16 or 32, not %u" % (datasize,))
+
+        if not (boot.UINT32_MIN <= address <= boot.UINT32_MAX):
+            raise InitTableError(source, lineno, "address 0x%X is not 32-bit" % (address,))
+
+        if address % (datasize // 8):
+            raise InitTableError(source, lineno, "address 0x%08X is not aligned to %u bits" %
+                                 (address, datasize))
+
+        if not (0 <= value < (1 << datasize)):
+            raise InitTableError(source, lineno, "value 0x%X does not fit in %u bits" %
+                                 (value, datasize))
+
+        entries.append(InitEntry(address, value, datasize))
+
+    return entries
+
+def in_memory_window(entry, bsp_info):
+    """ Return True if ``entry`` writes to ``bsp_info``'s SDRAM rather than a register. """
+    return bsp_info.base_memory_address <= entry.address <= bsp_info.memory_bottom_address
+
+def fold(entries, bsp_info = None):
+    """
+    Drop writes that repeat the previous write exactly (same address,
+    value and width).  Writes into the SDRAM window of ``bsp_info`` are
+    never dropped: during memory bring-up they issue controller commands
+    (precharge, refresh) and repeating them is deliberate.  Non-adjacent
+    writes to the same register are kept too, since the writes between
+    them may depend on the intermediate value.
+
+    Without ``bsp_info`` the SDRAM window is unknown and nothing is
+    dropped.
+    """
+    if bsp_info is None:
+        return list(entries)
+
+    folded = []
+    for entry in entries:
+        if folded and folded[-1] == entry and not in_memory_window(entry, bsp_info):
+            continue
+        folded.append(entry)
+
+    return folded
+
+def pack(entries):
+    """ Return the compiled binary form of ``entries``. """
+    return (_CACHE_HEADER.pack(_CACHE_MAGIC, _CACHE_VERSION, len(entries)) +
+            b"".join(_CACHE_ENTRY.pack(*entry) for entry in entries))
+
+def unpack(data):
+    """
+    Return the entries in compiled table ``data``.  :exc:`ValueError` is
+    raised if ``data`` is not a valid compiled table.
+    """
+    if len(data) < _CACHE_HEADER.size:
+        raise ValueError("Compiled init table is truncated.")
+
+    magic, version, count = _CACHE_HEADER.unpack_from(data)
+    if magic != _CACHE_MAGIC or version != _CACHE_VERSION:
+        raise ValueError("Not a compiled init table (or an old format).")
+
+    if len(data) != _CACHE_HEADER.size + count * _CACHE_ENTRY.size:
+        raise ValueError("Compiled init table has the wrong length.")
+
+    return [InitEntry(*_CACHE_ENTRY.unpack_from(data, _CACHE_HEADER.size + i * _CACHE_ENTRY.size))
+            for i in range(count)]
+
+def cache_key(text, bsp_info = None):
+    """
+    Return the cache key for init file contents ``text`` (bytes).  The
+    SDRAM window is part of the key, since folding depends on it.
+    """
+    digest = hashlib.sha256(text)
+    if bsp_info is not None:
+        digest.update(struct.pack("<II", bsp_info.base_memory_address,
+                                  bsp_info.memory_bottom_address))
+    return digest.hexdigest()
+
+def compile_table(text, bsp_info = None, source = "<init table>"):
+    """ Parse, validate and fold init file contents ``text`` (bytes). """
+    # Only ASCII is meaningful; latin-1 decoding cannot fail, so stray bytes
+    # are reported as invalid numbers on the right line.
+    return fold(parse(text.decode("latin-1").splitlines(), source), bsp_info)
+
+def load(filename, bsp_info = None, cache_dir = None):
+    """
+    Load the memory initialization file ``filename``, returning a list of
+    :class:`InitEntry` (see :func:`compile_table`).
+
+    If ``cache_dir`` is given, the compiled table is stored there under
+    its :func:`cache_key`, and later loads of the same contents skip
+    parsing.  An unreadable cache entry is simply rebuilt.
+    """
+    with open(filename, "rb") as init_fp:
+        text = init_fp.read()
+
+    if cache_dir is None:
+        return compile_table(text, bsp_info, filename)
+
+    cache_path = os.path.join(cache_dir, cache_key(text, bsp_info) + ".bin")
+    try:
+        with open(cache_path, "rb") as cache_fp:
+            return unpack(cache_fp.read())
+    except (IOError, OSError, ValueError):
+        pass
+
+    entries = compile_table(text, bsp_info, filename)
+
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        temp_path = "%s.%u.tmp" % (cache_path, os.getpid())
+        with open(temp_path, "wb") as cache_fp:
+            cache_fp.write(pack(entries))
+        getattr(os, "replace", os.rename)(temp_path, cache_path)
+    # The cache is only an optimization.
+    except (IOError, OSError):
+        pass
+
+    return entries
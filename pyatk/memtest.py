@@ -0,0 +1,163 @@
+# Copyright (c) 2012-2013 Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+SDRAM test over the Serial Boot Protocol: fill a region with a pattern
+using bulk file uploads, read it back in large chunks and compare on the
+host.
+"""
+import io
+import sys
+import time
+import array
+import random
+import collections
+
+from pyatk import boot
+
+PATTERN_WALKING_ONES = "walking-ones"
+PATTERN_ADDRESS      = "address"
+PATTERN_RANDOM       = "random"
+PATTERNS = (PATTERN_WALKING_ONES, PATTERN_ADDRESS, PATTERN_RANDOM)
+
+#: Default bytes per upload and per read-back request.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Words compared at a time when looking for the failing words of a chunk.
+_SCAN_WORDS = 1024
+
+#: A word that read back wrong.
+MemTestFailure = collections.namedtuple("MemTestFailure", ("address", "expected", "actual"))
+
+#: The outcome of one pattern.  ``failures`` lists at most the first
+#: ``max_failures`` bad words; ``failure_count`` counts all of them.
+MemTestResult = collections.namedtuple(
+    "MemTestResult",
+    ("pattern", "size", "write_seconds", "read_seconds", "failures", "failure_count")
+)
+
+def _word_array(values = ()):
+    return array.array(boot._ARRAY_TYPECODES[boot.DATA_SIZE_WORD], values)
+
+def pattern_words(pattern, address, count, seed = 0):
+    """
+    Return an array of the ``count`` 32-bit words ``pattern`` puts at
+    ``address`` onwards, in host byte order.  The random pattern is
+    reproducible from ``seed`` and ``address``.
+    """
+    if PATTERN_WALKING_ONES == pattern:
+        first = (address // 4) % 32
+        cycle = _word_array(1 << ((first + i) % 32) for i in range(32))
+        words = cycle * (count // 32 + 1)
+        del words[count:]
+        return words
+
+    elif PATTERN_ADDRESS == pattern:
+        return _word_array(range(address, address + 4 * count, 4))
+
+    elif PATTERN_RANDOM == pattern:
+        rng = random.Random((seed << 32) | address)
+        words = _word_array()
+        if count:
+            words.frombytes(rng.getrandbits(32 * count).to_bytes(4 * count, sys.byteorder))
+        return words
+
+    raise ValueError("Unknown memory test pattern %r" % (pattern,))
+
+def _device_bytes(words, byteorder):
+    """ Return ``words`` as bytes in device byte order. """
+    if byteorder != sys.byteorder:
+        words = _word_array(words)
+        words.byteswap()
+    return words.tobytes()
+
+def compare(address, expected, actual, max_failures):
+    """
+    Compare word arrays ``expected`` and ``actual`` read from ``address``.
+    Return the tuple ``(failures, failure_count)``; see
+    :class:`MemTestResult`.
+    """
+    if expected == actual:
+        return [], 0
+
+    failures = []
+    failure_count = 0
+    for start in range(0, len(expected), _SCAN_WORDS):
+        end = start + _SCAN_WORDS
+        if expected[start:end] == actual[start:end]:
+            continue
+
+        for index in range(start, min(end, len(expected))):
+            if expected[index] != actual[index]:
+                failure_count += 1
+                if len(failures) < max_failures:
+                    failures.append(MemTestFailure(address + 4 * index,
+                                                   expected[index], actual[index]))
+
+    return failures, failure_count
+
+def run_pattern(sbp, pattern, start, size,
+                seed = 0,
+                chunk_size = DEFAULT_CHUNK_SIZE,
+                max_failures = 16,
+                progress_callback = None):
+    """
+    Fill ``size`` bytes at ``start`` with ``pattern`` through
+    :class:`~pyatk.boot.SerialBootProtocol` ``sbp``, then read the region
+    back and compare.  The whole region is written before any of it is
+    read, so that address lines shorted together show up as failures.
+
+    ``start``, ``size`` and ``chunk_size`` must be multiples of 4.  If
+    given, ``progress_callback(phase, done, total)`` is called after each
+    chunk with ``phase`` "write" or "read".
+
+    Return a :class:`MemTestResult`.
+    """
+    if start % 4 or size % 4 or chunk_size % 4 or chunk_size <= 0:
+        raise ValueError("Memory test start, size and chunk size must be multiples of 4.")
+
+    chunks = [(address, min(chunk_size, start + size - address))
+              for address in range(start, start + size, chunk_size)]
+
+    write_start = time.time()
+    for address, length in chunks:
+        data = _device_bytes(pattern_words(pattern, address, length // 4, seed), sbp.byteorder)
+        sbp.load_file(address, length, io.BytesIO(data))
+        if progress_callback:
+            progress_callback("write", address + length - start, size)
+    write_seconds = time.time() - write_start
+
+    failures = []
+    failure_count = 0
+    read_start = time.time()
+    for address, length in chunks:
+        actual = sbp.read_memory(address, boot.DATA_SIZE_WORD, length // 4)
+        chunk_failures, chunk_count = compare(address,
+                                              pattern_words(pattern, address, length // 4, seed),
+                                              actual, max_failures - len(failures))
+        failures += chunk_failures
+        failure_count += chunk_count
+        if progress_callback:
+            progress_callback("read", address + length - start, size)
+    read_seconds = time.time() - read_start
+
+    return MemTestResult(pattern, size, write_seconds, read_seconds, failures, failure_count)
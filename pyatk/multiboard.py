@@ -0,0 +1,151 @@
+# Copyright (c) 2012-2013 Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Run the same job on many boards at once, one worker process per board.
+"""
+import os
+import re
+import sys
+import time
+import traceback
+import collections
+import multiprocessing
+import multiprocessing.connection
+
+#: The outcome of a job on one board.  ``value`` is what the job returned
+#: (``None`` if it failed), ``error`` a description of the failure (``None``
+#: if it succeeded) and ``log_path`` the file holding the job's output.
+BoardResult = collections.namedtuple(
+    "BoardResult", ("target", "ok", "elapsed", "value", "error", "log_path")
+)
+
+# How often the parent checks on its workers, in seconds.
+_POLL_INTERVAL = 0.1
+
+def log_path_for(log_dir, target):
+    """ Return the log file path for ``target`` in ``log_dir``. """
+    return os.path.join(log_dir, "board-%s.log" % re.sub(r"[^\w.-]", "_", str(target)))
+
+def _worker(func, target, log_path, conn):
+    start = time.time()
+    value = None
+    error = None
+    with open(log_path, "w") as log:
+        sys.stdout = sys.stderr = log
+        try:
+            value = func(target)
+        # The job may call sys.exit(); that is a failure like any other.
+        except BaseException as err:
+            traceback.print_exc()
+            error = "%s: %s" % (type(err).__name__, err)
+        finally:
+            log.flush()
+
+    conn.send((target, error is None, time.time() - start, value, error))
+    conn.close()
+
+def run_boards(targets, func, log_dir, timeout = None, max_workers = None):
+    """
+    Run ``func(target)`` for every item of ``targets``, each in its own
+    process with standard output and error going to a per-target log file in
+    ``log_dir``.  At most ``max_workers`` (default: all) run at once.
+
+    A job still running ``timeout`` seconds after it started is terminated
+    and counted as failed; a failing or hung board never holds up the
+    others.  Each worker reports back over its own pipe, so terminating
+    one cannot damage another's result.
+
+    ``func`` must be picklable (a module-level function or a
+    :func:`functools.partial` of one).
+
+    Return a list of :class:`BoardResult`, in the order of ``targets``.
+    """
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+
+    if max_workers is None:
+        max_workers = len(targets)
+
+    pending = collections.deque(targets)
+    running = {}
+    results = {}
+
+    def finish(target, ok, elapsed, value, error):
+        entry = running.pop(target, None)
+        if entry is None:
+            # Already counted, e.g. timed out just as it reported.
+            return
+
+        process, _, receiver = entry
+        process.join()
+        receiver.close()
+        results[target] = BoardResult(target, ok, elapsed, value, error,
+                                      log_path_for(log_dir, target))
+
+    def receive(target, receiver):
+        """ Finish ``target`` with the result it sent, if it sent one. """
+        try:
+            if receiver.poll():
+                finish(*receiver.recv())
+        # It died without reporting (or part way through).
+        except (EOFError, OSError):
+            pass
+
+    while pending or running:
+        while pending and len(running) < max_workers:
+            target = pending.popleft()
+            receiver, sender = multiprocessing.Pipe(duplex = False)
+            process = multiprocessing.Process(target = _worker,
+                                              args = (func, target,
+                                                      log_path_for(log_dir, target),
+                                                      sender))
+            process.daemon = True
+            process.start()
+            # Only the worker writes to its pipe.
+            sender.close()
+            running[target] = (process, time.time(), receiver)
+
+        receivers = dict((receiver, target)
+                         for target, (_, _, receiver) in running.items())
+        for receiver in multiprocessing.connection.wait(list(receivers),
+                                                        timeout = _POLL_INTERVAL):
+            receive(receivers[receiver], receiver)
+
+        now = time.time()
+        for target, (process, started, receiver) in list(running.items()):
+            if timeout is not None and now - started > timeout:
+                # A result that arrived in the meantime still counts.
+                receive(target, receiver)
+                if target in running:
+                    process.terminate()
+                    finish(target, False, now - started, None,
+                           "timed out after %u s" % timeout)
+
+            elif not process.is_alive():
+                # It may have sent its result just before exiting.
+                receive(target, receiver)
+                if target in running:
+                    finish(target, False, now - started, None,
+                           "worker exited with code %s" % process.exitcode)
+
+    return [results[target] for target in targets]
@@ -25,9 +25,14 @@
 Freescale i.MX ATK RAM kernel protocol implementation
 """
 import os
+import time
 import struct
+import hashlib
+import collections
+import concurrent.futures
 
 from pyatk import boot
+from pyatk import timing
 
 HEADER_MAGIC = 0x0606
 
@@ -53,6 +58,26 @@ FLASH_PROGRAM_PARAM1_GO_ON  = 0x00000100
 # will fail.
 FLASH_PROGRAM_MAX_WRITE_SIZE = (2 * 1024 * 1024)
 
+#: Default flash block size assumed by :meth:`RAMKernelProtocol.program_stream`.
+DEFAULT_FLASH_BLOCK_SIZE = 0x20000
+
+#: The outcome of :meth:`RAMKernelProtocol.program_stream`: ``size`` bytes of
+#: the stream written in ``chunks`` flash_program requests, taking
+#: ``seconds`` in all.  ``skipped`` bytes were in erased blocks that were
+#: erased rather than programmed, and ``unchanged`` bytes were in blocks
+#: already holding the same data, which were left alone.
+ProgramStreamResult = collections.namedtuple(
+    "ProgramStreamResult", ("size", "chunks", "seconds", "skipped", "unchanged")
+)
+
+# What program_stream does with a run of blocks.
+_RUN_PROGRAM = "program"
+_RUN_ERASE   = "erase"
+_RUN_KEEP    = "keep"
+
+#: Value of every byte of an erased flash block.
+ERASED_BYTE = b"\xff"
+
 CMD_FUSE = 0x0100
 ## RKL eFUSE commands
 CMD_FUSE_READ     = 0x0101
@@ -172,6 +197,13 @@ class CommandResponseError(RAMKernelError):
     def __str__(self):
         return "Command 0x%04X failed: ack code 0x%04X (%s)" % (self.command, self.ack, self.ack_str)
 
+class ProgramRejectedError(CommandResponseError):
+    """
+    The RAM kernel refused a flash program request before any data was sent,
+    for instance because it does not implement :const:`CMD_FLASH_PROGRAM_UB`.
+    """
+    pass
+
 def calculate_checksum(buf):
     """ Perform a simple 16-bit checksum on the bytes in ``buf``. """
     checksum = 0
@@ -180,6 +212,322 @@ def calculate_checksum(buf):
 
     return checksum
 
+def _command_packet(command, address, param1, param2):
+    """ Return the raw RAM kernel command packet. """
+    return struct.pack(">HHIII", HEADER_MAGIC, command, address, param1, param2)
+
+def _unpack_response(response):
+    """ Return ``(ack, checksum, length)`` from a raw 8-byte RAM kernel response. """
+    ack, checksum, length = struct.unpack(">hHI", response)
+    return ack, checksum, length
+
+def _check_program_args(start_address, data, file_format):
+    """ Sanity-check the arguments to :meth:`RAMKernelProtocol.flash_program`. """
+    if start_address < 0:
+        raise ValueError("Invalid start address %r" % start_address)
+
+    if len(data) == 0:
+        raise ValueError("Data length must be non-zero.")
+    if len(data) > FLASH_PROGRAM_MAX_WRITE_SIZE:
+        raise ValueError("Data length is too large - max length is %d bytes." % FLASH_PROGRAM_MAX_WRITE_SIZE)
+
+    if file_format not in (FLASH_FILE_FORMAT_NORMAL,
+                           FLASH_FILE_FORMAT_NB0,
+                           FLASH_FILE_FORMAT_OPS):
+        raise ValueError("Invalid file format %r" % file_format)
+
+def _read_exactly(fileobj, size):
+    """ Read ``size`` bytes from ``fileobj``, or fewer only at end of file. """
+    data = fileobj.read(size)
+    if len(data) == size or not data:
+        return data
+
+    # Pipes and sockets may return less than asked for before the end.
+    parts = [data]
+    remaining = size - len(data)
+    while remaining:
+        data = fileobj.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+
+    return b"".join(parts)
+
+def block_digest(data):
+    """
+    Return the content hash of the flash block contents ``data``, as
+    recorded by :meth:`RAMKernelProtocol.program_stream`.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+def _is_erased(data, offset, length):
+    """ Return True if ``length`` bytes of ``data`` at ``offset`` are all erased. """
+    # Compares in place, without copying the block out of data.
+    return data.startswith(ERASED_BYTE * length, offset)
+
+def _block_runs(data, block_size, classify):
+    """
+    Split ``data``, which starts on a block boundary, into maximal runs of
+    blocks for which ``classify(offset, length)`` returns the same kind.
+    Return a list of ``(offset, length, kind)``.
+    """
+    runs = []
+    for offset in range(0, len(data), block_size):
+        length = min(block_size, len(data) - offset)
+        kind = classify(offset, length)
+
+        if runs and runs[-1][2] == kind:
+            runs[-1][1] += length
+        else:
+            runs.append([offset, length, kind])
+
+    return [tuple(run) for run in runs]
+
+def _add_range(ranges, start, end):
+    """
+    Return the sorted list of ``(start, end)`` ranges ``ranges`` with
+    ``[start, end)`` added, merging ranges that overlap or touch.
+    """
+    merged = []
+    for range_start, range_end in ranges:
+        if range_end < start or end < range_start:
+            merged.append((range_start, range_end))
+        else:
+            start, end = min(start, range_start), max(end, range_end)
+
+    merged.append((start, end))
+    merged.sort()
+    return merged
+
+def _subtract_ranges(ranges, removed):
+    """
+    Return the sorted list of ``(start, end)`` ranges ``ranges`` without
+    the parts covered by the ranges in ``removed``.
+    """
+    remaining = list(ranges)
+    for removed_start, removed_end in removed:
+        kept = []
+        for start, end in remaining:
+            if removed_start > start:
+                kept.append((start, min(end, removed_start)))
+            if removed_end < end:
+                kept.append((max(start, removed_end), end))
+        remaining = [(start, end) for start, end in kept if start < end]
+
+    return remaining
+
+def _align_ranges(ranges, block_size):
+    """ Return ``ranges`` grown to whole blocks of ``block_size``, merged. """
+    aligned = []
+    for start, end in ranges:
+        aligned = _add_range(aligned, start - start % block_size, end - end % -block_size)
+    return aligned
+
+class ErasePlanner(object):
+    """
+    Collect the flash erases of a job, together with the ranges the job
+    will program, and erase with as few :meth:`~RAMKernelProtocol.flash_erase`
+    commands as possible through :class:`RAMKernelProtocol` ``kernel``.
+
+    Overlapping and adjacent erases are merged.  Erases of whole blocks
+    that a later :meth:`~RAMKernelProtocol.program_stream` will program
+    are dropped, as the stock RAM kernel erases every block it programs.
+    ``block_size`` is the block size given to ``program_stream``: blocks
+    it writes only in part are still erased.
+
+    Once the RAM kernel has reported its erase block size (see
+    :attr:`RAMKernelProtocol.erase_block_size`), erases are also grown
+    to whole blocks, so that two erases within one block cost one command.
+    """
+    def __init__(self, kernel, block_size = DEFAULT_FLASH_BLOCK_SIZE):
+        if block_size <= 0:
+            raise ValueError("Invalid block size %r" % (block_size,))
+
+        self.kernel = kernel
+        self.block_size = block_size
+        # Sorted, merged (start, end) ranges still to erase, and to program.
+        self._erases = []
+        self._programs = []
+
+    def _check_range(self, address, size):
+        if address < 0:
+            raise ValueError("Invalid start address %r" % address)
+        if size < 0:
+            raise ValueError("Invalid size %r" % size)
+
+    def erase(self, address, size):
+        """ Queue an erase of ``size`` bytes at ``address``. """
+        self._check_range(address, size)
+        if size:
+            self._erases = _add_range(self._erases, address, address + size)
+
+    def program(self, address, size):
+        """
+        Note that the job will program ``size`` bytes at ``address`` with
+        :meth:`~RAMKernelProtocol.program_stream` after erasing.
+        """
+        self._check_range(address, size)
+        if size:
+            self._programs = _add_range(self._programs, address, address + size)
+
+    def plan(self):
+        """
+        Return the erases still to be done, as a list of ``(address, size)``
+        in address order.
+        """
+        device_block_size = self.kernel.erase_block_size
+
+        # The blocks program_stream sends with CMD_FLASH_PROGRAM; a partial
+        # first block is merged with what is in flash, so it is not covered.
+        covered = []
+        for start, end in self._programs:
+            start += -start % self.block_size
+            if device_block_size:
+                end -= end % -device_block_size
+            if start < end:
+                covered.append((start, end))
+
+        erases = _subtract_ranges(self._erases, covered)
+        if device_block_size:
+            erases = _align_ranges(erases, device_block_size)
+
+        return [(start, end - start) for start, end in erases]
+
+    def execute(self, erase_callback = None):
+        """
+        Perform the planned erases, passing ``erase_callback`` to
+        :meth:`~RAMKernelProtocol.flash_erase`.  Return the list of
+        ``(address, size)`` erased.
+
+        The plan is made again after each erase, so that the block size
+        the first erase reports is used for the rest.
+        """
+        erased = []
+        while True:
+            erases = self.plan()
+            if not erases:
+                break
+
+            address, size = erases[0]
+            self.kernel.flash_erase(address, size, erase_callback = erase_callback)
+            erased.append((address, size))
+
+            # The whole of every block touched is erased now.
+            done = [(address, address + size)]
+            if self.kernel.erase_block_size:
+                done = _align_ranges(done, self.kernel.erase_block_size)
+            self._erases = _subtract_ranges(self._erases, done)
+
+        return erased
+
+class PartialBlockWriter(object):
+    """
+    Collect writes to arbitrary flash addresses through
+    :class:`RAMKernelProtocol` ``kernel``, then program each block they
+    touch once, keeping the parts of the block that were not written.
+
+    A block written in full is simply programmed.  A block written in part
+    is programmed with :const:`CMD_FLASH_PROGRAM_UB` if its writes form a
+    single range and the RAM kernel accepts that command (see
+    :attr:`RAMKernelProtocol.program_ub`).  Otherwise the block is read
+    with :meth:`~RAMKernelProtocol.flash_dump`, the writes are merged into
+    it on the host and the result is programmed whole.
+    """
+    def __init__(self, kernel, block_size = DEFAULT_FLASH_BLOCK_SIZE):
+        if block_size <= 0 or block_size > FLASH_PROGRAM_MAX_WRITE_SIZE:
+            raise ValueError("Invalid block size %r" % (block_size,))
+
+        self.kernel = kernel
+        self.block_size = block_size
+        # Block address -> (contents written so far, sorted written ranges).
+        self._blocks = {}
+
+    @property
+    def pending(self):
+        """ Addresses of the blocks the next :meth:`flush` will program. """
+        return sorted(self._blocks)
+
+    def write(self, address, data):
+        """
+        Queue ``data`` to be written at ``address``.  Later writes replace
+        earlier ones where they overlap.
+        """
+        if address < 0:
+            raise ValueError("Invalid start address %r" % address)
+
+        view = memoryview(data)
+        while len(view):
+            offset = address % self.block_size
+            block_address = address - offset
+            length = min(len(view), self.block_size - offset)
+
+            contents, ranges = self._blocks.get(block_address,
+                                                (bytearray(self.block_size), []))
+            contents[offset:offset + length] = view[:length]
+            self._blocks[block_address] = (contents,
+                                           _add_range(ranges, offset, offset + length))
+
+            address += length
+            view = view[length:]
+
+    def flush(self, read_back_verify = False,
+              program_callback = None,
+              verify_callback = None):
+        """
+        Program every block written since the last flush, in address order,
+        passing ``read_back_verify``, ``program_callback`` and
+        ``verify_callback`` to :meth:`~RAMKernelProtocol.flash_program`.
+
+        Return a dictionary mapping each block address to the block's new
+        contents, or to ``None`` if it was programmed with
+        :const:`CMD_FLASH_PROGRAM_UB` and only the written range is known.
+        :exc:`CommandResponseError` is raised, before the block is
+        programmed, if it cannot be read back whole.
+        """
+        kernel = self.kernel
+        program_args = dict(read_back_verify = read_back_verify,
+                            program_callback = program_callback,
+                            verify_callback = verify_callback)
+        programmed = {}
+
+        for block_address in sorted(self._blocks):
+            contents, ranges = self._blocks[block_address]
+
+            if [(0, self.block_size)] == ranges:
+                kernel.flash_program(block_address, contents, **program_args)
+                programmed[block_address] = bytes(contents)
+
+            elif 1 == len(ranges) and kernel.program_ub is not False:
+                start, end = ranges[0]
+                try:
+                    kernel.flash_program(block_address + start, memoryview(contents)[start:end],
+                                         unaligned = True, **program_args)
+                    kernel.program_ub = True
+                    programmed[block_address] = None
+
+                except ProgramRejectedError:
+                    # Known to work before: this is a real failure.
+                    if kernel.program_ub:
+                        raise
+                    kernel.program_ub = False
+
+            if block_address not in programmed:
+                current = bytearray(kernel.flash_dump(block_address, self.block_size))
+                # Programming a short merge would lose the rest of the block.
+                if len(current) < self.block_size:
+                    raise CommandResponseError(CMD_FLASH_DUMP, FLASH_ERROR_EOF, len(current))
+                del current[self.block_size:]
+                for start, end in ranges:
+                    current[start:end] = contents[start:end]
+
+                kernel.flash_program(block_address, current, **program_args)
+                programmed[block_address] = bytes(current)
+
+            del self._blocks[block_address]
+
+        return programmed
+
 class RAMKernelProtocol(object):
     """
     Implementation of the host side of the i.MX RAM kernel protocol.  It is used
@@ -198,29 +546,38 @@ class RAMKernelProtocol(object):
         # True if the RAM kernel itself has been loaded.x
         self._kernel_init = False
 
+        #: Flash block size reported by the last :meth:`flash_erase`, or
+        #: ``None`` before any block has been erased.
+        self.erase_block_size = None
+
+        #: Whether the RAM kernel accepts :const:`CMD_FLASH_PROGRAM_UB`:
+        #: ``True``, ``False``, or ``None`` until :class:`PartialBlockWriter`
+        #: has tried it.
+        self.program_ub = None
+
     def _read_response(self):
         """
         Read the device response and return
         """
-        response = self.channel.read(8)
+        return _unpack_response(self.channel.read(8))
+
+    def _check_state(self, command):
+        """ Ensure the kernel (and flash, if needed) is initialized before sending ``command``. """
+        if not self._kernel_init:
+            raise KernelNotInitializedError("Cannot send RAM kernel command without first loading kernel!")
+        if (CMD_FLASH == (command & 0xFF00)) and (CMD_FLASH_INITIAL != command):
+            if not self._flash_init:
+                raise KernelNotInitializedError("Cannot use flash-layer command without first using flash_initial()!")
 
-        ack, checksum, length = struct.unpack(">hHI", response)
-        return ack, checksum, length
-        
     def _send_command(self, command,
                       address = 0x00000000,
                       param1  = 0x00000000,
                       param2  = 0x00000000,
                       wait_for_response = True):
         # Ensure we've initialized the kernel properly.
-        if not self._kernel_init:
-            raise KernelNotInitializedError("Cannot send RAM kernel command without first loading kernel!")
-        if (CMD_FLASH == (command & 0xFF00)) and (CMD_FLASH_INITIAL != command):
-            if not self._flash_init:
-                raise KernelNotInitializedError("Cannot use flash-layer command without first using flash_initial()!")
+        self._check_state(command)
 
-        rawcmd = struct.pack(">HHIII", HEADER_MAGIC, command, address, param1, param2)
-        self.channel.write(rawcmd)
+        self.channel.write(_command_packet(command, address, param1, param2))
 
         if wait_for_response:
             ack, checksum, length = self._read_response()
@@ -299,6 +656,26 @@ class RAMKernelProtocol(object):
 
         return checksum, payload
 
+    def fuse_read(self, address):
+        """
+        Return the value of the fuse row at ``address``, which the RAM
+        kernel sends back in the length field of its response.  Fuse
+        addresses are specific to the i.MX processor family.
+        """
+        _, _, value = self._send_command(CMD_FUSE_READ, address = address)
+        return value
+
+    def wait_ready(self, timeout = boot.DEFAULT_READY_TIMEOUT):
+        """
+        Poll :meth:`getver`, with exponential backoff, until the RAM kernel
+        answers (for instance, once it has finished a long flash
+        operation).  Return the tuple ``(getver_result, elapsed)``, with
+        ``elapsed`` the seconds spent waiting.  If there is still no answer
+        after ``timeout`` seconds, the last error is raised.
+        """
+        return timing.retry(self.getver, timeout,
+                            exceptions = boot.PROBE_ERRORS + (CommandResponseError,))
+
     def flash_initial(self):
         """
         Initialize the device flash subsystem. This **must** be called prior
@@ -409,7 +786,9 @@ class RAMKernelProtocol(object):
         **NOTE**: most flash devices will generally erase entire blocks. Block size
         is dependent on the flash device itself, but is usually many pages (e.g.,
         128 1 KB pages). If ``size`` does not match the block size boundary,
-        more data will be erased to meet the boundary.
+        more data will be erased to meet the boundary.  The block size the
+        RAM kernel reports is kept in :attr:`erase_block_size`; see also
+        :class:`ErasePlanner`.
         """
         self._send_command(CMD_FLASH_ERASE,
                            address = start_address,
@@ -425,8 +804,11 @@ class RAMKernelProtocol(object):
             # For each erased block, an ACK_FLASH_ERASE response is returned
             # from the RAM kernel specifying which block was erased, and
             # how big the block size is.
-            if ACK_FLASH_ERASE == ack and erase_callback:
-                erase_callback(i, block_size)
+            if ACK_FLASH_ERASE == ack:
+                if block_size:
+                    self.erase_block_size = block_size
+                if erase_callback:
+                    erase_callback(i, block_size)
 
             if ack not in (ACK_FLASH_ERASE, ACK_SUCCESS):
                 raise CommandResponseError(CMD_FLASH_ERASE, ack, block_size)
@@ -435,7 +817,8 @@ class RAMKernelProtocol(object):
                       file_format = FLASH_FILE_FORMAT_NORMAL,
                       read_back_verify = False,
                       program_callback = None,
-                      verify_callback = None):
+                      verify_callback = None,
+                      unaligned = False):
         """
         Program the flash device with ``data`` starting at ``start_address``.
         The maximum size of ``data`` is :const:`FLASH_PROGRAM_MAX_WRITE_SIZE`;
@@ -448,6 +831,13 @@ class RAMKernelProtocol(object):
         Beware of this limitation; you cannot simply start writing anywhere within
         the flash block.
 
+        If ``unaligned`` is ``True``, :const:`CMD_FLASH_PROGRAM_UB` is sent
+        instead, asking the RAM kernel to write ``data`` at ``start_address``
+        and keep the rest of the block.  Not every RAM kernel implements it;
+        see :class:`PartialBlockWriter`.  If the RAM kernel refuses the
+        request before any data is sent, :exc:`ProgramRejectedError` is
+        raised.
+
         If ``read_back_verify`` is ``True``, the flash region to be programmed
         is read back for verification.
 
@@ -461,23 +851,14 @@ class RAMKernelProtocol(object):
         verified by the RAM kernel.  ``verify_callback`` must take two parameters
         ``(block, verify_length)``, similar to the parameters to ``program_callback`` above.
         """
-        if start_address < 0:
-            raise ValueError("Invalid start address %r" % start_address)
+        _check_program_args(start_address, data, file_format)
 
-        if len(data) == 0:
-            raise ValueError("Data length must be non-zero.")
-        if len(data) > FLASH_PROGRAM_MAX_WRITE_SIZE:
-            raise ValueError("Data length is too large - max length is %d bytes." % FLASH_PROGRAM_MAX_WRITE_SIZE)
-
-        if file_format not in (FLASH_FILE_FORMAT_NORMAL,
-                               FLASH_FILE_FORMAT_NB0,
-                               FLASH_FILE_FORMAT_OPS):
-            raise ValueError("Invalid file format %r" % file_format)
-
-        # FIXME: CMD_FLASH_PROGRAM_UB is not used in the supplied RAM kernel for NAND flash.
-        # It seems to be for programming not at page boundaries? (UB = "un-boundary"
-        # in the ATK source code).
-        flash_command = CMD_FLASH_PROGRAM
+        # CMD_FLASH_PROGRAM_UB ("un-boundary" in the ATK source code) is not
+        # implemented by the supplied RAM kernel for NAND flash.
+        if unaligned:
+            flash_command = CMD_FLASH_PROGRAM_UB
+        else:
+            flash_command = CMD_FLASH_PROGRAM
 
         flags = file_format
         if read_back_verify:
@@ -496,7 +877,7 @@ class RAMKernelProtocol(object):
         # read back ACK_FLASH_PARTLY
         ack, checksum, length = self._read_response()
         if ACK_SUCCESS != ack:
-            raise CommandResponseError(flash_command, ack, length)
+            raise ProgramRejectedError(flash_command, ack, length)
 
         # Send the entire data block at once. The underlying channel
         # breaks this into appropriate writeable chunks.
@@ -533,6 +914,177 @@ class RAMKernelProtocol(object):
         if ACK_SUCCESS != ack:
             raise CommandResponseError(flash_command, ack, length)
 
+    def program_stream(self, start_address, fileobj,
+                       length = None,
+                       block_size = DEFAULT_FLASH_BLOCK_SIZE,
+                       chunk_size = None,
+                       read_back_verify = False,
+                       digest = None,
+                       sparse = False,
+                       previous = None,
+                       block_hashes = None,
+                       program_callback = None,
+                       verify_callback = None,
+                       erase_callback = None):
+        """
+        Program the flash device with the contents of file-like object
+        ``fileobj`` starting at ``start_address``, reading ``length`` bytes
+        or, if ``length`` is ``None``, up to end of file.  Return a
+        :class:`ProgramStreamResult`.
+
+        The data is sent with :meth:`flash_program` in chunks of
+        ``chunk_size`` bytes, by default the largest multiple of
+        ``block_size`` the RAM kernel accepts, each starting on a block
+        boundary.  If ``start_address`` is not on a block boundary, the data
+        up to the next boundary is written with a :class:`PartialBlockWriter`,
+        keeping the start of its block.  The next chunk is read, on a worker
+        thread, while the current one is programmed and verified.
+
+        If ``digest`` (a :mod:`hashlib` object) is given, it is updated
+        with the data read from ``fileobj``, also on the worker thread.
+        ``read_back_verify``, ``program_callback`` and ``verify_callback``
+        are passed to :meth:`flash_program`.
+
+        If ``sparse`` is ``True``, blocks that are entirely erased (0xFF) are
+        not sent: runs of them are erased with :meth:`flash_erase` (which
+        calls ``erase_callback``) and the blocks between them are programmed
+        with as few :meth:`flash_program` requests as possible.  Erased
+        blocks are not read back, even with ``read_back_verify``.
+
+        ``block_hashes``, if given, is a dictionary that is filled in with
+        ``address: (length, digest)`` (see :func:`block_digest`) for every
+        block of the image whose contents are known.  A partial first block
+        programmed with :const:`CMD_FLASH_PROGRAM_UB` maps to ``None``: it
+        has changed, but its new contents are not known.  If
+        ``previous`` holds such a dictionary for what is known to be in
+        flash already, whole blocks that would not change are neither
+        erased nor programmed.
+        """
+        if block_size <= 0:
+            raise ValueError("Invalid block size %r" % (block_size,))
+        if chunk_size is None:
+            chunk_size = (FLASH_PROGRAM_MAX_WRITE_SIZE // block_size) * block_size
+        if chunk_size <= 0 or chunk_size % block_size or chunk_size > FLASH_PROGRAM_MAX_WRITE_SIZE:
+            raise ValueError("Chunk size must be a multiple of the block size "
+                             "no larger than %d bytes." % FLASH_PROGRAM_MAX_WRITE_SIZE)
+        if start_address < 0:
+            raise ValueError("Invalid start address %r" % start_address)
+
+        remaining = [length]
+
+        def read(size):
+            """ Read up to ``size`` bytes of the stream. """
+            if remaining[0] is not None:
+                size = min(size, remaining[0])
+
+            data = _read_exactly(fileobj, size) if size else b""
+            if remaining[0] is not None:
+                if len(data) < size:
+                    raise ValueError("File stream ends early; %u bytes missing." %
+                                     (remaining[0] - len(data)))
+                remaining[0] -= len(data)
+
+            if digest is not None:
+                digest.update(data)
+            return data
+
+        def prepare(size):
+            """
+            Read and classify the next chunk.  Return the tuple ``(chunk,
+            runs)``.
+            """
+            chunk = read(size)
+            if not chunk:
+                return b"", []
+
+            chunk_address = next_address[0]
+            next_address[0] += len(chunk)
+
+            def classify(offset, length):
+                block_address = chunk_address + offset
+                if block_hashes is not None or previous:
+                    entry = (length, block_digest(memoryview(chunk)[offset:offset + length]))
+                    if block_hashes is not None:
+                        block_hashes[block_address] = entry
+                    if previous and previous.get(block_address) == entry:
+                        return _RUN_KEEP
+
+                if sparse and _is_erased(chunk, offset, length):
+                    return _RUN_ERASE
+                return _RUN_PROGRAM
+
+            return chunk, _block_runs(chunk, block_size, classify)
+
+        start = time.time()
+        programmed = 0
+        chunks = 0
+
+        if start_address % block_size:
+            head = read(block_size - start_address % block_size)
+            if head:
+                writer = PartialBlockWriter(self, block_size)
+                writer.write(start_address, head)
+                for block_address, contents in writer.flush(read_back_verify = read_back_verify,
+                                                            program_callback = program_callback,
+                                                            verify_callback = verify_callback).items():
+                    if block_hashes is not None:
+                        block_hashes[block_address] = (
+                            None if contents is None else (len(contents), block_digest(contents)))
+                programmed += len(head)
+                chunks += 1
+
+        address = start_address + (-start_address % block_size)
+        # The block address of the next chunk prepare() reads.
+        next_address = [address]
+        skipped = 0
+        unchanged = 0
+        # Erased blocks not yet erased.  They always end where the next run
+        # starts, so a long stretch of them, even across chunks, is erased
+        # with one flash_erase.
+        erase_address = None
+        erase_length = 0
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers = 1) as executor:
+            pending = executor.submit(prepare, chunk_size)
+            while True:
+                chunk, runs = pending.result()
+                if not chunk:
+                    break
+
+                # Double buffering: read the next chunk while this one programs.
+                pending = executor.submit(prepare, chunk_size)
+                view = memoryview(chunk)
+                for offset, run_length, kind in runs:
+                    if _RUN_ERASE == kind:
+                        if erase_address is None:
+                            erase_address = address + offset
+                        erase_length += run_length
+                        skipped += run_length
+                        continue
+
+                    if erase_address is not None:
+                        self.flash_erase(erase_address, erase_length,
+                                         erase_callback = erase_callback)
+                        erase_address, erase_length = None, 0
+
+                    if _RUN_KEEP == kind:
+                        unchanged += run_length
+                        continue
+
+                    self.flash_program(address + offset, view[offset:offset + run_length],
+                                       read_back_verify = read_back_verify,
+                                       program_callback = program_callback,
+                                       verify_callback = verify_callback)
+                    chunks += 1
+
+                address += len(chunk)
+                programmed += len(chunk)
+
+            if erase_address is not None:
+                self.flash_erase(erase_address, erase_length, erase_callback = erase_callback)
+
+        return ProgramStreamResult(programmed, chunks, time.time() - start, skipped, unchanged)
+
     def reset(self):
         """
         Reset the device CPU.
@@ -0,0 +1,122 @@
+# Copyright (c) 2012-2013 Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Drive boot and RAM kernel sessions on many boards from a single asyncio
+event loop, without a thread or process per board.
+
+Requires Python 3.7 or later.
+"""
+import time
+import asyncio
+
+from pyatk.channel import aio
+from pyatk import aioboot
+from pyatk import aioramkernel
+from pyatk.multiboard import BoardResult
+
+class BoardSession(object):
+    """
+    One board's asynchronous channel and protocol handlers, handed to the
+    job coroutine run for that board.
+    """
+    def __init__(self, name, channel):
+        self.name = name
+        #: The board's :class:`~pyatk.channel.aio.AsyncATKChannelI`.
+        self.channel = channel
+        self.sbp = aioboot.AsyncSerialBootProtocol(channel)
+        self.kernel = aioramkernel.AsyncRAMKernelProtocol(channel)
+
+class SessionScheduler(object):
+    """
+    Run a job on each of many boards, all from one event loop.
+
+    Boards are added with :meth:`add` and run together with :meth:`run`.
+    Each job is a coroutine function called with the board's
+    :class:`BoardSession`; sessions interleave whenever one waits on its
+    channel, so a board streaming ``write_file`` chunks does not hold up
+    another parsing ``flash_program`` responses.
+
+    :class:`~pyatk.channel.uart.UARTChannel` ports are serviced with event
+    loop reader and writer callbacks on their file descriptors (POSIX);
+    other channels fall back to a worker thread each (see
+    :func:`~pyatk.channel.aio.async_channel`).
+    """
+    def __init__(self, timeout = None):
+        #: Default limit, in seconds, on each board's whole job.
+        self.timeout = timeout
+        self._boards = []
+
+    def add(self, name, channel, job, timeout = None):
+        """
+        Run coroutine function ``job`` on the board reached through blocking
+        channel ``channel`` (or an
+        :class:`~pyatk.channel.aio.AsyncATKChannelI`).  The job fails if it
+        has not finished within ``timeout`` seconds (default: the scheduler
+        ``timeout``); individual reads still time out according to the
+        channel's own read timeout.
+        """
+        if any(name == board[0] for board in self._boards):
+            raise ValueError("Board %r already added." % (name,))
+
+        if timeout is None:
+            timeout = self.timeout
+
+        self._boards.append((name, channel, job, timeout))
+
+    async def _run_board(self, name, channel, job, timeout):
+        if not isinstance(channel, aio.AsyncATKChannelI):
+            channel = aio.async_channel(channel)
+
+        start = time.time()
+        value = None
+        error = None
+        try:
+            await channel.open()
+            try:
+                value = await asyncio.wait_for(job(BoardSession(name, channel)), timeout)
+            finally:
+                await channel.close()
+
+        except asyncio.TimeoutError:
+            error = "timed out after %g s" % (timeout,)
+
+        except Exception as err:
+            error = "%s: %s" % (type(err).__name__, err)
+
+        return BoardResult(name, error is None, time.time() - start, value, error, None)
+
+    async def run_async(self):
+        """
+        Coroutine version of :meth:`run`, for callers that already have an
+        event loop running.
+        """
+        return await asyncio.gather(*[self._run_board(*board) for board in self._boards])
+
+    def run(self):
+        """
+        Run every board's job to completion.  A failing board does not stop
+        the others.  Return a list of
+        :class:`~pyatk.multiboard.BoardResult`, in the order the boards
+        were added (``log_path`` is always ``None``).
+        """
+        return asyncio.run(self.run_async())
@@ -0,0 +1,354 @@
+# Copyright (c) 2012-2013, Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+A simulated i.MX board for exercising channels and the session scheduler
+over real file descriptors (pseudo-terminal pairs), or directly through
+:class:`BoardChannel`.
+"""
+import os
+import errno
+import struct
+import selectors
+import threading
+
+from pyatk.channel.base import ATKChannelI, ChannelReadTimeout
+from pyatk import boot
+from pyatk import ramkernel
+
+class SimulatedBoard(object):
+    """
+    Enough of the Serial Boot Protocol and RAM kernel to load a RAM kernel
+    with ``write_file`` and then ``flash_initial``, ``getver``, erase and
+    program flash.  Feed it what the host wrote; it returns the bytes the
+    board would send back.
+
+    Progress responses for erase and program are sent every
+    ``report_size`` bytes.
+
+    With ``memory_size``, the board also has that much SDRAM at
+    ``memory_base`` for ``write_file``, ``write_memory`` and
+    ``read_memory``.  ``faults`` maps word addresses to a mask of bits
+    that read back inverted.
+
+    With ``flash_size``, the RAM kernel's flash is kept too, in blocks of
+    ``flash_block_size``, for erase, program and dump.  Like the stock RAM
+    kernel, program erases and writes from the start of the block;
+    ``CMD_FLASH_PROGRAM_UB`` is only accepted if ``program_ub`` is set.
+
+    ``load_status``, if not ``None``, is the status sent once the data of a
+    file other than an application has arrived, as HAB4 ROMs send
+    ``BOOT_PROTOCOL_COMPLETE``.  As on the i.MX25 over USB, a file that is
+    a multiple of 64 bytes long must be followed by one more byte before
+    the board goes on.
+    """
+    def __init__(self, report_size = 64 * 1024, flash_model = b"Simulated NAND",
+                 memory_base = 0, memory_size = 0,
+                 flash_size = 0, flash_block_size = 0x20000, program_ub = False,
+                 load_status = None):
+        self.report_size = report_size
+        self.flash_model = flash_model
+        #: Total bytes received in write_file and flash_program payloads.
+        self.payload_bytes = 0
+
+        self.memory_base = memory_base
+        self.memory = bytearray(memory_size)
+        self.faults = {}
+        self.load_status = load_status
+
+        self.flash = bytearray(ramkernel.ERASED_BYTE * flash_size)
+        self.flash_block_size = flash_block_size
+        self.program_ub = program_ub
+        #: Number of CMD_FLASH_ERASE commands received.
+        self.erase_commands = 0
+
+        self._buffer = bytearray()
+        # Bytes of payload still to arrive, where to store them (or None),
+        # and what to send once they have.
+        self._discard = 0
+        self._store_address = None
+        self._store_fn = None
+        self._after_discard = None
+        self._booted = False
+
+    def feed(self, data):
+        """ Accept ``data`` from the host and return the board's reply. """
+        self._buffer += data
+        reply = bytearray()
+
+        while True:
+            if self._discard:
+                count = min(self._discard, len(self._buffer))
+                if self._store_address is not None:
+                    self._store_fn(self._store_address, self._buffer[:count])
+                    self._store_address += count
+                del self._buffer[:count]
+                self._discard -= count
+                self.payload_bytes += count
+                if self._discard:
+                    break
+                reply += self._after_discard()
+                # The reply may be to wait for more payload.
+                continue
+
+            if len(self._buffer) < 16:
+                break
+
+            command = bytes(self._buffer[:16])
+            del self._buffer[:16]
+            reply += self._command(command)
+
+        return bytes(reply)
+
+    def _store(self, address, data):
+        offset = address - self.memory_base
+        if 0 <= offset and offset + len(data) <= len(self.memory):
+            self.memory[offset:offset + len(data)] = data
+
+    def _load(self, address, length):
+        offset = address - self.memory_base
+        if not (0 <= offset and offset + length <= len(self.memory)):
+            return b"\x00" * length
+
+        data = bytearray(self.memory[offset:offset + length])
+        for fault_address, mask in self.faults.items():
+            fault_offset = fault_address - address
+            if 0 <= fault_offset < length:
+                word, = struct.unpack_from("<I", data, fault_offset)
+                struct.pack_into("<I", data, fault_offset, word ^ mask)
+        return bytes(data)
+
+    def _flash_erase(self, address, length):
+        # Whole blocks are erased.
+        start = address - address % self.flash_block_size
+        end = address + length
+        end = min(end - end % -self.flash_block_size, len(self.flash))
+        self.flash[start:end] = ramkernel.ERASED_BYTE * max(0, end - start)
+
+    def _flash_store(self, address, data):
+        if address + len(data) <= len(self.flash):
+            self.flash[address:address + len(data)] = data
+
+    def _receive(self, length, then, store_address = None, store = None):
+        self._discard = length
+        self._store_address = store_address
+        self._store_fn = store or self._store
+        self._after_discard = then
+        if not length:
+            self._discard = 0
+            return then()
+        return b""
+
+    def _status(self, status):
+        return struct.pack(">I", status)
+
+    def _command(self, command):
+        header, = struct.unpack(">H", command[:2])
+        if ramkernel.HEADER_MAGIC == header:
+            return self._rkl_command(command)
+
+        if boot.CMD_GET_STATUS == header:
+            if self._booted:
+                self._booted = False
+                return self._status(boot.BOOT_PROTOCOL_COMPLETE)
+            return self._status(boot.HAB_PASSED)
+
+        elif boot.CMD_WRITE_MEMORY == header:
+            _, address, datasize, value = struct.unpack(">HIB4xI", command[:15])
+            self._store(address, struct.pack("<I", value)[:datasize // 8])
+            return self._status(boot.ACK_PRODUCTION_PART) + self._status(boot.ACK_WRITE_SUCCESS)
+
+        elif boot.CMD_READ_MEMORY == header:
+            _, address, datasize, count = struct.unpack(">HIBI", command[:11])
+            return (self._status(boot.ACK_PRODUCTION_PART) +
+                    self._load(address, count * (datasize // 8)))
+
+        elif boot.CMD_WRITE_FILE == header:
+            _, address, length, filetype = struct.unpack(">HIxI4xB", command[:16])
+            if boot.FILE_TYPE_APPLICATION == filetype:
+                self._booted = True
+                loaded = lambda: b""
+            elif self.load_status is not None:
+                loaded = lambda: self._status(self.load_status)
+            else:
+                loaded = None
+
+            # Like the i.MX25 over USB, the status after a file that is a
+            # multiple of 64 bytes long waits for one more (ignored) byte.
+            if loaded is None:
+                then = lambda: b""
+            elif 0 == length % 64:
+                then = lambda: self._receive(1, loaded)
+            else:
+                then = loaded
+            return self._status(boot.ACK_PRODUCTION_PART) + self._receive(length, then,
+                                                                          address)
+
+        return self._status(boot.HAB_FAILURE)
+
+    def _rkl_response(self, ack, checksum = 0, length = 0):
+        return struct.pack(">hHI", ack, checksum, length)
+
+    def _progress(self, ack, size):
+        reply = b""
+        for index, offset in enumerate(range(0, size, self.report_size)):
+            reply += self._rkl_response(ack, index, min(self.report_size, size - offset))
+        return reply
+
+    def _rkl_command(self, command):
+        _, cmd, address, param1, param2 = struct.unpack(">HHIII", command)
+
+        if ramkernel.CMD_GETVER == cmd:
+            return (self._rkl_response(ramkernel.ACK_SUCCESS, 0x0025, len(self.flash_model)) +
+                    self.flash_model)
+
+        elif ramkernel.CMD_FLASH_GET_CAPACITY == cmd:
+            return self._rkl_response(ramkernel.ACK_SUCCESS, 0, 128 * 1024)
+
+        elif ramkernel.CMD_FLASH_ERASE == cmd and self.flash:
+            # One response per block erased, with its index and size.
+            self.erase_commands += 1
+            self._flash_erase(address, param1)
+            block_size = self.flash_block_size
+            reply = b"".join(self._rkl_response(ramkernel.ACK_FLASH_ERASE, index, block_size)
+                             for index in range(address // block_size,
+                                                -(-(address + param1) // block_size)))
+            return reply + self._rkl_response(ramkernel.ACK_SUCCESS)
+
+        elif ramkernel.CMD_FLASH_ERASE == cmd:
+            return (self._progress(ramkernel.ACK_FLASH_ERASE, param1) +
+                    self._rkl_response(ramkernel.ACK_SUCCESS))
+
+        elif ramkernel.CMD_FLASH_DUMP == cmd and self.flash:
+            reply = b""
+            for offset in range(address, address + param1, self.report_size):
+                data = bytes(self.flash[offset:min(offset + self.report_size, address + param1)])
+                reply += self._rkl_response(ramkernel.ACK_FLASH_PARTLY,
+                                            ramkernel.calculate_checksum(data), len(data)) + data
+            return reply
+
+        elif cmd in (ramkernel.CMD_FLASH_PROGRAM, ramkernel.CMD_FLASH_PROGRAM_UB):
+            store_address = None
+            if ramkernel.CMD_FLASH_PROGRAM_UB == cmd:
+                if not self.program_ub:
+                    return self._rkl_response(ramkernel.FLASH_FAILED)
+                store_address = address
+
+            elif self.flash:
+                store_address = address - address % self.flash_block_size
+                self._flash_erase(store_address, param1)
+
+            def programmed():
+                reply = self._progress(ramkernel.ACK_FLASH_PARTLY, param1)
+                if param2 & ramkernel.FLASH_PROGRAM_PARAM1_VERIFY:
+                    reply += self._progress(ramkernel.ACK_FLASH_VERIFY, param1)
+                return reply + self._rkl_response(ramkernel.ACK_SUCCESS)
+
+            return (self._rkl_response(ramkernel.ACK_SUCCESS, 0, param1) +
+                    self._receive(param1, programmed, store_address, self._flash_store))
+
+        elif ramkernel.CMD_RESET == cmd:
+            return b""
+
+        return self._rkl_response(ramkernel.ACK_SUCCESS)
+
+class BoardChannel(ATKChannelI):
+    """
+    A channel connected directly to a :class:`SimulatedBoard`, for tests
+    that do not need a real file descriptor.
+    """
+    def __init__(self, board):
+        super(BoardChannel, self).__init__()
+        self.board = board
+        self._replies = bytearray()
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, data):
+        self._replies += self.board.feed(bytes(data))
+
+    def read(self, length):
+        if len(self._replies) < length:
+            data = bytes(self._replies)
+            del self._replies[:]
+            raise ChannelReadTimeout(length, data)
+
+        data = bytes(self._replies[:length])
+        del self._replies[:length]
+        return data
+
+def serve(boards, stop_event = None):
+    """
+    Run ``boards``, a dictionary mapping a pty master file descriptor to a
+    :class:`SimulatedBoard`, until ``stop_event`` is set or every descriptor
+    has been closed by the host.
+    """
+    selector = selectors.DefaultSelector()
+    pending = {}
+    for fd in boards:
+        os.set_blocking(fd, False)
+        selector.register(fd, selectors.EVENT_READ)
+        pending[fd] = b""
+
+    while selector.get_map() and not (stop_event is not None and stop_event.is_set()):
+        for key, events in selector.select(0.05):
+            fd = key.fd
+            if events & selectors.EVENT_READ:
+                try:
+                    data = os.read(fd, 65536)
+                except OSError as err:
+                    if err.errno in (errno.EAGAIN, errno.EINTR):
+                        continue
+                    data = b""
+
+                if not data:
+                    selector.unregister(fd)
+                    continue
+
+                pending[fd] += boards[fd].feed(data)
+
+            if pending[fd]:
+                try:
+                    pending[fd] = pending[fd][os.write(fd, pending[fd]):]
+                except OSError as err:
+                    if err.errno not in (errno.EAGAIN, errno.EINTR):
+                        raise
+
+            events = selectors.EVENT_READ
+            if pending[fd]:
+                events |= selectors.EVENT_WRITE
+            selector.modify(fd, events)
+
+def serve_in_thread(boards):
+    """
+    Start :func:`serve` on a daemon thread.  Return a ``threading.Event``
+    that stops it when set.
+    """
+    stop_event = threading.Event()
+    thread = threading.Thread(target = serve, args = (boards, stop_event))
+    thread.daemon = True
+    thread.start()
+    return stop_event
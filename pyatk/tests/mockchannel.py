@@ -23,7 +23,7 @@
 import struct
 import collections
 
-from pyatk.channel.base import ATKChannelI
+from pyatk.channel.base import ATKChannelI, ChannelReadTimeout
 
 class MockChannel(ATKChannelI):
     """
@@ -36,6 +36,15 @@ class MockChannel(ATKChannelI):
         self.recv_data = []
         # Buffered data to be sent to the calling host.
         self.send_queue = collections.deque()
+        # Number of upcoming reads that time out, as on a device that is
+        # not ready yet.
+        self.read_timeouts = 0
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
 
     def get_data_written(self):
         return b"".join(self.recv_data)
@@ -56,12 +65,19 @@ class MockChannel(ATKChannelI):
         """
         Capture data written to this channel
         """
+        # Copy buffers: callers may reuse them.
+        if isinstance(data, (bytearray, memoryview)):
+            data = bytes(data)
         self.recv_data.append(data)
 
     def read(self, length):
         """
         Read up to length bytes of buffered data from this channel.
         """
+        if self.read_timeouts > 0:
+            self.read_timeouts -= 1
+            raise ChannelReadTimeout(length, b"")
+
         return_data = b""
 
         while len(return_data) < length and len(self.send_queue) > 0:
@@ -0,0 +1,63 @@
+# Copyright (c) 2012-2013, Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import threading
+
+from pyatk.channel.hotplug import HotplugMonitor, HotplugEvent
+
+class SimulatedHotplugMonitor(HotplugMonitor):
+    """
+    A hotplug source driven by the test.  :meth:`arrive` reports a device
+    arrival immediately; :meth:`arrive_later` does so from another thread
+    after a delay, running ``before`` (e.g. to add the device to a
+    :class:`~pyatk.tests.mockusb.FakeBus`) first.
+    """
+    def __init__(self):
+        super(SimulatedHotplugMonitor, self).__init__()
+        self.started = False
+        self.waits = []
+        self._timers = []
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.started = False
+        for timer in self._timers:
+            timer.cancel()
+
+    def arrive(self, vid, pid, bus, address, port_numbers = None):
+        self._post(HotplugEvent(vid, pid, bus, address, port_numbers))
+
+    def arrive_later(self, delay, before, *args):
+        def fire():
+            before()
+            self.arrive(*args)
+
+        timer = threading.Timer(delay, fire)
+        timer.daemon = True
+        self._timers.append(timer)
+        timer.start()
+
+    def wait_for_arrival(self, match, timeout):
+        self.waits.append(timeout)
+        return super(SimulatedHotplugMonitor, self).wait_for_arrival(match, timeout)
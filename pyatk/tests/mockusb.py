@@ -0,0 +1,230 @@
+# Copyright (c) 2012-2013, Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import time
+import threading
+import collections
+
+import usb
+
+from pyatk.channel import usbasync
+from pyatk.channel import usbdev
+
+class FakeTransfer(object):
+    def __init__(self, is_read, endpoint, size_or_data, timeout, callback):
+        self.is_read = is_read
+        self.endpoint = endpoint
+        self.size_or_data = size_or_data
+        self.timeout = timeout
+        self.callback = callback
+        self.submit_time = time.time()
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class FakeTransferBackend(usbasync.TransferBackendI):
+    """
+    A libusb stand-in for testing the asynchronous transfer engine.
+
+    Device-to-host data comes from the send queue of a :class:`MockChannel`,
+    each queued item ending its IN transfer early like a short packet would.
+    Host-to-device data is written to the :class:`MockChannel`.
+    """
+    def __init__(self, channel):
+        self.channel = channel
+        self.closed = False
+
+        self._lock = threading.Lock()
+        # Endpoints are independent, so each direction has its own queue.
+        self._pending_reads = collections.deque()
+        self._pending_writes = collections.deque()
+
+        # Transfers submitted but not yet completed, and the most of each
+        # kind ever outstanding at once.
+        self.reads_in_flight = 0
+        self.writes_in_flight = 0
+        self.max_reads_in_flight = 0
+        self.max_writes_in_flight = 0
+        # Sizes of the IN transfers submitted, in order.
+        self.read_sizes = []
+
+        #: If set, OUT transfers complete with this status instead of
+        #: being written to the channel.
+        self.write_status = None
+        #: If set, :meth:`handle_events` raises this exception.
+        self.events_error = None
+
+    def submit_read(self, endpoint, length, timeout, callback):
+        transfer = FakeTransfer(True, endpoint, length, timeout, callback)
+        with self._lock:
+            self._pending_reads.append(transfer)
+            self.read_sizes.append(length)
+            self.reads_in_flight += 1
+            self.max_reads_in_flight = max(self.max_reads_in_flight, self.reads_in_flight)
+        return transfer
+
+    def submit_write(self, endpoint, data, timeout, callback):
+        # Like libusb, the data must be captured at submission time.
+        transfer = FakeTransfer(False, endpoint, bytes(data), timeout, callback)
+        with self._lock:
+            self._pending_writes.append(transfer)
+            self.writes_in_flight += 1
+            self.max_writes_in_flight = max(self.max_writes_in_flight, self.writes_in_flight)
+        return transfer
+
+    def _complete(self, pending):
+        """
+        Complete the oldest transfer in ``pending`` if possible, returning
+        ``True`` if one was completed.
+        """
+        with self._lock:
+            if not pending:
+                return False
+            transfer = pending[0]
+
+            if transfer.cancelled:
+                status, result = usbasync.TRANSFER_CANCELLED, b""
+                if not transfer.is_read:
+                    result = 0
+
+            elif not transfer.is_read:
+                if self.write_status is None:
+                    self.channel.write(transfer.size_or_data)
+                    status, result = usbasync.TRANSFER_COMPLETED, len(transfer.size_or_data)
+                else:
+                    status, result = self.write_status, 0
+
+            elif self.channel.send_queue:
+                data = self.channel.send_queue.popleft()
+                if len(data) > transfer.size_or_data:
+                    self.channel.send_queue.appendleft(data[transfer.size_or_data:])
+                    data = data[:transfer.size_or_data]
+                status, result = usbasync.TRANSFER_COMPLETED, data
+
+            elif (time.time() - transfer.submit_time) * 1000 >= transfer.timeout:
+                status, result = usbasync.TRANSFER_TIMED_OUT, b""
+
+            else:
+                return False
+
+            pending.popleft()
+
+        transfer.callback(status, result)
+
+        with self._lock:
+            if transfer.is_read:
+                self.reads_in_flight -= 1
+            else:
+                self.writes_in_flight -= 1
+
+        return True
+
+    def handle_events(self, timeout):
+        if self.events_error is not None:
+            raise self.events_error
+
+        completed = False
+        while self._complete(self._pending_writes) or self._complete(self._pending_reads):
+            completed = True
+
+        if not completed:
+            time.sleep(min(timeout, 0.001))
+
+    def close(self):
+        self.closed = True
+
+class FakeEndpoint(object):
+    """
+    Stand-in for a PyUSB bulk endpoint.  IN transfers are served from
+    ``packets`` one at a time; OUT transfers are recorded in ``written``.
+    """
+    def __init__(self, wMaxPacketSize = 64):
+        self.wMaxPacketSize = wMaxPacketSize
+        self.packets = []
+        self.written = []
+        self.read_requests = []
+
+    def read(self, size_or_buffer, timeout = None):
+        if not self.packets:
+            raise usb.USBError("Operation timed out")
+
+        self.read_requests.append(len(size_or_buffer))
+        packet = self.packets.pop(0)
+        memoryview(size_or_buffer)[:len(packet)] = packet
+        return len(packet)
+
+    def write(self, data, timeout = None):
+        self.written.append(bytes(data))
+        return len(data)
+
+class FakeDevice(object):
+    """ Stand-in for a PyUSB device, with a single bulk interface. """
+    def __init__(self, bus, address, port_numbers, idVendor = usbdev.VID_FREESCALE,
+                 idProduct = 0x1234, configured = False):
+        self.bus = bus
+        self.address = address
+        self.port_numbers = port_numbers
+        self.idVendor = idVendor
+        self.idProduct = idProduct
+        self.configured = configured
+        self.set_configuration_calls = 0
+
+    def get_active_configuration(self):
+        if not self.configured:
+            raise usb.core.USBError("Configuration not set")
+        return [FakeInterface()]
+
+    def set_configuration(self):
+        self.set_configuration_calls += 1
+        self.configured = True
+
+class FakeInterface(object):
+    bInterfaceNumber = 0
+    bAlternateSetting = 0
+
+    def __iter__(self):
+        in_endpoint = FakeEndpoint(512)
+        in_endpoint.bEndpointAddress = 0x81
+        out_endpoint = FakeEndpoint(512)
+        out_endpoint.bEndpointAddress = 0x01
+        return iter([in_endpoint, out_endpoint])
+
+class FakeBus(object):
+    """ Replaces usb.core.find, recording how many devices each search examined. """
+    def __init__(self, devices):
+        self.devices = devices
+        self.examined = 0
+
+    def find(self, find_all = False, custom_match = None, **kwargs):
+        def match(dev):
+            self.examined += 1
+            if any(getattr(dev, key) != value for key, value in kwargs.items()):
+                return False
+            return custom_match is None or custom_match(dev)
+
+        if find_all:
+            return [dev for dev in self.devices if match(dev)]
+        for dev in self.devices:
+            if match(dev):
+                return dev
+        return None
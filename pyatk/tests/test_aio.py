@@ -0,0 +1,251 @@
+import io
+import os
+import struct
+import asyncio
+import unittest
+
+from pyatk.tests.mockchannel import MockChannel
+from pyatk.channel import aio
+from pyatk.channel import base
+from pyatk import aioboot
+from pyatk import aioramkernel
+from pyatk import boot
+from pyatk import ramkernel
+
+def run(coro):
+    return asyncio.run(coro)
+
+def queue_sbp_resp(channel, resp):
+    channel.queue_data(struct.pack(">I", resp))
+
+class AsyncSerialBootProtocolTests(unittest.TestCase):
+    def setUp(self):
+        self.channel = MockChannel()
+        self.sbp = aioboot.AsyncSerialBootProtocol(aio.DirectChannelAdapter(self.channel))
+
+    def test_read_memory(self):
+        queue_sbp_resp(self.channel, boot.ACK_ENGINEERING_PART)
+        self.channel.queue_data(b"\x01\x00\x00\x00\x02\x00\x00\x00")
+
+        data = run(self.sbp.read_memory(0x78000000, boot.DATA_SIZE_WORD, 2))
+        self.assertEqual([1, 2], list(data))
+        self.assertEqual(b"\x01\x01\x78\x00\x00\x00\x20\x00\x00\x00\x02" + b"\x00" * 5,
+                         self.channel.get_data_written())
+
+    def test_write_memory(self):
+        queue_sbp_resp(self.channel, boot.ACK_ENGINEERING_PART)
+        queue_sbp_resp(self.channel, boot.ACK_WRITE_SUCCESS)
+        run(self.sbp.write_memory(0x78000000, boot.DATA_SIZE_BYTE, 0xa5))
+
+        queue_sbp_resp(self.channel, boot.ACK_ENGINEERING_PART)
+        with self.assertRaises(boot.CommandResponseError):
+            run(self.sbp.write_memory(0x78000000, boot.DATA_SIZE_BYTE, 0xa5))
+
+    def test_write_memory_batch(self):
+        entries = [(0x78000000 + i, i, boot.DATA_SIZE_BYTE) for i in range(5)]
+        for _ in range(3):
+            queue_sbp_resp(self.channel, boot.ACK_ENGINEERING_PART)
+            queue_sbp_resp(self.channel, boot.ACK_WRITE_SUCCESS)
+        queue_sbp_resp(self.channel, boot.ACK_ENGINEERING_PART)
+        queue_sbp_resp(self.channel, boot.ACK_ENGINEERING_PART)
+
+        with self.assertRaises(boot.WriteMemoryBatchError) as cm:
+            run(self.sbp.write_memory_batch(entries, window = 2))
+        self.assertEqual(3, cm.exception.index)
+        self.assertEqual(b"".join(boot._write_memory_command(address, datasize, value)
+                                  for address, value, datasize in entries),
+                         self.channel.get_data_written())
+
+    def test_write_memory_batch_drained(self):
+        entries = [(0x78000000 + i, i, boot.DATA_SIZE_BYTE) for i in range(5)]
+        for _ in range(3):
+            queue_sbp_resp(self.channel, boot.ACK_ENGINEERING_PART)
+            queue_sbp_resp(self.channel, boot.ACK_WRITE_SUCCESS)
+        queue_sbp_resp(self.channel, boot.ACK_ENGINEERING_PART)
+        queue_sbp_resp(self.channel, boot.ACK_ENGINEERING_PART)
+        queue_sbp_resp(self.channel, boot.ACK_WRITE_SUCCESS)
+
+        with self.assertRaises(boot.WriteMemoryBatchError):
+            run(self.sbp.write_memory_batch(entries, window = 2))
+
+        queue_sbp_resp(self.channel, boot.ACK_ENGINEERING_PART)
+        queue_sbp_resp(self.channel, boot.ACK_WRITE_SUCCESS)
+        run(self.sbp.write_memory(0x78000000, boot.DATA_SIZE_BYTE, 0xa5))
+
+    def test_write_file(self):
+        image = bytes(bytearray(i & 0xff for i in range(4096)))
+        progress = []
+        queue_sbp_resp(self.channel, boot.ACK_PRODUCTION_PART)
+        queue_sbp_resp(self.channel, boot.BOOT_PROTOCOL_COMPLETE)
+
+        run(self.sbp.write_file(boot.FILE_TYPE_APPLICATION, 0x78000000, len(image),
+                                io.BytesIO(image),
+                                lambda done, total: progress.append(done)))
+
+        written = self.channel.get_data_written()
+        # Command, image, the extra i.MX25 byte, then the status request.
+        self.assertEqual(image, written[16:16 + len(image)])
+        self.assertEqual(b"\x00", written[16 + len(image):17 + len(image)])
+        self.assertEqual(len(image), progress[-1])
+
+class AsyncRAMKernelTests(unittest.TestCase):
+    def setUp(self):
+        self.channel = MockChannel()
+        self.rkl = aioramkernel.AsyncRAMKernelProtocol(aio.DirectChannelAdapter(self.channel))
+        self.rkl._flash_init = True
+        self.rkl._kernel_init = True
+
+    def test_kernel_not_yet_init_exception(self):
+        rkl = aioramkernel.AsyncRAMKernelProtocol(aio.DirectChannelAdapter(self.channel))
+        with self.assertRaises(ramkernel.KernelNotInitializedError):
+            run(rkl.flash_get_capacity())
+
+    def test_flash_program(self):
+        data = b"\x5a" * 8192
+        blocks = []
+        self.channel.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, len(data))
+        self.channel.queue_rkl_response(ramkernel.ACK_FLASH_PARTLY, 0, 4096)
+        self.channel.queue_rkl_response(ramkernel.ACK_FLASH_PARTLY, 1, 4096)
+        self.channel.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, 0)
+
+        run(self.rkl.flash_program(0x0000, data,
+                                   program_callback = lambda block, length: blocks.append(block)))
+        self.assertEqual(data, self.channel.get_data_written()[16:])
+        self.assertEqual([0, 1], blocks)
+
+    def test_flash_program_error(self):
+        self.channel.queue_rkl_response(ramkernel.FLASH_ERROR_PROG, 0, 0)
+        with self.assertRaises(ramkernel.CommandResponseError) as cm:
+            run(self.rkl.flash_program(0x0000, b"\x00" * 16))
+
+        self.assertEqual(ramkernel.FLASH_ERROR_PROG, cm.exception.ack)
+
+    def test_flash_dump(self):
+        chunks = (b"\xa5" * 2048, b"\x5a" * 2048)
+        for chunk in chunks:
+            self.channel.queue_rkl_response(ramkernel.ACK_FLASH_PARTLY,
+                                            ramkernel.calculate_checksum(chunk),
+                                            len(chunk), chunk)
+
+        self.assertEqual(b"".join(chunks), run(self.rkl.flash_dump(0x0000, 4096)))
+
+    def test_flash_dump_checksum(self):
+        self.channel.queue_rkl_response(ramkernel.ACK_FLASH_PARTLY, 0x1234, 4, b"abcd")
+        with self.assertRaises(ramkernel.ChecksumError):
+            run(self.rkl.flash_dump(0x0000, 4))
+
+    def test_flash_erase(self):
+        erased = []
+        for block_index in range(4):
+            self.channel.queue_rkl_response(ramkernel.ACK_FLASH_ERASE, block_index, 0x20000)
+        self.channel.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, 0)
+
+        run(self.rkl.flash_erase(0x0, 0x80000,
+                                 lambda block, size: erased.append(block)))
+        self.assertEqual([0, 1, 2, 3], erased)
+
+class ConcurrentDeviceTests(unittest.TestCase):
+    def test_many_devices(self):
+        """ Program and read back many devices concurrently in one event loop. """
+        num_devices = 24
+        order = []
+
+        async def session(index, channel):
+            rkl = aioramkernel.AsyncRAMKernelProtocol(aio.DirectChannelAdapter(channel))
+            rkl._flash_init = True
+            rkl._kernel_init = True
+
+            data = bytes(bytearray([index])) * 4096
+            await rkl.flash_program(0x0000, data,
+                                    program_callback = lambda block, length: order.append(index))
+            return await rkl.flash_dump(0x0000, len(data))
+
+        async def main():
+            sessions = []
+            for index in range(num_devices):
+                channel = MockChannel()
+                data = bytes(bytearray([index])) * 4096
+                channel.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, len(data))
+                for block in range(4):
+                    channel.queue_rkl_response(ramkernel.ACK_FLASH_PARTLY, block, 1024)
+                channel.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, 0)
+                channel.queue_rkl_response(ramkernel.ACK_FLASH_PARTLY,
+                                           ramkernel.calculate_checksum(data),
+                                           len(data), data)
+                sessions.append(session(index, channel))
+
+            return await asyncio.gather(*sessions)
+
+        results = run(main())
+        for index, result in enumerate(results):
+            self.assertEqual(bytes(bytearray([index])) * 4096, result)
+
+        # The sessions were interleaved, not run one after the other.
+        self.assertNotEqual(sorted(order), order)
+
+class ThreadedChannelAdapterTests(unittest.TestCase):
+    def test_read_write(self):
+        channel = MockChannel()
+        channel.queue_data(b"abcd")
+        adapter = aio.ThreadedChannelAdapter(channel)
+
+        async def main():
+            await adapter.write(b"hello")
+            data = await adapter.read(4)
+            await adapter.close()
+            return data
+
+        self.assertEqual(b"abcd", run(main()))
+        self.assertEqual(b"hello", channel.get_data_written())
+        self.assertEqual(channel.chantype, adapter.chantype)
+
+@unittest.skipUnless(hasattr(os, "openpty"), "requires pseudo-terminals")
+class AsyncFdChannelTests(unittest.TestCase):
+    def setUp(self):
+        self.master, self.slave = os.openpty()
+        # Raw mode, so the line discipline does not alter binary data.
+        import tty
+        tty.setraw(self.slave)
+
+    def tearDown(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+    def test_read_write(self):
+        async def main():
+            channel = aio.AsyncFdChannel(self.slave, read_timeout = 1)
+            os.write(self.master, b"\x00\x01\x02\x03\x04")
+            first = await channel.read(2)
+            second = await channel.read(3)
+
+            data = bytes(bytearray(range(256))) * 64
+            reader = asyncio.get_running_loop().run_in_executor(None, self._read_master, len(data))
+            await channel.write(data)
+            echoed = await reader
+
+            await channel.close()
+            return first, second, echoed, data
+
+        first, second, echoed, data = run(main())
+        self.assertEqual(b"\x00\x01", first)
+        self.assertEqual(b"\x02\x03\x04", second)
+        self.assertEqual(data, echoed)
+
+    def test_read_timeout(self):
+        async def main():
+            channel = aio.AsyncFdChannel(self.slave, read_timeout = 0.05)
+            os.write(self.master, b"ab")
+            try:
+                await channel.read(4)
+            finally:
+                await channel.close()
+
+        with self.assertRaises(base.ChannelReadTimeout) as cm:
+            run(main())
+        self.assertEqual(b"ab", cm.exception.actual_data_read)
+
+    def _read_master(self, length):
+        data = b""
+        while len(data) < length:
+            data += os.read(self.master, length - len(data))
+        return data
@@ -1,11 +1,74 @@
+import io
+import os
 import sys
 import array
 import unittest
 import struct
 
 from pyatk.tests.mockchannel import MockChannel
+from pyatk.tests.mockboard import SimulatedBoard, BoardChannel
+from pyatk.channel import base
 from pyatk import boot
 
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+# A small DDR-style init table with every write width.
+INIT_TABLE = [
+    (0xB8001010, 0x00000304, boot.DATA_SIZE_WORD),
+    (0xB8001004, 0x0075E73A, boot.DATA_SIZE_WORD),
+    (0x80000400, 0x00,       boot.DATA_SIZE_BYTE),
+    (0x53F80008, 0x2000,     boot.DATA_SIZE_HALFWORD),
+    (0x53F80010, 0x1234,     boot.DATA_SIZE_HALFWORD),
+    (0xB8001000, 0x92100000, boot.DATA_SIZE_WORD),
+]
+
+def read_golden(name):
+    with open(os.path.join(DATA_DIR, name), "rb") as golden:
+        return golden.read()
+
+class DCDEncoderTests(unittest.TestCase):
+    def test_v1_golden(self):
+        self.assertEqual(read_golden("dcd_v1.bin"),
+                         boot.encode_dcd(INIT_TABLE, boot.DCD_FORMAT_V1))
+
+    def test_hab4_golden(self):
+        self.assertEqual(read_golden("dcd_hab4.bin"),
+                         boot.encode_dcd(INIT_TABLE, boot.DCD_FORMAT_HAB4))
+
+    def test_empty(self):
+        self.assertEqual(b"\xe9\x19\x72\xb1\x00\x00\x00\x00",
+                         boot.encode_dcd([], boot.DCD_FORMAT_V1))
+        self.assertEqual(b"\xd2\x00\x04\x40", boot.encode_dcd([], boot.DCD_FORMAT_HAB4))
+
+    def test_invalid(self):
+        for entries in ([(0x80000000, 1, 12)],
+                        [(0x80000000, 0x100, boot.DATA_SIZE_BYTE)],
+                        [(0x100000000, 0, boot.DATA_SIZE_WORD)]):
+            self.assertRaises(ValueError, boot.encode_dcd, entries, boot.DCD_FORMAT_V1)
+
+        self.assertRaises(ValueError, boot.encode_dcd, INIT_TABLE, "v3")
+
+    def test_hab4_too_large(self):
+        # Alternating widths cost a command header per write.
+        entries = [(0x80000000 + i, 0, (boot.DATA_SIZE_WORD, boot.DATA_SIZE_BYTE)[i % 2])
+                   for i in range(200)]
+        self.assertRaises(ValueError, boot.encode_dcd, entries, boot.DCD_FORMAT_HAB4)
+        boot.encode_dcd(entries, boot.DCD_FORMAT_V1)
+
+class WindowCheckingChannel(MockChannel):
+    """ Records how many write commands are unanswered at each status read. """
+    def __init__(self):
+        super(WindowCheckingChannel, self).__init__()
+        self.status_reads = 0
+        self.in_flight = []
+
+    def read(self, length):
+        commands_sent = len(self.get_data_written()) // 16
+        # Two status words per command.
+        self.in_flight.append(commands_sent - self.status_reads // 2)
+        self.status_reads += 1
+        return super(WindowCheckingChannel, self).read(length)
+
 class SerialBootProtocolTests(unittest.TestCase):
     def setUp(self):
         self.channel = MockChannel()
@@ -57,7 +120,7 @@ class SerialBootProtocolTests(unittest.TestCase):
         """ Test basic functionality of read_memory(). """
         # Queue up the response
         self.queue_ack_eng()
-        self.channel.queue_data("\xaa\xbb")
+        self.channel.queue_data(b"\xaa\xbb")
 
         ret = self.sbp.read_memory(0x25, boot.DATA_SIZE_HALFWORD, 1)
         # Ensure we get an array of the correct type with the correctly byte-swapped
@@ -71,7 +134,7 @@ class SerialBootProtocolTests(unittest.TestCase):
         """ Test basic functionality of read_memory(). """
         # Queue up the response
         self.queue_ack_eng()
-        self.channel.queue_data("\x01\x00\x00\x00\x02\x00\x00\x00")
+        self.channel.queue_data(b"\x01\x00\x00\x00\x02\x00\x00\x00")
 
         ret = self.sbp.read_memory(0x99, boot.DATA_SIZE_WORD, 2)
         # Ensure we get an array of the correct type with the correctly byte-swapped
@@ -89,10 +152,10 @@ class SerialBootProtocolTests(unittest.TestCase):
         # the host system to ensure we need to byte swap
         if "little" == sys.byteorder:
             self.sbp.byteorder = "big"
-            self.channel.queue_data("\x00\x00\x00\x01\x00\x00\x00\x02")
+            self.channel.queue_data(b"\x00\x00\x00\x01\x00\x00\x00\x02")
         else:
             self.sbp.byteorder = "little"
-            self.channel.queue_data("\x01\x00\x00\x00\x02\x00\x00\x00")
+            self.channel.queue_data(b"\x01\x00\x00\x00\x02\x00\x00\x00")
 
         ret = self.sbp.read_memory(0x99, boot.DATA_SIZE_WORD, 2)
         # Ensure we get an array of the correct type with the correctly byte-swapped
@@ -108,11 +171,62 @@ class SerialBootProtocolTests(unittest.TestCase):
         self.assertRaises(boot.CommandResponseError,
                           self.sbp.read_memory, 0x99, boot.DATA_SIZE_WORD, 2)
 
+    def test_read_memory_into_stream(self):
+        """ Test read_memory_into() splitting a region into chunks written to a file. """
+        for data in (b"\x01\x02\x03\x04", b"\x05\x06\x07\x08", b"\x09\x0a"):
+            self.queue_ack_eng()
+            self.channel.queue_data(data)
+
+        progress = []
+        sink = io.BytesIO()
+        ret = self.sbp.read_memory_into(0x80000000, 10, sink, boot.DATA_SIZE_HALFWORD,
+                                        max_read_size = 4,
+                                        progress_callback = lambda *args: progress.append(args))
+        self.assertEqual(10, ret)
+        # A raw memory image, in device byte order.
+        self.assertEqual(b"\x01\x02\x03\x04\x05\x06\x07\x08\x09\x0a", sink.getvalue())
+        self.assertEqual([(4, 10), (8, 10), (10, 10)], progress)
+        self.assertEqual(b"\x01\x01\x80\x00\x00\x00\x10\x00\x00\x00\x02\x00\x00\x00\x00\x00"
+                         b"\x01\x01\x80\x00\x00\x04\x10\x00\x00\x00\x02\x00\x00\x00\x00\x00"
+                         b"\x01\x01\x80\x00\x00\x08\x10\x00\x00\x00\x01\x00\x00\x00\x00\x00",
+                         self.channel.get_data_written())
+
+    def test_read_memory_into_buffer_byteswap(self):
+        """ Test read_memory_into() filling a buffer in another byte order. """
+        for data in (b"\x01\x02\x03\x04", b"\x05\x06\x07\x08"):
+            self.queue_ack_eng()
+            self.channel.queue_data(data)
+
+        sink = bytearray(8)
+        self.sbp.read_memory_into(0x80000000, 8, sink, boot.DATA_SIZE_WORD,
+                                  byteorder = "big", max_read_size = 4)
+        self.assertEqual(b"\x04\x03\x02\x01\x08\x07\x06\x05", sink)
+
+        # Values can also go straight into an array in host order.
+        self.queue_ack_eng()
+        self.channel.queue_data(b"\x01\x00\x00\x00\x02\x00\x00\x00")
+        values = array.array("I", [0, 0])
+        self.sbp.read_memory_into(0x80000000, 8, values, byteorder = sys.byteorder)
+        self.assertEqual(array.array("I", [1, 2]), values)
+
+    def test_read_memory_into_errors(self):
+        """ Test read_memory_into() argument checks and short responses. """
+        sink = io.BytesIO()
+        self.assertRaises(ValueError, self.sbp.read_memory_into, 0, 6, sink, boot.DATA_SIZE_WORD)
+        self.assertRaises(ValueError, self.sbp.read_memory_into, 0xfffffffc, 8, sink)
+        self.assertRaises(ValueError, self.sbp.read_memory_into, 0, 8, bytearray(4))
+        self.assertEqual(b"", self.channel.get_data_written())
+
+        self.queue_ack_eng()
+        self.channel.queue_data(b"\x01\x00")
+        self.assertRaises(boot.CommandResponseError,
+                          self.sbp.read_memory_into, 0, 4, sink)
+
     def test_read_memory_single(self):
         """ Test basic functionality of read_memory(). """
         # Queue up the response
         self.queue_ack_eng()
-        self.channel.queue_data("\xaa\xbb")
+        self.channel.queue_data(b"\xaa\xbb")
 
         ret = self.sbp.read_memory_single(0x25, boot.DATA_SIZE_HALFWORD)
         # Ensure we get an array of the correct type with the correctly byte-swapped
@@ -163,4 +277,207 @@ class SerialBootProtocolTests(unittest.TestCase):
         self.queue_sbp_resp(boot.ACK_WRITE_SUCCESS)
         self.sbp.write_memory(0xbeefcafe, boot.DATA_SIZE_WORD, 0xcafefeed)
         self.assertEqual(b"\x02\x02\xbe\xef\xca\xfe\x20\x00\x00\x00\x00\xca\xfe\xfe\xed\x00",
-                         self.channel.get_data_written())
\ No newline at end of file
+                         self.channel.get_data_written())
+
+    def test_wait_ready(self):
+        """ Poll get_status until the ROM answers. """
+        self.channel.read_timeouts = 3
+        self.queue_sbp_resp(boot.HAB_PASSED)
+        status, elapsed = self.sbp.wait_ready(timeout = 5)
+        self.assertEqual(boot.HAB_PASSED, status)
+        self.assertTrue(0 < elapsed < 1)
+        # One GET_STATUS per attempt.
+        self.assertEqual(4 * 16, len(self.channel.get_data_written()))
+
+    def test_wait_ready_timeout(self):
+        self.channel.read_timeouts = 1000
+        self.assertRaises(base.ChannelReadTimeout, self.sbp.wait_ready, 0.1)
+
+    def test_write_dcd(self):
+        """ The whole table goes out as one DCD file write. """
+        self.queue_ack_prod()
+        self.queue_sbp_resp(boot.ACK_WRITE_SUCCESS)
+        self.sbp.write_dcd(0x78000000, INIT_TABLE, boot.DCD_FORMAT_V1)
+
+        dcd = read_golden("dcd_v1.bin")
+        self.assertEqual(boot._write_file_command(boot.FILE_TYPE_DCD, 0x78000000, len(dcd)) + dcd,
+                         self.channel.get_data_written())
+
+    def test_write_dcd_rejected(self):
+        self.queue_sbp_resp(boot.HAB_FAILURE)
+        self.assertRaises(boot.CommandResponseError,
+                          self.sbp.write_dcd, 0x78000000, INIT_TABLE, boot.DCD_FORMAT_V1)
+
+        self.queue_ack_prod()
+        self.queue_sbp_resp(boot.HAB_INVALID_WRITE_REG)
+        self.assertRaises(boot.CommandResponseError,
+                          self.sbp.write_dcd, 0x78000000, INIT_TABLE, boot.DCD_FORMAT_V1)
+
+    def queue_write_ok(self, count):
+        for _ in range(count):
+            self.queue_ack_prod()
+            self.queue_sbp_resp(boot.ACK_WRITE_SUCCESS)
+
+    def test_write_memory_batch(self):
+        """ A batch writes exactly what write_memory() would, in order. """
+        self.queue_write_ok(len(INIT_TABLE))
+        self.sbp.write_memory_batch(INIT_TABLE, window = 4)
+        self.assertEqual(b"", b"".join(self.channel.send_queue))
+
+        sequential = MockChannel()
+        for _ in INIT_TABLE:
+            sequential.queue_data(struct.pack(">I", boot.ACK_PRODUCTION_PART))
+            sequential.queue_data(struct.pack(">I", boot.ACK_WRITE_SUCCESS))
+        sbp = boot.SerialBootProtocol(sequential)
+        for address, value, datasize in INIT_TABLE:
+            sbp.write_memory(address, datasize, value)
+
+        self.assertEqual(sequential.get_data_written(), self.channel.get_data_written())
+
+    def test_write_memory_batch_window(self):
+        entries = [(0x80000000 + 4 * i, i, boot.DATA_SIZE_WORD) for i in range(20)]
+        for window in (1, 3, 16, 64):
+            channel = WindowCheckingChannel()
+            for _ in entries:
+                channel.queue_data(struct.pack(">I", boot.ACK_ENGINEERING_PART))
+                channel.queue_data(struct.pack(">I", boot.ACK_WRITE_SUCCESS))
+
+            boot.SerialBootProtocol(channel).write_memory_batch(entries, window = window)
+            self.assertEqual(min(window, len(entries)), max(channel.in_flight))
+            self.assertTrue(min(channel.in_flight) >= 1)
+
+    def test_write_memory_batch_default_window(self):
+        entries = [(0x80000000 + 4 * i, i, boot.DATA_SIZE_WORD) for i in range(40)]
+        for chantype in (base.CHANNEL_TYPE_UART, base.CHANNEL_TYPE_USB):
+            channel = WindowCheckingChannel()
+            channel._ramkernel_channel_type = chantype
+            for _ in entries:
+                channel.queue_data(struct.pack(">I", boot.ACK_PRODUCTION_PART))
+                channel.queue_data(struct.pack(">I", boot.ACK_WRITE_SUCCESS))
+
+            boot.SerialBootProtocol(channel).write_memory_batch(entries)
+            self.assertEqual(boot.WRITE_BATCH_WINDOWS[chantype], max(channel.in_flight))
+
+    def test_write_memory_batch_failure(self):
+        """ A write that is not acknowledged is pinned on the right entry. """
+        self.queue_write_ok(3)
+        # Entry 3 fails: its ACK arrives but no write status.
+        self.queue_ack_prod()
+        self.queue_write_ok(2)
+
+        with self.assertRaises(boot.WriteMemoryBatchError) as cm:
+            self.sbp.write_memory_batch(INIT_TABLE, window = 4)
+        self.assertEqual(3, cm.exception.index)
+        self.assertEqual(INIT_TABLE[3], cm.exception.entry)
+        self.assertIn("0x2000 to 0x53F80008", str(cm.exception))
+
+    def test_write_memory_batch_failure_drained(self):
+        """ Responses to writes sent after a failure do not reach the next command. """
+        self.queue_write_ok(3)
+        self.queue_ack_prod()
+        self.queue_write_ok(2)
+        self.assertRaises(boot.WriteMemoryBatchError,
+                          self.sbp.write_memory_batch, INIT_TABLE, window = 4)
+        self.assertEqual(b"", b"".join(self.channel.send_queue))
+
+        self.queue_write_ok(1)
+        self.sbp.write_memory(0x80000400, boot.DATA_SIZE_BYTE, 0x5A)
+
+    def test_write_memory_batch_last_fails(self):
+        self.queue_write_ok(len(INIT_TABLE) - 1)
+        self.queue_ack_prod()
+        with self.assertRaises(boot.WriteMemoryBatchError) as cm:
+            self.sbp.write_memory_batch(INIT_TABLE, window = 4)
+        self.assertEqual(len(INIT_TABLE) - 1, cm.exception.index)
+
+    def test_write_memory_batch_invalid(self):
+        self.assertRaises(ValueError, self.sbp.write_memory_batch, INIT_TABLE, 0)
+        # Nothing is sent if any entry is invalid.
+        self.assertRaises(ValueError, self.sbp.write_memory_batch,
+                          INIT_TABLE + [(0x80000000, 0, 12)])
+        self.assertEqual(b"", self.channel.get_data_written())
+
+    def test_write_file_chunks(self):
+        """ write_file() sends the stream in chunk_size pieces, stopping at length. """
+        data = bytes(bytearray(range(256))) * 40
+        self.queue_ack_prod()
+        self.sbp.write_file(boot.FILE_TYPE_LOAD_ONLY, 0x80000000, 10000, io.BytesIO(data),
+                            chunk_size = 4096)
+
+        self.assertEqual(boot._write_file_command(boot.FILE_TYPE_LOAD_ONLY, 0x80000000, 10000),
+                         self.channel.recv_data[0])
+        self.assertEqual([4096, 4096, 1808], [len(chunk) for chunk in self.channel.recv_data[1:]])
+        self.assertEqual(data[:10000], b"".join(self.channel.recv_data[1:]))
+
+    def test_load_file(self):
+        """ load_file() reads the status the ROM sends after the data. """
+        for status in (boot.BOOT_PROTOCOL_COMPLETE, boot.ACK_WRITE_SUCCESS):
+            self.queue_ack_prod()
+            self.queue_sbp_resp(status)
+            self.sbp.load_file(0x80000000, 4, io.BytesIO(b"data"))
+
+        # Nothing is left over for the next command.
+        self.queue_sbp_resp(boot.HAB_PASSED)
+        self.assertEqual(boot.HAB_PASSED, self.sbp.get_status())
+
+        self.queue_ack_prod()
+        self.queue_sbp_resp(boot.HAB_FAILURE)
+        self.assertRaises(boot.CommandResponseError,
+                          self.sbp.load_file, 0x80000000, 4, io.BytesIO(b"data"))
+
+    def test_load_file_multiple_of_64(self):
+        """ A load whose length is a multiple of 64 bytes gets the i.MX25 extra byte. """
+        board = SimulatedBoard(memory_base = 0x80000000, memory_size = 1024,
+                               load_status = boot.BOOT_PROTOCOL_COMPLETE)
+        sbp = boot.SerialBootProtocol(BoardChannel(board))
+        for length in (64, 100, 640):
+            data = bytes(bytearray(i & 0xff for i in range(length)))
+            sbp.load_file(0x80000000, length, io.BytesIO(data))
+            self.assertEqual(data, bytes(board.memory[:length]))
+            # The extra byte is not data, and the next command is understood.
+            self.assertEqual(0, board.memory[length])
+            self.assertEqual(boot.HAB_PASSED, sbp.get_status())
+
+    def test_write_file_read_only_stream(self):
+        """ Streams without readinto() are read with read(). """
+        class ReadOnlyStream(object):
+            def __init__(self, data):
+                self.stream = io.BytesIO(data)
+
+            def read(self, length):
+                return self.stream.read(length)
+
+        self.queue_ack_prod()
+        self.sbp.write_file(boot.FILE_TYPE_LOAD_ONLY, 0x80000000, 5, ReadOnlyStream(b"abcdefgh"),
+                            chunk_size = 2)
+        self.assertEqual([b"ab", b"cd", b"e"], self.channel.recv_data[1:])
+
+        self.queue_ack_prod()
+        self.assertRaises(ValueError, self.sbp.write_file, boot.FILE_TYPE_LOAD_ONLY,
+                          0x80000000, 5, ReadOnlyStream(b"abc"))
+
+    def test_write_file_progress(self):
+        """ Progress callbacks are rate-limited, but the last one is always made. """
+        progress = []
+        self.queue_ack_prod()
+        self.sbp.write_file(boot.FILE_TYPE_LOAD_ONLY, 0x80000000, 100, io.BytesIO(b"x" * 100),
+                            progress_callback = lambda *args: progress.append(args),
+                            chunk_size = 10, progress_interval = 3600)
+        self.assertEqual([(10, 100), (100, 100)], progress)
+
+        del progress[:]
+        self.queue_ack_prod()
+        self.sbp.write_file(boot.FILE_TYPE_LOAD_ONLY, 0x80000000, 100, io.BytesIO(b"x" * 100),
+                            progress_callback = lambda *args: progress.append(args),
+                            chunk_size = 10, progress_interval = 0)
+        self.assertEqual([(count, 100) for count in range(10, 101, 10)], progress)
+
+    def test_write_file_chunk_size(self):
+        """ The default chunk size follows the channel. """
+        self.assertEqual(boot.WRITE_FILE_CHUNK_SIZES[base.CHANNEL_TYPE_UART],
+                         boot._write_file_chunk_size(self.channel))
+
+        self.channel.max_transfer_size = 128 * 1024
+        self.assertEqual(128 * 1024, boot._write_file_chunk_size(self.channel))
+        self.channel.async_transfers = 4
+        self.assertEqual(512 * 1024, boot._write_file_chunk_size(self.channel))
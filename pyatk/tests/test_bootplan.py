@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import struct
+
+from pyatk.tests.mockchannel import MockChannel
+from pyatk.tests.mockboard import SimulatedBoard, BoardChannel
+from pyatk import bspinfo
+from pyatk import boot
+from pyatk import bootplan
+
+BSP = bspinfo.BoardSupportInfo("test", 0x80000000, 0x8003FFFF, None, None,
+                               0x80004000, 0x15a2, 0x003a)
+
+class BootPlanTests(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def image(self, name, data):
+        path = os.path.join(self.tempdir, name)
+        with open(path, "wb") as image_fp:
+            image_fp.write(data)
+        return path
+
+    def test_parse_image_spec(self):
+        self.assertEqual(("zImage", 0x80008000), bootplan.parse_image_spec("zImage@0x80008000"))
+        self.assertEqual(("a@b.dtb", 4096), bootplan.parse_image_spec("a@b.dtb@4096"))
+        for spec in ("zImage", "@0x80008000", "zImage@", "zImage@0x8000800G"):
+            self.assertRaises(bootplan.BootPlanError, bootplan.parse_image_spec, spec)
+
+    def test_add(self):
+        plan = bootplan.BootPlan(BSP, sdram_only = True)
+        kernel = self.image("kernel", b"K" * 0x1000)
+        dtb = self.image("dtb", b"D" * 0x100)
+
+        plan.add(dtb, 0x80001000)
+        plan.add(kernel, 0x80000000)
+        self.assertEqual([bootplan.BootImage(dtb, 0x80001000, 0x100),
+                          bootplan.BootImage(kernel, 0x80000000, 0x1000)], plan.images)
+        self.assertEqual(0x80000000, plan.entry_point)
+        self.assertEqual(0x1100, plan.total_size)
+
+        # Overlapping the end of the kernel and the start of the DTB.
+        for address in (0x80000F00, 0x800010FF, 0x80000800):
+            self.assertRaises(bootplan.BootPlanError, plan.add, dtb, address)
+
+        # Outside SDRAM, in part or entirely.
+        self.assertRaises(bootplan.BootPlanError, plan.add, dtb, 0x8003FF80)
+        self.assertRaises(bootplan.BootPlanError, plan.add, dtb, 0x78000000)
+        self.assertEqual(2, len(plan.images))
+
+        # Without a BSP, only the 32-bit address space limits images.
+        plan = bootplan.BootPlan()
+        plan.add(dtb, 0x78000000)
+        self.assertRaises(bootplan.BootPlanError, plan.add, dtb, 0xFFFFFFF0)
+
+    def test_add_bad_file(self):
+        plan = bootplan.BootPlan(BSP)
+        self.assertRaises(bootplan.BootPlanError, plan.add, self.image("empty", b""), 0x80000000)
+        self.assertRaises(bootplan.BootPlanError, plan.add,
+                          os.path.join(self.tempdir, "missing"), 0x80000000)
+
+    def test_execute(self):
+        board = SimulatedBoard(memory_base = 0x80000000, memory_size = 0x40000,
+                               load_status = boot.BOOT_PROTOCOL_COMPLETE)
+        sbp = boot.SerialBootProtocol(BoardChannel(board))
+
+        kernel_data = os.urandom(0x3000)
+        initrd_data = os.urandom(0x1801)
+        dtb_data = os.urandom(0x400)
+
+        plan = bootplan.BootPlan(BSP, sdram_only = True)
+        plan.add(self.image("initrd", initrd_data), 0x80020000)
+        plan.add(self.image("dtb", dtb_data), 0x80010000)
+        plan.add(self.image("kernel", kernel_data), 0x80008000)
+
+        filetypes = []
+        write_file = sbp.write_file
+        def recording_write_file(filetype, *args, **kwargs):
+            filetypes.append(filetype)
+            return write_file(filetype, *args, **kwargs)
+        sbp.write_file = recording_write_file
+
+        progress = []
+        plan.execute(sbp, lambda image, current, total: progress.append(
+            (os.path.basename(image.path), current, total)))
+
+        self.assertEqual(initrd_data, board.memory[0x20000:0x21801])
+        self.assertEqual(dtb_data, board.memory[0x10000:0x10400])
+        self.assertEqual(kernel_data, board.memory[0x8000:0xB000])
+        self.assertIn(("initrd", 0x1801, 0x1801), progress)
+        self.assertIn(("dtb", 0x400, 0x400), progress)
+        self.assertEqual(("kernel", 0x3000, 0x3000), progress[-1])
+
+        # Only the last image is executed.
+        self.assertEqual([boot.FILE_TYPE_LOAD_ONLY, boot.FILE_TYPE_LOAD_ONLY,
+                          boot.FILE_TYPE_APPLICATION], filetypes)
+
+    def test_execute_iram(self):
+        """ Without sdram_only, a single application may be loaded outside SDRAM. """
+        board = SimulatedBoard(memory_base = 0x78000000, memory_size = 0x20000)
+        sbp = boot.SerialBootProtocol(BoardChannel(board))
+        app_data = os.urandom(0x1000)
+
+        plan = bootplan.BootPlan(BSP)
+        plan.add(self.image("app", app_data), 0x78001000)
+        plan.execute(sbp)
+        self.assertEqual(app_data, board.memory[0x1000:0x2000])
+
+    def test_execute_load_status(self):
+        """ The status after each loaded image is read, not left for the next command. """
+        channel = MockChannel()
+        for status in (boot.ACK_PRODUCTION_PART, boot.BOOT_PROTOCOL_COMPLETE,
+                       boot.ACK_PRODUCTION_PART, boot.BOOT_PROTOCOL_COMPLETE):
+            channel.queue_data(struct.pack(">I", status))
+
+        plan = bootplan.BootPlan(BSP)
+        plan.add(self.image("dtb", b"D" * 0x100), 0x80010000)
+        plan.add(self.image("kernel", b"K" * 0x100), 0x80008000)
+        plan.execute(boot.SerialBootProtocol(channel))
+        self.assertEqual(b"", b"".join(channel.send_queue))
+
+        # A rejected load stops the plan.
+        channel.queue_data(struct.pack(">II", boot.ACK_PRODUCTION_PART, boot.HAB_FAILURE))
+        self.assertRaises(boot.CommandResponseError, plan.execute,
+                          boot.SerialBootProtocol(channel))
+
+    def test_execute_changed_size(self):
+        channel = MockChannel()
+        plan = bootplan.BootPlan(BSP)
+        path = self.image("app", b"A" * 0x100)
+        plan.add(path, 0x80008000)
+        self.image("app", b"A" * 0x80)
+
+        self.assertRaises(bootplan.BootPlanError, plan.execute, boot.SerialBootProtocol(channel))
+        # Nothing is sent for an image that no longer matches the plan.
+        self.assertEqual(b"", channel.get_data_written())
+
+    def test_execute_empty(self):
+        self.assertRaises(bootplan.BootPlanError, bootplan.BootPlan().execute, None)
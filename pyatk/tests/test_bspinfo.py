@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyatk import bspinfo
+from pyatk import boot
+
+BSP_CONFIG = """
+[plain]
+description = No UART settings
+sdram_start = 0x80000000
+sdram_end = 0x8FFFFFFF
+ram_kernel_origin = 0x80004000
+usb_vid = 0x15a2
+usb_pid = 0x003a
+
+[fast]
+description = High-speed UART
+sdram_start = 0x80000000
+sdram_end = 0x8FFFFFFF
+ram_kernel_origin = 0x80004000
+usb_vid = 0x15a2
+usb_pid = 0x003a
+uart_baudrate = 921600
+uart_read_timeout = 0.5
+uart_inter_byte_timeout = 0.01
+uart_low_latency = yes
+reopen_timeout = 30
+kernel_ready_timeout = 2.5
+boot_ready_timeout = 1
+dcd_format = HAB4
+dcd_address = 0xF8006000
+uid_fuse_address = 0x20
+uid_fuse_count = 4
+"""
+
+class BoardSupportTableTests(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "bspinfo.conf")
+        with open(self.path, "w") as conf:
+            conf.write(BSP_CONFIG)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_missing_file(self):
+        self.assertRaises(IOError, bspinfo.load_board_support_table,
+                          [os.path.join(self.tempdir, "missing.conf")])
+
+    def test_uart_defaults(self):
+        info = bspinfo.load_board_support_table([self.path])["plain"]
+        self.assertEqual(0x15a2, info.usb_vid)
+        self.assertEqual(115200, info.uart_baudrate)
+        self.assertEqual(5, info.uart_read_timeout)
+        self.assertEqual(None, info.uart_inter_byte_timeout)
+        self.assertFalse(info.uart_low_latency)
+        self.assertEqual(10, info.reopen_timeout)
+        self.assertEqual(5, info.kernel_ready_timeout)
+        self.assertEqual(5, info.boot_ready_timeout)
+        self.assertEqual(None, info.dcd_format)
+        self.assertEqual(None, info.dcd_address)
+
+    def test_field_defaults(self):
+        info = bspinfo.BoardSupportInfo("test", 0x80000000, 0x8FFFFFFF, None, None,
+                                         0x80004000, 0x15a2, 0x003a)
+        for key, default in bspinfo._FIELD_DEFAULTS.items():
+            self.assertEqual(default, getattr(info, key))
+
+    def test_uart_settings(self):
+        info = bspinfo.load_board_support_table([self.path])["fast"]
+        self.assertEqual(921600, info.uart_baudrate)
+        self.assertEqual(0.5, info.uart_read_timeout)
+        self.assertEqual(0.01, info.uart_inter_byte_timeout)
+        self.assertTrue(info.uart_low_latency)
+
+    def test_ready_timeouts(self):
+        info = bspinfo.load_board_support_table([self.path])["fast"]
+        self.assertEqual(30, info.reopen_timeout)
+        self.assertEqual(2.5, info.kernel_ready_timeout)
+        self.assertEqual(1, info.boot_ready_timeout)
+
+    def test_uid_fuses(self):
+        table = bspinfo.load_board_support_table([self.path])
+        self.assertEqual((None, 8), (table["plain"].uid_fuse_address,
+                                     table["plain"].uid_fuse_count))
+        self.assertEqual((0x20, 4), (table["fast"].uid_fuse_address,
+                                     table["fast"].uid_fuse_count))
+
+    def test_dcd(self):
+        info = bspinfo.load_board_support_table([self.path])["fast"]
+        self.assertEqual(boot.DCD_FORMAT_HAB4, info.dcd_format)
+        self.assertEqual(0xF8006000, info.dcd_address)
+
+    def test_dcd_invalid(self):
+        for settings in ("dcd_format = v9\ndcd_address = 0\n", "dcd_format = v1\n"):
+            with open(self.path, "w") as conf:
+                conf.write(BSP_CONFIG + "\n[bad]\ndescription = Bad DCD\n"
+                           "sdram_start = 0\nsdram_end = 0\nram_kernel_origin = 0\n"
+                           "usb_vid = 0\nusb_pid = 0\n" + settings)
+            self.assertRaises(ValueError, bspinfo.load_board_support_table, [self.path])
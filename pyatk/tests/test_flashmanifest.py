@@ -0,0 +1,110 @@
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from pyatk.tests.mockchannel import MockChannel
+from pyatk.tests.mockboard import SimulatedBoard, BoardChannel
+from pyatk import ramkernel
+from pyatk import flashmanifest
+
+IDENTITY = flashmanifest.FlashIdentity("usb:1-1.4", 0x25, b"Simulated NAND",
+                                       128 * 1024, 0x20000)
+
+class FlashManifestTests(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tempdir, "flash-manifests")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_save_load(self):
+        self.assertIsNone(flashmanifest.load(self.cache_dir, IDENTITY))
+
+        blocks = {0x0: (0x20000, ramkernel.block_digest(b"A")),
+                  0x20000: (0x100, ramkernel.block_digest(b"B"))}
+        flashmanifest.save(self.cache_dir, IDENTITY, blocks)
+        self.assertEqual(blocks, flashmanifest.load(self.cache_dir, IDENTITY))
+        self.assertEqual([os.path.basename(flashmanifest.manifest_path(self.cache_dir, IDENTITY))],
+                         os.listdir(self.cache_dir))
+
+        # Another board, kernel or block size has its own manifest.
+        for other in (IDENTITY._replace(board = "usb:1-1.2"),
+                      IDENTITY._replace(flash_model = b"Other NAND"),
+                      IDENTITY._replace(block_size = 0x4000)):
+            self.assertIsNone(flashmanifest.load(self.cache_dir, other))
+
+        flashmanifest.discard(self.cache_dir, IDENTITY)
+        self.assertIsNone(flashmanifest.load(self.cache_dir, IDENTITY))
+        # Discarding twice is harmless.
+        flashmanifest.discard(self.cache_dir, IDENTITY)
+
+    def test_load_damaged(self):
+        os.makedirs(self.cache_dir)
+        path = flashmanifest.manifest_path(self.cache_dir, IDENTITY)
+        for contents in ("{", "[]", '{"version": 1}',
+                         '{"version": 1, "key": "wrong", "blocks": {}}'):
+            with open(path, "w") as manifest_fp:
+                manifest_fp.write(contents)
+            self.assertIsNone(flashmanifest.load(self.cache_dir, IDENTITY))
+
+    def test_fuse_uid(self):
+        channel = MockChannel()
+        kernel = ramkernel.RAMKernelProtocol(channel)
+        kernel._kernel_init = True
+        for value in (0x01, 0xA5, 0x3C):
+            channel.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, value)
+
+        self.assertEqual("uid:01a53c", flashmanifest.fuse_uid(kernel, 0x20, 3))
+        self.assertEqual([ramkernel._command_packet(ramkernel.CMD_FUSE_READ, address, 0, 0)
+                          for address in (0x20, 0x21, 0x22)], channel.recv_data)
+
+    def test_merge(self):
+        previous = {0x0: (4, "a"), 0x4: (4, "b"), 0x8: (4, "c")}
+        self.assertEqual({0x0: (4, "a"), 0x4: (4, "B"), 0xC: (2, "d")},
+                         flashmanifest.merge(previous, {0x4: (4, "B"), 0x8: None,
+                                                        0xC: (2, "d")}))
+        self.assertEqual({0x0: (4, "a")}, flashmanifest.merge(None, {0x0: (4, "a")}))
+
+    def test_differential_after_partial_block(self):
+        """ A block patched in place is programmed again by the next differential run. """
+        block = 0x200
+        image = b"\x11" * (2 * block)
+        for program_ub in (True, False):
+            board = SimulatedBoard(report_size = 0x100, flash_size = 2 * block,
+                                   flash_block_size = block, program_ub = program_ub)
+            kernel = ramkernel.RAMKernelProtocol(BoardChannel(board))
+            kernel._kernel_init = kernel._flash_init = True
+
+            def program(address, data, manifest):
+                block_hashes = {}
+                kernel.program_stream(address, io.BytesIO(data), block_size = block,
+                                      previous = manifest, block_hashes = block_hashes)
+                return flashmanifest.merge(manifest, block_hashes)
+
+            manifest = program(0, image, None)
+            manifest = program(0x100, b"\x22" * 16, manifest)
+            self.assertEqual(b"\x22" * 16, bytes(board.flash[0x100:0x110]))
+
+            program(0, image, manifest)
+            self.assertEqual(image, bytes(board.flash))
+
+    def test_spot_check(self):
+        channel = MockChannel()
+        kernel = ramkernel.RAMKernelProtocol(channel)
+        kernel._flash_init = True
+        kernel._kernel_init = True
+
+        blocks = {0x0: (4, ramkernel.block_digest(b"good")),
+                  0x20000: (4, ramkernel.block_digest(b"gone"))}
+        for data in (b"good", b"\xff\xff\xff\xff"):
+            channel.queue_rkl_response(ramkernel.ACK_FLASH_PARTLY,
+                                       ramkernel.calculate_checksum(data), len(data), data)
+
+        self.assertEqual([0x20000], flashmanifest.spot_check(kernel, blocks, 5,
+                                                             random.Random(1)))
+        # Nothing to check in an empty manifest.
+        self.assertEqual([], flashmanifest.spot_check(kernel, {}, 2))
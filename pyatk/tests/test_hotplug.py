@@ -0,0 +1,132 @@
+import time
+import unittest
+
+import usb
+
+from pyatk.channel import hotplug
+from pyatk.channel import usbdev
+from pyatk.tests.mockhotplug import SimulatedHotplugMonitor
+from pyatk.tests.mockusb import FakeDevice, FakeBus
+
+def uevent(action, devpath, **fields):
+    lines = [("%s@%s" % (action, devpath)).encode("ascii"),
+             ("ACTION=%s" % action).encode("ascii"),
+             ("DEVPATH=%s" % devpath).encode("ascii")]
+    for key, value in sorted(fields.items()):
+        lines.append(("%s=%s" % (key, value)).encode("ascii"))
+    return b"\0".join(lines) + b"\0"
+
+class ParseUeventTests(unittest.TestCase):
+    def test_usb_device_added(self):
+        message = uevent("add", "/devices/pci0000:00/0000:00:14.0/usb1/1-1/1-1.4",
+                         SUBSYSTEM = "usb", DEVTYPE = "usb_device", PRODUCT = "15a2/4e/1",
+                         BUSNUM = "001", DEVNUM = "017")
+        self.assertEqual(hotplug.HotplugEvent(0x15a2, 0x4e, 1, 17, (1, 4)),
+                         hotplug.parse_uevent(message))
+
+    def test_ignored(self):
+        """ Removals, interfaces and other subsystems are not arrivals. """
+        for action, devtype, subsystem in (("remove", "usb_device", "usb"),
+                                           ("add", "usb_interface", "usb"),
+                                           ("add", "usb_device", "block")):
+            message = uevent(action, "/devices/usb1/1-1", SUBSYSTEM = subsystem,
+                             DEVTYPE = devtype, PRODUCT = "15a2/4e/1",
+                             BUSNUM = "001", DEVNUM = "002")
+            self.assertEqual(None, hotplug.parse_uevent(message))
+
+    def test_malformed(self):
+        message = uevent("add", "/devices/usb1/1-1", SUBSYSTEM = "usb",
+                         DEVTYPE = "usb_device", PRODUCT = "garbage")
+        self.assertEqual(None, hotplug.parse_uevent(message))
+
+class HotplugMonitorTests(unittest.TestCase):
+    def setUp(self):
+        self.monitor = SimulatedHotplugMonitor()
+        self.monitor.start()
+
+    def tearDown(self):
+        self.monitor.stop()
+
+    def test_arrival_before_wait(self):
+        """ Arrivals are queued, so one reported before waiting is not missed. """
+        self.monitor.arrive(0x15a2, 0x4e, 1, 5)
+        event = self.monitor.wait_for_arrival(lambda e: True, 0)
+        self.assertEqual(5, event.address)
+
+    def test_match(self):
+        self.monitor.arrive(0x0424, 0x2514, 1, 4)
+        self.monitor.arrive(0x15a2, 0x4e, 1, 5)
+        event = self.monitor.wait_for_arrival(lambda e: e.vid == 0x15a2, 0)
+        self.assertEqual(5, event.address)
+        # Arrivals examined are consumed.
+        self.assertEqual(None, self.monitor.wait_for_arrival(lambda e: True, 0))
+
+    def test_timeout(self):
+        start = time.time()
+        self.assertEqual(None, self.monitor.wait_for_arrival(lambda e: True, 0.05))
+        self.assertTrue(time.time() - start >= 0.04)
+
+class CreateMonitorTests(unittest.TestCase):
+    def setUp(self):
+        self._factories = (hotplug.LibusbHotplugMonitor, hotplug.NetlinkHotplugMonitor)
+
+    def tearDown(self):
+        hotplug.LibusbHotplugMonitor, hotplug.NetlinkHotplugMonitor = self._factories
+
+    def test_unavailable(self):
+        def unavailable(*args):
+            raise hotplug.HotplugUnavailableError("not here")
+        hotplug.LibusbHotplugMonitor = hotplug.NetlinkHotplugMonitor = unavailable
+        self.assertEqual(None, hotplug.create_monitor(0x15a2, 0x4e))
+
+    def test_other_errors_propagate(self):
+        """ Only unavailability is swallowed, not bugs in a monitor. """
+        class Unfinished(hotplug.HotplugMonitor):
+            def __init__(self, *args):
+                super(Unfinished, self).__init__()
+        hotplug.LibusbHotplugMonitor = Unfinished
+        self.assertRaises(NotImplementedError, hotplug.create_monitor)
+
+class HotplugReopenTests(unittest.TestCase):
+    def setUp(self):
+        self.bus = FakeBus([FakeDevice(1, 7, (1, 4))])
+        self._find = usb.core.find
+        usb.core.find = self.bus.find
+
+        self.monitor = SimulatedHotplugMonitor()
+        self.monitor.start()
+        self.channel = usbdev.USBChannel(idProduct = 0x1234)
+        self.channel.open()
+
+    def tearDown(self):
+        self.monitor.stop()
+        usb.core.find = self._find
+
+    def reenumerate(self):
+        self.bus.devices = [FakeDevice(1, 8, (1, 4))]
+
+    def test_reopen_on_arrival(self):
+        """ reopen() returns as soon as the device arrives, not at the next poll. """
+        self.bus.devices = []
+        # Let the backoff grow to its longest delay before the board arrives.
+        self.monitor.arrive_later(1.2, self.reenumerate, usbdev.VID_FREESCALE, 0x1234, 1, 8)
+
+        elapsed = self.channel.reopen(timeout = 5, reenumerated = True, monitor = self.monitor)
+        self.assertEqual((1, 8), self.channel.address)
+        # Polling alone would not look again until 1.63 s.
+        self.assertTrue(1.2 <= elapsed < 1.5)
+        self.assertTrue(max(self.monitor.waits) > 0.2)
+
+    def test_reopen_ignores_other_devices(self):
+        self.bus.devices = []
+        self.monitor.arrive(0x0424, 0x2514, 1, 3)
+        self.monitor.arrive_later(0.1, self.reenumerate, usbdev.VID_FREESCALE, 0x1234, 1, 8)
+
+        self.channel.reopen(timeout = 5, reenumerated = True, monitor = self.monitor)
+        self.assertEqual((1, 8), self.channel.address)
+
+    def test_reopen_deadline(self):
+        self.bus.devices = []
+        start = time.time()
+        self.assertRaises(IOError, self.channel.reopen, timeout = 0.2, monitor = self.monitor)
+        self.assertTrue(time.time() - start < 1)
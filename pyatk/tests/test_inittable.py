@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyatk import bspinfo
+from pyatk import boot
+from pyatk import inittable
+from pyatk.inittable import InitEntry
+
+BSP = bspinfo.BoardSupportInfo("test", 0x80000000, 0x8FFFFFFF, None, None,
+                               0x80004000, 0x15a2, 0x003a)
+
+INIT_FILE = b"""\
+# i.MX25 mDDR bring-up (abridged)
+0xB8001010\t0x00000304   32
+0xB8001010  0x00000304   32      # repeated: folded
+0xB8001004 0x0075E73A 32
+
+0xB8001000 0x92100000 32
+0x80000F00 0x12344321 32
+0xB8001000 0xA2100000 32
+0x80000000 0x12344321 32
+0x80000000 0x12344321 32
+0x53F80008 0x2000 16
+0xB8001000 0x92100000 32
+"""
+
+class ParseTests(unittest.TestCase):
+    def test_parse(self):
+        entries = inittable.parse(INIT_FILE.decode("ascii").splitlines())
+        self.assertEqual(10, len(entries))
+        self.assertEqual(InitEntry(0xB8001010, 0x304, boot.DATA_SIZE_WORD), entries[0])
+        self.assertEqual(InitEntry(0x53F80008, 0x2000, boot.DATA_SIZE_HALFWORD), entries[-2])
+
+    def test_errors(self):
+        for line, message in (
+            ("0x80000000 0x1", "expected"),
+            ("0x80000000 0x1 32 4", "expected"),
+            ("0x8000000G 0x1 32", "invalid number"),
+            ("0x80000000 0x1 24", "width"),
+            ("0x100000000 0x1 32", "32-bit"),
+            ("0x80000002 0x1 32", "aligned"),
+            ("0x80000001 0x1 16", "aligned"),
+            ("0x80000000 0x100 8", "does not fit"),
+            ("0x80000000 -1 8", "does not fit"),
+        ):
+            with self.assertRaises(inittable.InitTableError) as cm:
+                inittable.parse(["# header", "", line], "board.txt")
+            self.assertEqual(3, cm.exception.lineno)
+            self.assertIn("board.txt:3:", str(cm.exception))
+            self.assertIn(message, str(cm.exception))
+
+class FoldTests(unittest.TestCase):
+    def test_fold(self):
+        entries = inittable.compile_table(INIT_FILE, BSP)
+        # Only the exact consecutive register duplicate goes.
+        self.assertEqual(9, len(entries))
+        self.assertEqual([0xB8001010, 0xB8001004], [entry.address for entry in entries[:2]])
+        # Repeated SDRAM accesses are controller commands and stay.
+        self.assertEqual(2, sum(1 for entry in entries if entry.address == 0x80000000))
+        # Non-adjacent writes to the same register stay.
+        self.assertEqual(3, sum(1 for entry in entries if entry.address == 0xB8001000))
+
+    def test_fold_without_bsp(self):
+        """ Without the SDRAM window, nothing can safely be dropped. """
+        entries = inittable.compile_table(INIT_FILE)
+        self.assertEqual(10, len(entries))
+
+    def test_different_width_kept(self):
+        entries = [InitEntry(0x53F80008, 0x20, 8), InitEntry(0x53F80008, 0x20, 16)]
+        self.assertEqual(entries, inittable.fold(entries, BSP))
+
+class CompiledTableTests(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tempdir, "cache")
+        self.path = os.path.join(self.tempdir, "init.txt")
+        with open(self.path, "wb") as init_fp:
+            init_fp.write(INIT_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_pack(self):
+        entries = inittable.compile_table(INIT_FILE, BSP)
+        self.assertEqual(entries, inittable.unpack(inittable.pack(entries)))
+        self.assertEqual([], inittable.unpack(inittable.pack([])))
+
+        packed = inittable.pack(entries)
+        for bad in (packed[:-1], b"NOTATABL" + packed[8:], b""):
+            self.assertRaises(ValueError, inittable.unpack, bad)
+
+    def test_cache_key(self):
+        other_bsp = BSP._replace(memory_bottom_address = 0x87FFFFFF)
+        self.assertNotEqual(inittable.cache_key(INIT_FILE, BSP),
+                            inittable.cache_key(INIT_FILE, other_bsp))
+        self.assertNotEqual(inittable.cache_key(INIT_FILE, BSP),
+                            inittable.cache_key(INIT_FILE + b"\n", BSP))
+
+    def test_load_cached(self):
+        entries = inittable.load(self.path, BSP, self.cache_dir)
+        cache_path = os.path.join(self.cache_dir, inittable.cache_key(INIT_FILE, BSP) + ".bin")
+        self.assertTrue(os.path.exists(cache_path))
+
+        # A second load comes from the cache without parsing.
+        parse = inittable.parse
+        def fail(*args):
+            raise AssertionError("parsed again")
+        inittable.parse = fail
+        try:
+            self.assertEqual(entries, inittable.load(self.path, BSP, self.cache_dir))
+        finally:
+            inittable.parse = parse
+
+    def test_load_corrupt_cache(self):
+        entries = inittable.load(self.path, BSP, self.cache_dir)
+        cache_path = os.path.join(self.cache_dir, inittable.cache_key(INIT_FILE, BSP) + ".bin")
+        with open(cache_path, "wb") as cache_fp:
+            cache_fp.write(b"garbage")
+
+        self.assertEqual(entries, inittable.load(self.path, BSP, self.cache_dir))
+        with open(cache_path, "rb") as cache_fp:
+            self.assertEqual(inittable.pack(entries), cache_fp.read())
+
+    def test_load_error(self):
+        with open(self.path, "ab") as init_fp:
+            init_fp.write(b"0x80000000 \xff 32\n")
+        with self.assertRaises(inittable.InitTableError) as cm:
+            inittable.load(self.path, BSP, self.cache_dir)
+        self.assertEqual(13, cm.exception.lineno)
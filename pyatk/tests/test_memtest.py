@@ -0,0 +1,85 @@
+import struct
+import unittest
+
+from pyatk.tests.mockboard import SimulatedBoard, BoardChannel
+from pyatk import boot
+from pyatk import memtest
+
+BASE = 0x80000000
+
+class PatternTests(unittest.TestCase):
+    def test_walking_ones(self):
+        words = memtest.pattern_words(memtest.PATTERN_WALKING_ONES, BASE, 40)
+        self.assertEqual([1 << i for i in range(32)] + [1 << i for i in range(8)], list(words))
+
+        # The pattern depends on the address, not on where a chunk starts.
+        self.assertEqual(list(words[5:]),
+                         list(memtest.pattern_words(memtest.PATTERN_WALKING_ONES, BASE + 20, 35)))
+
+    def test_address(self):
+        self.assertEqual([BASE, BASE + 4, BASE + 8],
+                         list(memtest.pattern_words(memtest.PATTERN_ADDRESS, BASE, 3)))
+
+    def test_random(self):
+        first = memtest.pattern_words(memtest.PATTERN_RANDOM, BASE, 1000, seed = 1)
+        self.assertEqual(first, memtest.pattern_words(memtest.PATTERN_RANDOM, BASE, 1000, seed = 1))
+        self.assertNotEqual(first, memtest.pattern_words(memtest.PATTERN_RANDOM, BASE, 1000, seed = 2))
+        self.assertEqual(1000, len(first))
+        self.assertEqual(0, len(memtest.pattern_words(memtest.PATTERN_RANDOM, BASE, 0)))
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, memtest.pattern_words, "checkerboard", BASE, 1)
+
+    def test_compare(self):
+        expected = memtest.pattern_words(memtest.PATTERN_ADDRESS, BASE, 5000)
+        self.assertEqual(([], 0), memtest.compare(BASE, expected, expected[:], 8))
+
+        actual = expected[:]
+        for index in (3, 2047, 4999):
+            actual[index] ^= 0x10
+        failures, count = memtest.compare(BASE, expected, actual, 2)
+        self.assertEqual(3, count)
+        self.assertEqual([memtest.MemTestFailure(BASE + 12, BASE + 12, (BASE + 12) ^ 0x10),
+                          memtest.MemTestFailure(BASE + 4 * 2047, BASE + 4 * 2047,
+                                                 (BASE + 4 * 2047) ^ 0x10)],
+                         failures)
+
+class RunPatternTests(unittest.TestCase):
+    def setUp(self):
+        self.board = SimulatedBoard(memory_base = BASE, memory_size = 256 * 1024,
+                                    load_status = boot.BOOT_PROTOCOL_COMPLETE)
+        self.sbp = boot.SerialBootProtocol(BoardChannel(self.board))
+
+    def test_patterns(self):
+        for pattern in memtest.PATTERNS:
+            result = memtest.run_pattern(self.sbp, pattern, BASE, 200 * 1024,
+                                         seed = 7, chunk_size = 48 * 1024)
+            self.assertEqual(pattern, result.pattern)
+            self.assertEqual(200 * 1024, result.size)
+            self.assertEqual(0, result.failure_count)
+            self.assertEqual([], result.failures)
+
+            if pattern == memtest.PATTERN_ADDRESS:
+                # The data really went to memory, in device (little-endian) order.
+                self.assertEqual((BASE + 0x100,),
+                                 struct.unpack_from("<I", self.board.memory, 0x100))
+
+    def test_failures(self):
+        self.board.faults = {BASE + 0x1000: 0x1, BASE + 0x20000: 0x80000000}
+        progress = []
+        result = memtest.run_pattern(self.sbp, memtest.PATTERN_ADDRESS, BASE, 256 * 1024,
+                                     progress_callback = lambda *args: progress.append(args))
+
+        self.assertEqual(2, result.failure_count)
+        self.assertEqual([memtest.MemTestFailure(BASE + 0x1000, BASE + 0x1000, BASE + 0x1001),
+                          memtest.MemTestFailure(BASE + 0x20000, BASE + 0x20000,
+                                                 (BASE + 0x20000) ^ 0x80000000)],
+                         result.failures)
+        self.assertEqual(("write", 256 * 1024, 256 * 1024), progress[3])
+        self.assertEqual(("read", 256 * 1024, 256 * 1024), progress[-1])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, memtest.run_pattern, self.sbp,
+                          memtest.PATTERN_ADDRESS, BASE + 2, 1024)
+        self.assertRaises(ValueError, memtest.run_pattern, self.sbp,
+                          memtest.PATTERN_ADDRESS, BASE, 1024, chunk_size = 0)
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+from pyatk import multiboard
+
+def job(target):
+    sys.stdout.write("flashing %s\n" % (target,))
+    if target == "fail":
+        raise IOError("board not responding")
+    elif target == "hang":
+        time.sleep(60)
+    elif target == "crash":
+        os._exit(3)
+    elif target.startswith("slow-"):
+        time.sleep(float(target[5:]))
+        return target
+    time.sleep(0.5)
+    return target.upper()
+
+class RunBoardsTests(unittest.TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+
+    def test_parallel(self):
+        """ Boards run at once: wall time follows the slowest board, not the sum. """
+        targets = ["1-1", "1-2", "1-3", "1-4"]
+        start = time.time()
+        results = multiboard.run_boards(targets, job, self.log_dir)
+        self.assertLess(time.time() - start, 1.5)
+
+        self.assertEqual(targets, [result.target for result in results])
+        for result in results:
+            self.assertTrue(result.ok)
+            self.assertIsNone(result.error)
+            self.assertEqual(result.target.upper(), result.value)
+            self.assertGreaterEqual(result.elapsed, 0.5)
+            with open(result.log_path) as log:
+                self.assertEqual("flashing %s\n" % (result.target,), log.read())
+
+    def test_max_workers(self):
+        start = time.time()
+        results = multiboard.run_boards(["a", "b", "c"], job, self.log_dir, max_workers = 1)
+        self.assertGreaterEqual(time.time() - start, 1.5)
+        self.assertTrue(all(result.ok for result in results))
+
+    def test_failure_isolated(self):
+        results = multiboard.run_boards(["1-1", "fail", "crash", "1-2"], job, self.log_dir)
+        ok, fail, crash, ok2 = results
+
+        self.assertTrue(ok.ok)
+        self.assertTrue(ok2.ok)
+
+        self.assertFalse(fail.ok)
+        self.assertIsNone(fail.value)
+        self.assertIn("board not responding", fail.error)
+        with open(fail.log_path) as log:
+            self.assertIn("Traceback", log.read())
+
+        self.assertFalse(crash.ok)
+        self.assertIn("code 3", crash.error)
+
+    def test_timeout(self):
+        start = time.time()
+        results = multiboard.run_boards(["hang", "1-1"], job, self.log_dir, timeout = 1)
+        self.assertLess(time.time() - start, 5)
+
+        self.assertFalse(results[0].ok)
+        self.assertIn("timed out", results[0].error)
+        self.assertTrue(results[1].ok)
+
+    def test_timeout_race(self):
+        """ Boards finishing right at the deadline are counted exactly once. """
+        targets = ["slow-0.9", "slow-0.95", "slow-1.0", "slow-1.05", "1-1"]
+        results = multiboard.run_boards(targets, job, self.log_dir, timeout = 1)
+        self.assertEqual(targets, [result.target for result in results])
+        for result in results:
+            self.assertTrue(result.ok or "timed out" in result.error)
+        self.assertTrue(results[-1].ok)
+
+    def test_log_path(self):
+        self.assertEqual(os.path.join("logs", "board-1-1.4.log"),
+                         multiboard.log_path_for("logs", "1-1.4"))
+        self.assertEqual(os.path.join("logs", "board-a_b.log"),
+                         multiboard.log_path_for("logs", "a/b"))
@@ -0,0 +1,49 @@
+import os
+import importlib.util
+import unittest
+
+import usb
+
+from pyatk.channel import usbdev
+from pyatk.tests.mockusb import FakeDevice, FakeBus
+
+SCRIPT = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "bin", "mx-toolkit.py")
+
+def load_toolkit():
+    spec = importlib.util.spec_from_file_location("mx_toolkit", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class BoardIdentityTests(unittest.TestCase):
+    def setUp(self):
+        self.toolkit = load_toolkit()
+        self.app = self.toolkit.ToolkitApplication()
+        self.options, _ = self.app.get_flash_parser().parse_args([])
+
+        self.bus = FakeBus([FakeDevice(1, 7, None, idProduct = 0x4e)])
+        self._find = usb.core.find
+        usb.core.find = self.bus.find
+
+    def tearDown(self):
+        usb.core.find = self._find
+
+    def identity(self, **kwargs):
+        self.app.channel = usbdev.USBChannel(**kwargs)
+        self.app.channel.open()
+        return self.app.board_identity(self.options)
+
+    def test_vendor_only(self):
+        """ A channel matching any product of the vendor still names the board. """
+        self.assertEqual("usb:bus1-addr7", self.identity())
+
+    def test_vendor_product(self):
+        self.assertEqual("usb:15a2:004e", self.identity(idProduct = 0x4e))
+
+    def test_port_path(self):
+        self.bus.devices = [FakeDevice(1, 7, (1, 4), idProduct = 0x4e)]
+        self.assertEqual("usb:1-1.4", self.identity())
+
+    def test_board_id(self):
+        self.options.board_id = "rack-3"
+        self.assertEqual("rack-3", self.identity())
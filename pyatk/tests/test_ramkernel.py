@@ -1,6 +1,9 @@
+import io
+import hashlib
 import unittest
 
 from pyatk.tests.mockchannel import MockChannel
+from pyatk.tests.mockboard import SimulatedBoard, BoardChannel
 from pyatk import ramkernel
 
 class RAMKernelTests(unittest.TestCase):
@@ -51,6 +54,20 @@ class RAMKernelTests(unittest.TestCase):
             self.assertEqual(ver, imx_version)
             self.assertEqual(flash, flash_model)
 
+    def test_wait_ready(self):
+        """ Poll getver until the kernel answers; a failure response also means "not yet". """
+        self.channel.read_timeouts = 2
+        self.channel.queue_rkl_response(ramkernel.FLASH_ERROR_INIT, 0, 0)
+        self.channel.queue_rkl_response(ramkernel.ACK_SUCCESS, 0x0025, 4, b"NAND")
+
+        (ver, flash), elapsed = self.rkl.wait_ready(timeout = 5)
+        self.assertEqual((0x0025, b"NAND"), (ver, flash))
+        self.assertTrue(0 < elapsed < 1)
+
+    def test_wait_ready_not_initialized(self):
+        rkl = ramkernel.RAMKernelProtocol(self.channel)
+        self.assertRaises(ramkernel.KernelNotInitializedError, rkl.wait_ready, 5)
+
     def test_erase(self):
         """ Test the flash_erase API with no callback specified. """
         block_size = 0x20000
@@ -340,3 +357,279 @@ class RAMKernelTests(unittest.TestCase):
             self.rkl.flash_program(0x0000, data)
         self.assertEqual(cm.exception.ack, ramkernel.FLASH_ERROR_PROG)
         self.assertEqual(cm.exception.command, ramkernel.CMD_FLASH_PROGRAM)
+
+    def queue_program_ok(self, length):
+        self.channel.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, length)
+        self.channel.queue_rkl_response(ramkernel.ACK_FLASH_PARTLY, 0, length)
+        self.channel.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, 0)
+
+    def test_program_stream(self):
+        """ program_stream writes up to the first block boundary, then block-aligned chunks. """
+        data = b"0123456789abc"
+        # 2 bytes into block 4, 8 bytes at block 8, then 3 bytes at block 16.
+        self.queue_program_ok(2)
+        self.queue_program_ok(8)
+        self.queue_program_ok(3)
+
+        digest = hashlib.sha256()
+        result = self.rkl.program_stream(6, io.BytesIO(data), block_size = 4, chunk_size = 8,
+                                         digest = digest)
+        self.assertEqual(ramkernel.ProgramStreamResult(13, 3, result.seconds, 0, 0), result)
+        self.assertEqual(hashlib.sha256(data).digest(), digest.digest())
+
+        self.assertEqual([ramkernel._command_packet(ramkernel.CMD_FLASH_PROGRAM_UB, 6, 2, 0),
+                          b"01",
+                          ramkernel._command_packet(ramkernel.CMD_FLASH_PROGRAM, 8, 8, 0),
+                          b"23456789",
+                          ramkernel._command_packet(ramkernel.CMD_FLASH_PROGRAM, 16, 3, 0),
+                          b"abc"],
+                         self.channel.recv_data)
+        self.assertTrue(self.rkl.program_ub)
+
+    def test_program_stream_length(self):
+        """ Only length bytes are programmed; a short stream is an error. """
+        self.queue_program_ok(8)
+        self.queue_program_ok(2)
+        result = self.rkl.program_stream(0, io.BytesIO(b"0123456789abc"), length = 10,
+                                         block_size = 4, chunk_size = 8)
+        self.assertEqual((10, 2), result[:2])
+
+        self.queue_program_ok(8)
+        self.assertRaises(ValueError, self.rkl.program_stream, 0, io.BytesIO(b"0123456789"),
+                          length = 12, block_size = 4, chunk_size = 8)
+
+        self.assertEqual(0, self.rkl.program_stream(0, io.BytesIO(b"")).chunks)
+
+    def test_program_stream_arguments(self):
+        stream = io.BytesIO(b"data")
+        for kwargs in ({"block_size": 0},
+                       {"block_size": 4, "chunk_size": 6},
+                       {"block_size": 4, "chunk_size": ramkernel.FLASH_PROGRAM_MAX_WRITE_SIZE + 4}):
+            self.assertRaises(ValueError, self.rkl.program_stream, 0, stream, **kwargs)
+        self.assertRaises(ValueError, self.rkl.program_stream, -1, stream)
+
+    def test_program_stream_error(self):
+        """ A failed chunk stops programming. """
+        self.queue_program_ok(4)
+        self.channel.queue_rkl_response(ramkernel.FLASH_FAILED, 0, 0)
+
+        with self.assertRaises(ramkernel.CommandResponseError):
+            self.rkl.program_stream(0, io.BytesIO(b"0123456789ab"), block_size = 4, chunk_size = 4)
+        # The first chunk, then the rejected second request; no third.
+        self.assertEqual(3, len(self.channel.recv_data))
+
+    def test_block_runs(self):
+        ff = b"\xff"
+        def runs(data):
+            return ramkernel._block_runs(data, 4, lambda offset, length:
+                                         ramkernel._is_erased(data, offset, length))
+
+        self.assertEqual([(0, 4, False), (4, 8, True), (12, 8, False)],
+                         runs(b"AAAA" + ff * 8 + b"BBBB" + b"B" + ff * 3))
+        self.assertEqual([(0, 4, False), (4, 3, True)], runs(b"AAAA" + ff * 3))
+        self.assertEqual([(0, 3, True)], runs(ff * 3))
+        self.assertEqual([], runs(b""))
+
+    def test_program_stream_sparse(self):
+        """ Erased blocks are erased, not sent; the rest is merged into few programs. """
+        ff = b"\xff"
+        data = b"AAAA" + ff * 8 + b"BBBB" + ff * 6
+        self.queue_program_ok(4)
+        self.channel.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, 0)
+        self.queue_program_ok(4)
+        self.channel.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, 0)
+
+        result = self.rkl.program_stream(0, io.BytesIO(data), block_size = 4, chunk_size = 8,
+                                         sparse = True)
+        self.assertEqual((22, 2, 14), (result.size, result.chunks, result.skipped))
+
+        # The erased run spanning two chunks is one erase; so is the
+        # short erased tail.
+        self.assertEqual([ramkernel._command_packet(ramkernel.CMD_FLASH_PROGRAM, 0, 4, 0),
+                          b"AAAA",
+                          ramkernel._command_packet(ramkernel.CMD_FLASH_ERASE, 4, 8, 0),
+                          ramkernel._command_packet(ramkernel.CMD_FLASH_PROGRAM, 12, 4, 0),
+                          b"BBBB",
+                          ramkernel._command_packet(ramkernel.CMD_FLASH_ERASE, 16, 6, 0)],
+                         self.channel.recv_data)
+
+        # Without erased blocks, each chunk is still a single program.
+        del self.channel.recv_data[:]
+        self.queue_program_ok(8)
+        result = self.rkl.program_stream(0, io.BytesIO(b"ABCDEFGH"), block_size = 4,
+                                         chunk_size = 8, sparse = True)
+        self.assertEqual((8, 1, 0), (result.size, result.chunks, result.skipped))
+        self.assertEqual(2, len(self.channel.recv_data))
+
+    def test_program_stream_differential(self):
+        """ Blocks whose hash has not changed are left alone. """
+        old = b"AAAABBBBCCCCDD"
+        new = b"AAAAXBBBCCCCDD\xff\xff"
+
+        hashes = {}
+        self.queue_program_ok(8)
+        self.queue_program_ok(6)
+        self.rkl.program_stream(0, io.BytesIO(old), block_size = 4, chunk_size = 8,
+                                block_hashes = hashes)
+        self.assertEqual({0: (4, ramkernel.block_digest(b"AAAA")),
+                          4: (4, ramkernel.block_digest(b"BBBB")),
+                          8: (4, ramkernel.block_digest(b"CCCC")),
+                          12: (2, ramkernel.block_digest(b"DD"))}, hashes)
+
+        # Only the changed block, and the last one (now longer), are sent.
+        del self.channel.recv_data[:]
+        new_hashes = {}
+        self.queue_program_ok(4)
+        self.queue_program_ok(4)
+        result = self.rkl.program_stream(0, io.BytesIO(new), block_size = 4, chunk_size = 8,
+                                         previous = hashes, block_hashes = new_hashes)
+        self.assertEqual((16, 2, 0, 8), (result.size, result.chunks,
+                                         result.skipped, result.unchanged))
+        self.assertEqual([ramkernel._command_packet(ramkernel.CMD_FLASH_PROGRAM, 4, 4, 0),
+                          b"XBBB",
+                          ramkernel._command_packet(ramkernel.CMD_FLASH_PROGRAM, 12, 4, 0),
+                          b"DD\xff\xff"],
+                         self.channel.recv_data)
+        self.assertEqual(hashes[0], new_hashes[0])
+        self.assertEqual((4, ramkernel.block_digest(b"XBBB")), new_hashes[4])
+
+    def test_add_range(self):
+        self.assertEqual([(2, 4)], ramkernel._add_range([], 2, 4))
+        self.assertEqual([(2, 4), (6, 8)], ramkernel._add_range([(6, 8)], 2, 4))
+        self.assertEqual([(2, 8)], ramkernel._add_range([(2, 4), (6, 8)], 4, 6))
+        self.assertEqual([(0, 9)], ramkernel._add_range([(2, 4), (6, 8)], 0, 9))
+
+    def test_partial_block_writer_rejected(self):
+        """ Without CMD_FLASH_PROGRAM_UB, a partial block is dumped, merged and programmed. """
+        current = b"abcdefgh"
+        self.channel.queue_rkl_response(ramkernel.FLASH_FAILED, 0, 0)
+        self.channel.queue_rkl_response(ramkernel.ACK_FLASH_PARTLY,
+                                        ramkernel.calculate_checksum(current),
+                                        len(current), current)
+        self.queue_program_ok(8)
+
+        writer = ramkernel.PartialBlockWriter(self.rkl, 8)
+        writer.write(10, b"XY")
+        self.assertEqual([8], writer.pending)
+        self.assertEqual({8: b"abXYefgh"}, writer.flush())
+        self.assertEqual([], writer.pending)
+        self.assertIs(False, self.rkl.program_ub)
+
+        self.assertEqual([ramkernel._command_packet(ramkernel.CMD_FLASH_PROGRAM_UB, 10, 2, 0),
+                          ramkernel._command_packet(ramkernel.CMD_FLASH_DUMP, 8, 8, 0),
+                          ramkernel._command_packet(ramkernel.CMD_FLASH_PROGRAM, 8, 8, 0),
+                          b"abXYefgh"],
+                         self.channel.recv_data)
+
+    def test_partial_block_writer_short_dump(self):
+        """ A block that cannot be read back whole is not programmed. """
+        self.rkl.program_ub = False
+        self.rkl.flash_dump = lambda address, size: b"abcd"
+
+        writer = ramkernel.PartialBlockWriter(self.rkl, 8)
+        writer.write(10, b"XY")
+        with self.assertRaises(ramkernel.CommandResponseError) as cm:
+            writer.flush()
+        self.assertEqual(ramkernel.CMD_FLASH_DUMP, cm.exception.command)
+        self.assertEqual(4, cm.exception.length)
+        self.assertEqual([], self.channel.recv_data)
+
+    def test_partial_block_writer_board(self):
+        """ Writes are coalesced into one program per block, keeping the rest of it. """
+        block = 16
+        for program_ub in (False, True):
+            board = SimulatedBoard(report_size = 8, flash_size = 4 * block,
+                                   flash_block_size = block, program_ub = program_ub)
+            board.flash[:] = bytes(range(4 * block))
+            kernel = ramkernel.RAMKernelProtocol(BoardChannel(board))
+            kernel._kernel_init = kernel._flash_init = True
+            expected = bytearray(board.flash)
+
+            writer = ramkernel.PartialBlockWriter(kernel, block)
+            # Two writes to block 16, one of them overwritten in part; one
+            # write spanning blocks 32 and 48.
+            for address, data in ((20, b"abc"), (23, b"d"), (21, b"X"), (44, b"0123456")):
+                writer.write(address, data)
+                expected[address:address + len(data)] = data
+
+            programmed = writer.flush(read_back_verify = True)
+            self.assertEqual([16, 32, 48], sorted(programmed))
+            self.assertEqual(expected, board.flash)
+            self.assertEqual(program_ub, kernel.program_ub)
+
+            # Unaligned program_stream keeps the start of the first block.
+            result = kernel.program_stream(block + 5, io.BytesIO(b"Z" * 20), block_size = block)
+            expected[block + 5:block + 25] = b"Z" * 20
+            # The stock kernel erases the rest of the last block it programs.
+            expected[block + 25:3 * block] = b"\xff" * (2 * block - 25)
+            self.assertEqual(expected, board.flash)
+            self.assertEqual((20, 2), result[:2])
+
+    def test_partial_block_writer_arguments(self):
+        self.assertRaises(ValueError, ramkernel.PartialBlockWriter, self.rkl, 0)
+        self.assertRaises(ValueError, ramkernel.PartialBlockWriter, self.rkl,
+                          ramkernel.FLASH_PROGRAM_MAX_WRITE_SIZE + 1)
+        writer = ramkernel.PartialBlockWriter(self.rkl, 8)
+        self.assertRaises(ValueError, writer.write, -1, b"x")
+        self.assertEqual({}, writer.flush())
+
+    def test_subtract_ranges(self):
+        self.assertEqual([(0, 2), (6, 8)], ramkernel._subtract_ranges([(0, 8)], [(2, 6)]))
+        self.assertEqual([(0, 2)], ramkernel._subtract_ranges([(0, 4), (6, 8)], [(2, 9)]))
+        self.assertEqual([], ramkernel._subtract_ranges([(2, 4)], [(0, 4)]))
+        self.assertEqual([(2, 4)], ramkernel._subtract_ranges([(2, 4)], [(4, 6)]))
+        self.assertEqual([(0, 16)], ramkernel._align_ranges([(1, 3), (10, 12)], 8))
+
+    def test_flash_erase_block_size(self):
+        """ flash_erase keeps the block size the RAM kernel reports. """
+        self.assertIsNone(self.rkl.erase_block_size)
+        self.channel.queue_rkl_response(ramkernel.ACK_FLASH_ERASE, 0, 0x4000)
+        self.channel.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, 0)
+        self.rkl.flash_erase(0, 0x4000)
+        self.assertEqual(0x4000, self.rkl.erase_block_size)
+
+    def test_erase_planner(self):
+        """ Erases are merged, and whole blocks that will be programmed are left out. """
+        planner = ramkernel.ErasePlanner(self.rkl, block_size = 16)
+        for address, size in ((0, 16), (16, 16), (24, 40), (100, 4), (100, 0)):
+            planner.erase(address, size)
+        self.assertEqual([(0, 64), (100, 4)], planner.plan())
+
+        # The partial first block at 8 and the tail after 40 stay erased.
+        planner.program(8, 32)
+        self.assertEqual([(0, 16), (40, 24), (100, 4)], planner.plan())
+
+        # Once the block size is known, the programmed last block is left
+        # out as well, and erases are grown to whole blocks.
+        self.rkl.erase_block_size = 16
+        self.assertEqual([(0, 16), (48, 16), (96, 16)], planner.plan())
+
+        for args in ((-1, 4), (0, -4)):
+            self.assertRaises(ValueError, planner.erase, *args)
+            self.assertRaises(ValueError, planner.program, *args)
+        self.assertRaises(ValueError, ramkernel.ErasePlanner, self.rkl, 0)
+
+    def test_erase_planner_board(self):
+        """ The block size learned from the first erase shapes the rest. """
+        block = 16
+        board = SimulatedBoard(flash_size = 8 * block, flash_block_size = block)
+        board.flash[:] = b"\x00" * len(board.flash)
+        kernel = ramkernel.RAMKernelProtocol(BoardChannel(board))
+        kernel._kernel_init = kernel._flash_init = True
+
+        planner = ramkernel.ErasePlanner(kernel, block_size = block)
+        for address, size in ((0, 4), (8, 4), (40, 4), (44, 40), (100, 2)):
+            planner.erase(address, size)
+        planner.program(64, 20)
+
+        # The first erase covers the whole of block 0, so the erase at 8 is
+        # dropped; the erase ending in programmed block 64 stops before it.
+        self.assertEqual([(0, 4), (32, 32), (96, 16)], planner.execute())
+        self.assertEqual(block, kernel.erase_block_size)
+        self.assertEqual(3, board.erase_commands)
+        self.assertEqual([], planner.plan())
+
+        erased = b"\xff" * block
+        zeros = b"\x00" * block
+        self.assertEqual(erased + zeros + erased * 2 + zeros * 2 + erased + zeros, board.flash)
+
@@ -0,0 +1,116 @@
+import os
+import time
+import threading
+import collections
+import unittest
+
+from pyatk.channel import base
+from pyatk.channel.readahead import ReadAheadReader
+
+class FakeStream(object):
+    """ A byte stream fed by the test, read with a short timeout. """
+    def __init__(self):
+        self.chunks = collections.deque()
+        self.requests = []
+        self.error = None
+        self.cond = threading.Condition()
+
+    def feed(self, data):
+        with self.cond:
+            self.chunks.append(data)
+            self.cond.notify_all()
+
+    def read(self, max_length):
+        with self.cond:
+            self.requests.append(max_length)
+            if self.error is not None:
+                raise self.error
+            if not self.chunks:
+                self.cond.wait(0.01)
+            if not self.chunks:
+                return b""
+
+            data = self.chunks.popleft()
+            if len(data) > max_length:
+                self.chunks.appendleft(data[max_length:])
+                data = data[:max_length]
+            return data
+
+class ReadAheadReaderTests(unittest.TestCase):
+    def setUp(self):
+        self.stream = FakeStream()
+        self.reader = ReadAheadReader(self.stream.read, capacity = 64)
+        self.reader.start()
+
+    def tearDown(self):
+        self.reader.stop()
+
+    def test_read(self):
+        self.stream.feed(b"abc")
+        self.stream.feed(b"defgh")
+        self.assertEqual(b"abcd", self.reader.read(4, 1))
+        self.assertEqual(b"efgh", self.reader.read(4, 1))
+
+    def test_read_ahead(self):
+        """ Data is drained from the stream before it is asked for. """
+        self.stream.feed(b"x" * 32)
+        deadline = time.time() + 1
+        while len(self.reader.buffer) < 32 and time.time() < deadline:
+            time.sleep(0.001)
+
+        self.assertEqual(32, len(self.reader.buffer))
+        self.assertEqual(b"x" * 32, self.reader.read(32, 0))
+
+    def test_bounded(self):
+        """ The reader stops reading when the buffer is full and resumes as it drains. """
+        data = bytes(bytearray(range(200)))
+        self.stream.feed(data)
+
+        self.assertEqual(data, self.reader.read(len(data), 1))
+        self.assertTrue(all(0 < request <= 64 for request in self.stream.requests))
+
+    def test_read_timeout(self):
+        self.stream.feed(b"ab")
+        with self.assertRaises(base.ChannelReadTimeout) as cm:
+            self.reader.read(4, 0.05)
+        self.assertEqual(b"ab", cm.exception.actual_data_read)
+
+    def test_inter_byte_timeout(self):
+        self.stream.feed(b"ab")
+        start = time.time()
+        with self.assertRaises(base.ChannelReadTimeout) as cm:
+            self.reader.read(4, 10, inter_byte_timeout = 0.05)
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(b"ab", cm.exception.actual_data_read)
+
+    def test_read_error(self):
+        self.stream.error = OSError("device disconnected")
+        self.assertRaises(IOError, self.reader.read, 4, 1)
+
+@unittest.skipUnless(hasattr(os, "openpty"), "requires pseudo-terminals")
+class UARTReadAheadTests(unittest.TestCase):
+    def setUp(self):
+        from pyatk.channel.uart import UARTChannel
+
+        self.master, slave = os.openpty()
+        self.channel = UARTChannel(os.ttyname(slave), read_ahead = True)
+        os.close(slave)
+        self.channel.read_timeout = 1
+        self.channel.open()
+
+    def tearDown(self):
+        self.channel.close()
+        os.close(self.master)
+
+    def test_read_write(self):
+        data = bytes(bytearray(range(256))) * 16
+        os.write(self.master, data)
+        self.assertEqual(data[:8], self.channel.read(8))
+        self.assertEqual(data[8:], self.channel.read(len(data) - 8))
+
+        self.channel.write(b"\x12\x34")
+        self.assertEqual(b"\x12\x34", os.read(self.master, 2))
+
+    def test_read_timeout(self):
+        self.channel.read_timeout = 0.05
+        self.assertRaises(base.ChannelReadTimeout, self.channel.read, 1)
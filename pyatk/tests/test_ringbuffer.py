@@ -0,0 +1,67 @@
+import unittest
+
+from pyatk.channel.ringbuffer import RingBuffer, RingBufferOverflow
+
+class RingBufferTests(unittest.TestCase):
+    def test_empty(self):
+        ring = RingBuffer(16)
+        self.assertEqual(0, len(ring))
+        self.assertEqual(16, ring.capacity)
+        self.assertEqual(16, ring.free)
+        self.assertEqual(b"", ring.read(10))
+
+    def test_invalid_capacity(self):
+        self.assertRaises(ValueError, RingBuffer, 0)
+
+    def test_write_read(self):
+        ring = RingBuffer(16)
+        ring.write(b"hello")
+        ring.write(bytearray(b" world"))
+        self.assertEqual(11, len(ring))
+        self.assertEqual(5, ring.free)
+
+        self.assertEqual(b"hello", ring.read(5))
+        self.assertEqual(b" world", ring.read(100))
+        self.assertEqual(0, len(ring))
+
+    def test_wraparound(self):
+        """ Ensure data written across the end of the buffer is read back in order. """
+        ring = RingBuffer(8)
+        ring.write(b"abcdef")
+        self.assertEqual(b"abcd", ring.read(4))
+        # 2 bytes left at the end of the buffer; this write wraps.
+        ring.write(b"ghijkl")
+        self.assertEqual(8, len(ring))
+        self.assertEqual(0, ring.free)
+        self.assertEqual(b"efghijkl", ring.read(8))
+
+    def test_readinto(self):
+        ring = RingBuffer(8)
+        ring.write(b"abcdef")
+        ring.read(5)
+        ring.write(b"1234567")
+
+        buf = bytearray(10)
+        self.assertEqual(8, ring.readinto(buf))
+        self.assertEqual(b"f1234567\x00\x00", bytes(buf))
+
+        # Reading into a slice of a larger buffer must not touch the rest.
+        ring.write(b"xy")
+        view = memoryview(buf)
+        self.assertEqual(2, ring.readinto(view[8:]))
+        self.assertEqual(b"f1234567xy", bytes(buf))
+
+    def test_overflow(self):
+        ring = RingBuffer(4)
+        ring.write(b"abc")
+        self.assertRaises(RingBufferOverflow, ring.write, b"de")
+        # A failed write must leave the contents alone.
+        self.assertEqual(b"abc", ring.read(4))
+
+    def test_clear(self):
+        ring = RingBuffer(4)
+        ring.write(b"abcd")
+        ring.clear()
+        self.assertEqual(0, len(ring))
+        ring.write(b"efgh")
+        self.assertEqual(b"efgh", ring.read(4))
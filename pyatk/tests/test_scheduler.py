@@ -0,0 +1,116 @@
+import io
+import os
+import collections
+import unittest
+
+from pyatk.tests.mockboard import SimulatedBoard, serve_in_thread
+from pyatk import boot
+
+FakeBSP = collections.namedtuple("FakeBSP", ("base_memory_address", "ram_kernel_origin"))
+BSP = FakeBSP(0x80000000, 0x80004000)
+
+KERNEL_IMAGE = b"\xa5" * 20000
+FLASH_IMAGE = bytes(bytearray(i & 0xff for i in range(256 * 1024)))
+
+@unittest.skipUnless(hasattr(os, "openpty"), "requires pseudo-terminals")
+class SessionSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        from pyatk.scheduler import SessionScheduler
+        from pyatk.channel.uart import UARTChannel
+
+        self.UARTChannel = UARTChannel
+        self.scheduler = SessionScheduler()
+        self.boards = {}
+        self.fds = []
+        self.stop = None
+
+    def tearDown(self):
+        if self.stop is not None:
+            self.stop.set()
+        for fd in self.fds:
+            os.close(fd)
+
+    def add_board(self, name, job, simulated = True, **kwargs):
+        master, slave = os.openpty()
+        self.fds += [master, slave]
+        if simulated:
+            self.boards[master] = SimulatedBoard(report_size = 32 * 1024)
+        channel = self.UARTChannel(os.ttyname(slave), read_timeout = 2)
+        self.scheduler.add(name, channel, job, **kwargs)
+        return master
+
+    def start_boards(self):
+        self.stop = serve_in_thread(self.boards)
+
+    def test_many_boards(self):
+        events = []
+
+        async def flash(session):
+            def progress(done, total):
+                events.append(session.name)
+
+            await session.kernel.run_image(io.BytesIO(KERNEL_IMAGE), len(KERNEL_IMAGE), BSP,
+                                           progress)
+            await session.kernel.flash_initial()
+            _, flash_model = await session.kernel.getver()
+            await session.kernel.flash_program(0, FLASH_IMAGE, read_back_verify = True,
+                                               program_callback = progress)
+            return flash_model
+
+        names = ["tty%u" % i for i in range(8)]
+        masters = [self.add_board(name, flash) for name in names]
+        self.start_boards()
+
+        results = self.scheduler.run()
+        self.assertEqual(names, [result.target for result in results])
+        for result in results:
+            self.assertTrue(result.ok, result.error)
+            self.assertEqual(b"Simulated NAND", result.value)
+
+        for master in masters:
+            self.assertEqual(len(KERNEL_IMAGE) + len(FLASH_IMAGE),
+                             self.boards[master].payload_bytes)
+
+        # Sessions interleave: the first board is not done before the last starts.
+        self.assertLess(events.index(names[-1]),
+                        len(events) - 1 - events[::-1].index(names[0]))
+
+    def test_timeout(self):
+        """ A board that never answers fails on its own time limit; others carry on. """
+        async def status(session):
+            return await session.sbp.get_status()
+
+        self.add_board("silent", status, simulated = False, timeout = 0.3)
+        self.add_board("alive", status)
+        self.start_boards()
+
+        silent, alive = self.scheduler.run()
+        self.assertFalse(silent.ok)
+        self.assertIn("timed out", silent.error)
+        self.assertLess(silent.elapsed, 1.5)
+        self.assertTrue(alive.ok)
+        self.assertEqual(boot.HAB_PASSED, alive.value)
+
+    def test_failure_isolated(self):
+        async def bad(session):
+            # The RAM kernel was never loaded.
+            await session.kernel.flash_initial()
+
+        async def good(session):
+            return await session.sbp.get_status()
+
+        self.add_board("bad", bad)
+        self.add_board("good", good)
+        self.start_boards()
+
+        bad_result, good_result = self.scheduler.run()
+        self.assertFalse(bad_result.ok)
+        self.assertIn("KernelNotInitializedError", bad_result.error)
+        self.assertTrue(good_result.ok)
+
+    def test_duplicate_name(self):
+        async def job(session):
+            pass
+
+        self.add_board("a", job)
+        self.assertRaises(ValueError, self.add_board, "a", job)
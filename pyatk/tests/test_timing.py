@@ -0,0 +1,59 @@
+import unittest
+
+from pyatk import timing
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class RetryTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def retry(self, func, timeout, **kwargs):
+        return timing.retry(func, timeout, clock = self.clock.time,
+                            sleep = self.clock.sleep, **kwargs)
+
+    def test_backoff_delays(self):
+        delays = timing.backoff_delays(0.01, 0.05)
+        self.assertEqual([0.01, 0.02, 0.04, 0.05, 0.05], [next(delays) for _ in range(5)])
+
+    def test_immediate_success(self):
+        self.assertEqual(("ok", 0.0), self.retry(lambda: "ok", 1))
+        self.assertEqual([], self.clock.sleeps)
+
+    def test_eventual_success(self):
+        attempts = []
+        def func():
+            attempts.append(self.clock.now)
+            if len(attempts) < 4:
+                raise IOError("not yet")
+            return "ok"
+
+        result, elapsed = self.retry(func, 10, initial_delay = 0.01, max_delay = 1)
+        self.assertEqual("ok", result)
+        self.assertEqual([0.01, 0.02, 0.04], self.clock.sleeps)
+        self.assertAlmostEqual(0.07, elapsed)
+
+    def test_timeout(self):
+        def func():
+            raise IOError("never")
+
+        self.assertRaises(IOError, self.retry, func, 1, initial_delay = 0.1, max_delay = 0.3)
+        # The last sleep is cut short at the deadline.
+        self.assertAlmostEqual(1.0, self.clock.now)
+
+    def test_other_exceptions_propagate(self):
+        def func():
+            raise ValueError("bug")
+
+        self.assertRaises(ValueError, self.retry, func, 1)
+        self.assertEqual([], self.clock.sleeps)
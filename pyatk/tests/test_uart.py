@@ -0,0 +1,61 @@
+import os
+import unittest
+
+from pyatk.channel import base
+
+@unittest.skipUnless(hasattr(os, "openpty"), "requires pseudo-terminals")
+class UARTChannelTests(unittest.TestCase):
+    def setUp(self):
+        self.master, self.slave = os.openpty()
+        self.path = os.ttyname(self.slave)
+
+    def tearDown(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+    def make_channel(self, **kwargs):
+        from pyatk.channel.uart import UARTChannel
+        return UARTChannel(self.path, **kwargs)
+
+    def test_settings(self):
+        channel = self.make_channel(baudrate = 921600, read_timeout = 0.5,
+                                    inter_byte_timeout = 0.01)
+        self.assertEqual(921600, channel.port.baudrate)
+        self.assertEqual(0.5, channel.read_timeout)
+        self.assertEqual(0.01, channel.inter_byte_timeout)
+
+    def test_read(self):
+        channel = self.make_channel(read_timeout = 1)
+        channel.open()
+        try:
+            os.write(self.master, b"\x12\x34\x34\x12")
+            self.assertEqual(b"\x12\x34\x34\x12", channel.read(4))
+        finally:
+            channel.close()
+
+    def test_inter_byte_timeout(self):
+        """ A response that stops partway fails without waiting for the full read timeout. """
+        channel = self.make_channel(read_timeout = 10, inter_byte_timeout = 0.05)
+        channel.open()
+        try:
+            os.write(self.master, b"\x00\x00")
+            with self.assertRaises(base.ChannelReadTimeout) as cm:
+                channel.read(8)
+            self.assertEqual(b"\x00\x00", cm.exception.actual_data_read)
+        finally:
+            channel.close()
+
+    def test_read_timeout_with_inter_byte_timeout(self):
+        """ The read timeout still bounds the wait for the first byte. """
+        channel = self.make_channel(read_timeout = 0.2, inter_byte_timeout = 0.05)
+        channel.open()
+        try:
+            self.assertRaises(base.ChannelReadTimeout, channel.read, 4)
+        finally:
+            channel.close()
+
+    def test_low_latency_unsupported(self):
+        """ A port without low-latency support fails to open instead of silently ignoring it. """
+        channel = self.make_channel(low_latency = True)
+        self.assertRaises(IOError, channel.open)
+        self.assertFalse(channel.port.is_open)
@@ -0,0 +1,130 @@
+import time
+import unittest
+
+from pyatk.tests.mockchannel import MockChannel
+from pyatk.tests.mockusb import FakeTransferBackend
+from pyatk.channel import usbasync
+from pyatk.channel import usbdev
+from pyatk import ramkernel
+
+class TransferEngineTests(unittest.TestCase):
+    def setUp(self):
+        self.device = MockChannel()
+        self.backend = FakeTransferBackend(self.device)
+        self.engine = usbasync.TransferEngine(self.backend, 0x81, 0x01,
+                                              packet_size = 512,
+                                              max_transfer_size = 4096,
+                                              num_transfers = 4,
+                                              read_timeout = 50)
+        self.engine.start()
+
+    def tearDown(self):
+        self.engine.stop()
+
+    def test_invalid_num_transfers(self):
+        self.assertRaises(ValueError, usbasync.TransferEngine, self.backend,
+                          0x81, 0x01, 512, 4096, num_transfers = 0)
+
+    def test_read(self):
+        self.device.queue_data(b"\x01\x02\x03\x04\x05\x06\x07\x08")
+        self.assertEqual(b"\x01\x02\x03\x04", self.engine.read(4))
+        self.assertEqual(b"\x05\x06\x07\x08", self.engine.read(4))
+        # Only whole packets are ever requested.
+        self.assertEqual([512], self.backend.read_sizes)
+
+    def test_read_large(self):
+        """ A large read keeps several IN transfers of at most max_transfer_size in flight. """
+        data = bytes(bytearray(i & 0xff for i in range(20000)))
+        self.device.queue_data(data)
+
+        self.assertEqual(data, self.engine.read(len(data)))
+        self.assertEqual(4, self.backend.max_reads_in_flight)
+        # Never more than a packet beyond what was asked for.
+        self.assertTrue(0 <= sum(self.backend.read_sizes) - len(data) < 512)
+        self.assertTrue(all(size <= 4096 for size in self.backend.read_sizes))
+
+    def test_read_short_transfers(self):
+        """ Transfers ended early by short packets are followed by more transfers. """
+        for chunk in (b"abc", b"defg", b"h"):
+            self.device.queue_data(chunk)
+
+        self.assertEqual(b"abcdefgh", self.engine.read(8))
+
+    def test_read_timeout(self):
+        self.assertRaises(IOError, self.engine.read, 4)
+        # The engine is still usable afterwards.
+        self.device.queue_data(b"abcd")
+        self.assertEqual(b"abcd", self.engine.read(4))
+
+    def test_write(self):
+        self.engine.write(b"hello")
+        self.assertEqual(b"hello", self.device.get_data_written())
+
+    def test_write_large(self):
+        """ A large write keeps several OUT transfers in flight, preserving order. """
+        data = bytes(bytearray(i & 0xff for i in range(50000)))
+        self.engine.write(memoryview(data))
+
+        self.assertEqual(data, self.device.get_data_written())
+        self.assertEqual(4, self.backend.max_writes_in_flight)
+        self.assertEqual([4096] * 12 + [848], [len(chunk) for chunk in self.device.recv_data])
+
+    def test_write_error(self):
+        self.backend.write_status = usbasync.TRANSFER_ERROR
+        self.assertRaises(IOError, self.engine.write, b"\x00" * 10000)
+        # No transfers are left outstanding after the failure.
+        self.assertEqual(0, self.backend.writes_in_flight)
+
+    def test_events_error(self):
+        """ Once the event thread has died, every read and write fails at once. """
+        self.backend.events_error = RuntimeError("device gone")
+        for _ in range(2):
+            start = time.time()
+            with self.assertRaises(IOError) as cm:
+                self.engine.read(4)
+            self.assertIn("device gone", str(cm.exception))
+            self.assertLess(time.time() - start, 1)
+        self.assertRaises(IOError, self.engine.write, b"hello")
+
+    def test_stop(self):
+        self.engine.stop()
+        self.assertTrue(self.backend.closed)
+        self.assertRaises(IOError, self.engine.read, 1)
+
+class USBChannelEngineTests(unittest.TestCase):
+    """ Protocol handlers work unchanged over a USB channel using the transfer engine. """
+    def setUp(self):
+        self.device = MockChannel()
+        self.backend = FakeTransferBackend(self.device)
+        self.channel = usbdev.USBChannel(idProduct = 0x1234)
+        self.channel.engine = usbasync.TransferEngine(self.backend, 0x81, 0x01, 512,
+                                                      self.channel.max_transfer_size)
+        self.channel.engine.start()
+
+        self.rkl = ramkernel.RAMKernelProtocol(self.channel)
+        self.rkl._flash_init = True
+        self.rkl._kernel_init = True
+
+    def tearDown(self):
+        self.channel.close()
+        self.assertTrue(self.backend.closed)
+
+    def test_flash_program(self):
+        data = bytes(bytearray(i & 0xff for i in range(ramkernel.FLASH_PROGRAM_MAX_WRITE_SIZE)))
+        self.device.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, len(data))
+        self.device.queue_rkl_response(ramkernel.ACK_FLASH_PARTLY, 0, len(data))
+        self.device.queue_rkl_response(ramkernel.ACK_SUCCESS, 0, 0)
+
+        self.rkl.flash_program(0x0000, data)
+        # 16-byte command followed by the data.
+        self.assertEqual(data, self.device.get_data_written()[16:])
+        self.assertTrue(self.backend.max_writes_in_flight > 1)
+
+    def test_flash_dump(self):
+        chunks = (b"\xa5" * 2048, b"\x5a" * 2048)
+        for chunk in chunks:
+            self.device.queue_rkl_response(ramkernel.ACK_FLASH_PARTLY,
+                                           ramkernel.calculate_checksum(chunk),
+                                           len(chunk), chunk)
+
+        self.assertEqual(b"".join(chunks), self.rkl.flash_dump(0x0000, 4096))
@@ -0,0 +1,227 @@
+import array
+import unittest
+
+import usb
+
+from pyatk.channel import usbdev
+from pyatk.tests.mockusb import FakeEndpoint, FakeDevice, FakeBus
+
+class USBChannelTests(unittest.TestCase):
+    def setUp(self):
+        self.channel = usbdev.USBChannel(idProduct = 0x1234)
+        self.channel.endpoint_in = FakeEndpoint()
+        self.channel.endpoint_out = FakeEndpoint()
+
+    def test_read_exact(self):
+        self.channel.endpoint_in.packets = [b"\x01\x02\x03\x04"]
+        self.assertEqual(b"\x01\x02\x03\x04", self.channel.read(4))
+
+    def test_read_buffers_excess(self):
+        """ Data received beyond the requested length is returned by the next read. """
+        self.channel.endpoint_in.packets = [b"abcdefgh", b"ijkl"]
+        self.assertEqual(b"abc", self.channel.read(3))
+        self.assertEqual(b"defgh", self.channel.read(5))
+        self.assertEqual(b"ijk", self.channel.read(3))
+        self.assertEqual(b"l", self.channel.read(1))
+
+    def test_read_spans_transfers(self):
+        packets = [bytes(bytearray(range(i, i + 64))) for i in range(0, 192, 64)]
+        self.channel.endpoint_in.packets = list(packets)
+        self.assertEqual(b"".join(packets)[:150], self.channel.read(150))
+        self.assertEqual(b"".join(packets)[150:], self.channel.read(42))
+
+    def test_readinto(self):
+        self.channel.endpoint_in.packets = [b"0123456789"]
+        buf = bytearray(12)
+        view = memoryview(buf)
+        self.assertEqual(4, self.channel.readinto(view[2:6]))
+        self.assertEqual(b"\x00\x000123\x00\x00\x00\x00\x00\x00", bytes(buf))
+
+    def test_read_transfer_size(self):
+        """ IN transfers are sized to the data still needed, in whole packets. """
+        self.channel.endpoint_in.wMaxPacketSize = 512
+        self.channel.endpoint_in.packets = [b"\xaa" * 1000]
+        self.assertEqual(b"\xaa" * 1000, self.channel.read(1000))
+        self.assertEqual([1024], self.channel.endpoint_in.read_requests)
+
+    def test_read_transfer_size_limit(self):
+        """ Large reads are split into transfers of at most max_transfer_size bytes. """
+        channel = usbdev.USBChannel(idProduct = 0x1234, max_transfer_size = 4096 + 100)
+        channel.endpoint_in = FakeEndpoint(512)
+        channel.endpoint_in.packets = [b"\x01" * 4096, b"\x02" * 4096, b"\x03" * 1808]
+
+        data = channel.read(10000)
+        self.assertEqual(b"\x01" * 4096 + b"\x02" * 4096 + b"\x03" * 1808, data)
+        # The limit is rounded down to a whole number of packets.
+        self.assertEqual([4096, 4096, 2048], channel.endpoint_in.read_requests)
+
+    def test_read_short_and_zero_length_packets(self):
+        """ Transfers ended early by short or zero-length packets are continued. """
+        self.channel.endpoint_in.packets = [b"abc", b"", b"defgh"]
+        self.assertEqual(b"abcdefgh", self.channel.read(8))
+        self.assertEqual([64, 64, 64], self.channel.endpoint_in.read_requests)
+
+    def test_invalid_max_transfer_size(self):
+        self.assertRaises(ValueError, usbdev.USBChannel, idProduct = 1, max_transfer_size = 64)
+
+    def test_write_single_transfer(self):
+        """ Writes up to max_transfer_size bytes are submitted as one transfer. """
+        data = bytes(bytearray(range(200)))
+        self.channel.write(data)
+        self.assertEqual([data], self.channel.endpoint_out.written)
+
+    def test_write_transfer_size_limit(self):
+        """
+        Large writes are split into whole-packet transfers of at most
+        max_transfer_size bytes, with any short packet at the very end.
+        """
+        channel = usbdev.USBChannel(idProduct = 0x1234, max_transfer_size = 4096 + 100)
+        channel.endpoint_out = FakeEndpoint(512)
+        data = bytes(bytearray(i & 0xff for i in range(10000)))
+
+        channel.write(memoryview(data))
+        self.assertEqual([4096, 4096, 1808],
+                         [len(chunk) for chunk in channel.endpoint_out.written])
+        self.assertEqual(data, b"".join(channel.endpoint_out.written))
+
+    def test_write_typed_buffer(self):
+        """ Buffers of wider item types are written byte for byte. """
+        data = array.array("I", [0x01020304, 0x05060708])
+        self.channel.write(data)
+        self.assertEqual([data.tobytes()], self.channel.endpoint_out.written)
+
+    def test_write_error(self):
+        def write(data, timeout = None):
+            raise usb.USBError("Operation timed out")
+        self.channel.endpoint_out.write = write
+        self.assertRaises(IOError, self.channel.write, b"abc")
+
+    def test_read_error(self):
+        self.assertRaises(IOError, self.channel.read, 1)
+
+    def test_close_discards_buffered_data(self):
+        self.channel.endpoint_in.packets = [b"abcdefgh"]
+        self.channel.read(2)
+        self.channel.close()
+        self.channel.endpoint_in = FakeEndpoint()
+        self.channel.endpoint_in.packets = [b"zz"]
+        self.assertEqual(b"zz", self.channel.read(2))
+
+class USBChannelOpenTests(unittest.TestCase):
+    def setUp(self):
+        self.bus = FakeBus([FakeDevice(1, 2, (1,), idVendor = 0x0424)])
+        self._find = usb.core.find
+        usb.core.find = self.bus.find
+        self.channel = usbdev.USBChannel(idProduct = 0x1234)
+
+    def tearDown(self):
+        usb.core.find = self._find
+
+    def test_open(self):
+        board = FakeDevice(1, 7, (1, 4))
+        self.bus.devices.append(board)
+        self.channel.open()
+
+        self.assertIs(board, self.channel.dev)
+        self.assertEqual(1, board.set_configuration_calls)
+        self.assertEqual((1, (1, 4)), self.channel.port_path)
+        self.assertEqual(0x81, self.channel.endpoint_in.bEndpointAddress)
+        self.assertEqual(0x01, self.channel.endpoint_out.bEndpointAddress)
+
+    def test_open_configured(self):
+        """ A device that is already configured is not configured again. """
+        board = FakeDevice(1, 7, (1, 4), configured = True)
+        self.bus.devices.append(board)
+        self.channel.open()
+        self.assertEqual(0, board.set_configuration_calls)
+
+    def test_open_errors(self):
+        self.assertRaises(IOError, self.channel.open)
+        self.bus.devices += [FakeDevice(1, 7, (1, 4)), FakeDevice(2, 3, (2,))]
+        self.assertRaises(IOError, self.channel.open)
+
+    def test_reopen_remembered_port(self):
+        """ reopen() looks on the remembered port first and skips the stale address. """
+        self.bus.devices.append(FakeDevice(1, 7, (1, 4)))
+        self.channel.open()
+
+        # The board re-enumerates at a new address; other boards are on the bus.
+        self.bus.devices = [FakeDevice(1, 8, (1, 4))] + [FakeDevice(2, i, (2, i)) for i in range(30)]
+        self.bus.examined = 0
+        self.assertTrue(self.channel.reopen(timeout = 1, reenumerated = True) < 1)
+        self.assertEqual((1, 8), self.channel.address)
+        self.assertEqual(1, self.bus.examined)
+
+    def test_reopen_waits_for_reenumeration(self):
+        board = FakeDevice(1, 7, (1, 4))
+        self.bus.devices.append(board)
+        self.channel.open()
+
+        # The old device has not dropped off the bus yet.
+        self.assertRaises(IOError, self.channel.reopen, timeout = 0.05, reenumerated = True)
+
+        self.bus.devices.remove(board)
+        self.bus.devices.append(FakeDevice(1, 9, (1, 4)))
+        self.channel.reopen(timeout = 1, reenumerated = True)
+        self.assertEqual((1, 9), self.channel.address)
+
+    def test_reopen_same_address(self):
+        """ Without a reset, the board is found again where it was. """
+        self.bus.devices.append(FakeDevice(1, 7, (1, 4)))
+        self.channel.open()
+
+        self.assertTrue(self.channel.reopen(timeout = 0.5) < 0.5)
+        self.assertEqual((1, 7), self.channel.address)
+
+class PortPathTests(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual((1, (4,)), usbdev.parse_port_path("1-4"))
+        self.assertEqual((3, (1, 4, 2)), usbdev.parse_port_path("3-1.4.2"))
+        for path in ("1", "1-", "x-1", "1-1.x", ""):
+            self.assertRaises(ValueError, usbdev.parse_port_path, path)
+
+    def test_format(self):
+        self.assertEqual("3-1.4.2", usbdev.format_port_path(3, (1, 4, 2)))
+
+class MultipleBoardTests(unittest.TestCase):
+    def setUp(self):
+        self.boards = [FakeDevice(2, 9, (1, 3)), FakeDevice(1, 7, (1, 4)), FakeDevice(1, 5, (1, 2))]
+        self.bus = FakeBus([FakeDevice(1, 2, (1,), idVendor = 0x0424)] + self.boards)
+        self._find = usb.core.find
+        usb.core.find = self.bus.find
+
+    def tearDown(self):
+        usb.core.find = self._find
+
+    def test_discover_devices(self):
+        devices = usbdev.discover_devices(idProduct = 0x1234)
+        self.assertEqual(["1-1.2", "1-1.4", "2-1.3"], [d.port_path for d in devices])
+        self.assertEqual(usbdev.USBDeviceInfo(usbdev.VID_FREESCALE, 0x1234, 1, 5, "1-1.2"),
+                         devices[0])
+
+    def test_ambiguous_without_path(self):
+        self.assertRaises(IOError, usbdev.USBChannel(idProduct = 0x1234).open)
+
+    def test_open_by_path(self):
+        for board in self.boards:
+            path = usbdev.format_port_path(board.bus, board.port_numbers)
+            channel = usbdev.USBChannel(idProduct = 0x1234, port_path = path)
+            channel.open()
+            self.assertIs(board, channel.dev)
+
+    def test_open_by_path_missing(self):
+        """ A channel pinned to a port never falls back to another board. """
+        channel = usbdev.USBChannel(idProduct = 0x1234, port_path = "1-1.5")
+        self.assertRaises(IOError, channel.open)
+
+    def test_invalid_path(self):
+        self.assertRaises(ValueError, usbdev.USBChannel, idProduct = 0x1234, port_path = "bogus")
+
+    def test_hotplug_match(self):
+        from pyatk.channel.hotplug import HotplugEvent
+
+        channel = usbdev.USBChannel(idProduct = 0x1234, port_path = "1-1.4")
+        self.assertTrue(channel._matches_arrival(HotplugEvent(usbdev.VID_FREESCALE, 0x1234, 1, 8, (1, 4))))
+        self.assertFalse(channel._matches_arrival(HotplugEvent(usbdev.VID_FREESCALE, 0x1234, 1, 8, (1, 2))))
+        # Sources that cannot tell the port wake every matching channel.
+        self.assertTrue(channel._matches_arrival(HotplugEvent(usbdev.VID_FREESCALE, 0x1234, 1, 8, None)))
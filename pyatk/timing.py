@@ -0,0 +1,71 @@
+# Copyright (c) 2012-2013 Harry Bock <bock.harryw@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Polling helpers for waiting on devices to become ready.
+"""
+import time
+
+#: Default first delay between attempts, in seconds.
+DEFAULT_INITIAL_DELAY = 0.01
+#: Default longest delay between attempts, in seconds.
+DEFAULT_MAX_DELAY = 0.5
+
+def backoff_delays(initial_delay = DEFAULT_INITIAL_DELAY,
+                   max_delay = DEFAULT_MAX_DELAY,
+                   factor = 2):
+    """
+    Generate an endless sequence of delays starting at ``initial_delay``
+    and growing by ``factor`` each time, up to ``max_delay``.
+    """
+    delay = initial_delay
+    while True:
+        yield delay
+        delay = min(delay * factor, max_delay)
+
+def retry(func, timeout,
+          exceptions = (IOError,),
+          initial_delay = DEFAULT_INITIAL_DELAY,
+          max_delay = DEFAULT_MAX_DELAY,
+          clock = time.time,
+          sleep = time.sleep):
+    """
+    Call ``func()`` until it returns without raising one of ``exceptions``,
+    sleeping with exponential backoff between attempts.  Return the tuple
+    ``(result, elapsed)``, with ``elapsed`` the time in seconds spent
+    waiting.
+
+    If ``func`` still fails ``timeout`` seconds after the first attempt,
+    the last exception is re-raised.
+    """
+    start = clock()
+    deadline = start + timeout
+    for delay in backoff_delays(initial_delay, max_delay):
+        try:
+            return func(), clock() - start
+        except exceptions:
+            remaining = deadline - clock()
+            if remaining <= 0:
+                raise
+
+        sleep(min(delay, remaining))
@@ -12,12 +12,22 @@ setup(
         'pyatk.channel',
         'pyatk.tests',
     ],
+    package_data={
+        'pyatk.tests': ['data/*'],
+    },
     test_suite='pyatk.tests',
+    python_requires='>=3.7',
     scripts=['bin/mx-toolkit.py'],
     install_requires=[
-        'pyserial >= 2.6',
-        'pyusb >= 1.0.0b1',
+        'pyserial >= 3.1',
+        'pyusb >= 1.0.0',
     ],
+    extras_require={
+        # Asynchronous USB transfer engine (USBChannel async_transfers)
+        'async': ['libusb1'],
+        # libusb hotplug events (Linux also works without it)
+        'hotplug': ['libusb1'],
+    },
 
     license='BSD',
     url='https://github.com/hbock/pyatk',